@@ -18,3 +18,251 @@ DEFAULT_OPENID_JWT_CONFIG = {
     # 默认jwt的过期时间
     'exp': 864000
 }
+
+# 默认限流配置
+DEFAULT_RATE_LIMIT_CONFIG = {
+    # 单客户端每秒补充令牌数
+    'client_rate': 10,
+    # 单客户端令牌桶容量
+    'client_burst': 20,
+    # 单来源IP每秒补充令牌数
+    'ip_rate': 50,
+    # 单来源IP令牌桶容量
+    'ip_burst': 100,
+    # 本地令牌桶最大数量
+    'maxsize': 100000,
+    # 共享限流后端,如: app.limiter:RedisBackend
+    'backend': None,
+    # 共享限流后端初始化参数
+    'backend_options': {}
+}
+
+# 默认不存在结果缓存配置
+DEFAULT_NEGATIVE_CACHE_CONFIG = {
+    # 最大缓存条目数
+    'maxsize': 10000,
+    # 不存在的client_id缓存秒数
+    'client_ttl': 30,
+    # 不存在的refresh_token缓存秒数
+    'refresh_token_ttl': 10
+}
+
+# 默认客户端密钥校验结果缓存配置
+DEFAULT_CLIENT_SECRET_CACHE_CONFIG = {
+    # 最大缓存条目数
+    'maxsize': 10000,
+    # 校验成功后缓存秒数
+    'ttl': 300,
+    # HMAC密钥,为空时每个进程随机生成
+    'secret_key': None
+}
+
+# 默认密码模式配置
+DEFAULT_PASSWORD_GRANT_CONFIG = {
+    # 自定义用户认证器,如: app.auth:LdapAuthenticator
+    'authenticator': None,
+    # 密码校验执行器类型,可选thread,process
+    'executor': 'thread',
+    # 密码校验最大并发数
+    'max_workers': 4,
+    # 密码校验最大排队数,超出后直接拒绝
+    'max_queue': 64,
+    # 单次密码校验超时秒数
+    'timeout': 5
+}
+
+# 默认访问令牌缓存配置
+DEFAULT_TOKEN_CACHE_CONFIG = {
+    # 最大缓存条目数
+    'maxsize': 10000,
+    # 最长缓存秒数,不会超过令牌剩余有效期
+    'ttl': 60
+}
+
+# 默认TTL存储配置
+DEFAULT_TTL_STORE_CONFIG = {
+    # 共享存储后端,如: app.store:RedisTTLStore
+    'backend': None,
+    # 共享存储后端初始化参数
+    'backend_options': {},
+    # 本地存储最大条目数
+    'maxsize': 100000
+}
+
+# 默认设备授权配置
+DEFAULT_DEVICE_CODE_CONFIG = {
+    # 用户输入user_code的页面地址
+    'verification_uri': None,
+    # device_code有效秒数
+    'expires_in': 1800,
+    # 客户端最小轮询间隔秒数
+    'interval': 5,
+    # 轮询时等待用户确认的最长秒数,0表示不等待
+    'poll_wait': 0
+}
+
+# 默认令牌交换配置
+DEFAULT_TOKEN_EXCHANGE_CONFIG = {
+    # 交换令牌缓存最大条目数
+    'maxsize': 10000,
+    # 剩余有效期低于该秒数时不再复用,重新签发
+    'leeway': 60
+}
+
+# 默认无状态授权码配置
+DEFAULT_STATELESS_CODE_CONFIG = {
+    # 加密密钥,必须配置,同时必须为ttl_store配置共享后端
+    'key': None,
+    # 授权码有效秒数
+    'ttl': 300
+}
+
+# 默认跨进程共享缓存配置
+DEFAULT_SHARED_CACHE_CONFIG = {
+    # 共享内存文件目录,同一主机的工作进程通过同名文件共享缓存
+    'directory': '/dev/shm',
+    # 共享内存文件名前缀,同一主机上的不同服务必须不同
+    'prefix': 'service_authlib',
+    # 每张表的槽位数
+    'slots': 16384,
+    # 每个槽位的字节数,序列化后超出的值不缓存
+    'slot_size': 512,
+    # 每个键最多探测的槽位数
+    'probes': 8,
+    # 检查共享文件是否被其它进程按新布局替换的间隔秒数
+    'check_interval': 1.0,
+    # 客户端缓存过期秒数
+    'client_ttl': 60
+}
+
+# 默认缓存失效总线配置
+DEFAULT_INVALIDATION_CONFIG = {
+    # 失效通道,database/local或实现InvalidationChannel的点路径
+    'backend': 'database',
+    # 失效通道初始化参数
+    'backend_options': {},
+    # 合并发布和拉取的间隔秒数
+    'interval': 1.0,
+    # 每批最多发布或拉取的事件数
+    'batch_size': 500,
+    # 数据库事件保留秒数
+    'retention': 3600,
+    # 数据库轮询时等待id空洞(晚提交的事务)的秒数
+    'gap_timeout': 30,
+    # 数据库轮询时最多跟踪的id空洞数
+    'max_gaps': 1000,
+    # 距上次成功拉取不超过多少秒时视为撤销状态是最新的,熔断降级时才允许使用缓存的令牌
+    'max_lag': 5.0
+}
+
+# 默认授权同意记录配置
+DEFAULT_CONSENT_CONFIG = {
+    # 同意记录有效秒数
+    'ttl': 2592000,
+    # 同意记录查询缓存最大条目数
+    'maxsize': 10000,
+    # 同意记录查询缓存过期秒数
+    'cache_ttl': 60
+}
+
+# 默认链路追踪配置
+DEFAULT_TRACING_CONFIG = {
+    # 链路导出器,None表示不导出,opentelemetry表示导出到OpenTelemetry,或实现SpanExporter的点路径
+    'exporter': None,
+    # 链路导出器初始化参数
+    'exporter_options': {},
+    # 慢请求阈值毫秒数,超过时记录各阶段耗时,None表示不记录
+    'slow_threshold': 500,
+    # 内存中保留的最近慢请求条数
+    'slow_maxlen': 100
+}
+
+# 默认采样分析配置
+DEFAULT_PROFILING_CONFIG = {
+    # 采样比例,键为端点(token, authorize)或授权类型,值N表示每N个请求分析1个,0表示不分析
+    'rates': {},
+    # 最多保留的不同调用栈数量
+    'max_stacks': 10000
+}
+
+# 默认存储熔断配置
+DEFAULT_CIRCUIT_BREAKER_CONFIG = {
+    # 连续失败多少次后熔断
+    'failure_threshold': 5,
+    # 熔断多少秒后放行一个探测请求
+    'reset_timeout': 30,
+    # 单次存储调用的最长秒数
+    'deadline': 2.0,
+    # 降级时可用的最近一次查询结果保留秒数
+    'stale_ttl': 3600,
+    # 降级缓存最大条目数
+    'maxsize': 10000
+}
+
+# 默认准入控制配置
+DEFAULT_ADMISSION_CONFIG = {
+    # 所有授权类型合计的最大并发数
+    'max_in_flight': 128,
+    # 每个授权类型(或authorize端点)的最大并发数,default为未单独配置时的并发数
+    'limits': {'default': 64},
+    # 优先级,数值越小越优先,default为未单独配置时的优先级
+    'priorities': {'refresh_token': 0, 'client_credentials': 0, 'default': 10},
+    # 最大排队数,排满后优先级更高的请求会挤掉优先级最低的排队请求
+    'max_queue': 256,
+    # 最长排队秒数,预计等待时间超过该值时立即拒绝
+    'queue_timeout': 1.0
+}
+
+# 默认客户端注册表快照配置
+DEFAULT_REGISTRY_SNAPSHOT_CONFIG = {
+    # 快照文件路径,多个工作进程可以共用同一个文件
+    'path': '/tmp/service_authlib-clients.snapshot',
+    # 后台写入快照的间隔秒数
+    'interval': 300,
+    # 超过该秒数的快照视为过期,启动时不载入
+    'max_age': 86400,
+    # 载入的客户端在内存中的有效秒数,过期后重新查询数据库
+    'ttl': 300,
+    # 最多保存的客户端数
+    'maxsize': 10000,
+    # 是否写入客户端密钥哈希,不写入时客户端首次使用需查询一次数据库
+    'include_secrets': False
+}
+
+# 默认审计配置
+DEFAULT_AUDIT_CONFIG = {
+    # 审计输出,database/jsonl或实现AuditSink的点路径
+    'sinks': ['database'],
+    # jsonl输出的文件路径
+    'path': '/var/log/service_authlib/audit.jsonl',
+    # 内存队列最大事件数
+    'maxsize': 10000,
+    # 队列满时的处理策略,drop_new丢弃新事件,drop_oldest丢弃最老事件,block阻塞最多block_timeout秒后丢弃新事件
+    'policy': 'drop_oldest',
+    # block策略的最长阻塞秒数
+    'block_timeout': 0.05,
+    # 每批最多写入的事件数
+    'batch_size': 500,
+    # 后台写入的间隔秒数
+    'interval': 1.0
+}
+
+# 默认推送授权请求配置
+DEFAULT_PUSHED_AUTHORIZATION_CONFIG = {
+    # request_uri有效秒数
+    'expires_in': 60,
+    # 是否要求所有授权请求都通过request_uri传递
+    'require': False,
+    # 推送端点允许的客户端认证方式,公开客户端需显式加入none
+    'auth_methods': ['client_secret_basic', 'client_secret_post']
+}
+
+# 默认客户端令牌策略配置
+DEFAULT_TOKEN_POLICY_CONFIG = {
+    # 按client_id覆盖client_metadata中的token_policy
+    'clients': {},
+    # 策略缓存最大条目数
+    'maxsize': 10000,
+    # 策略缓存过期秒数
+    'ttl': 300
+}
@@ -4,5 +4,24 @@
 
 from __future__ import annotations
 
-from .oauth2 import OAuth2
-from .openid import OpenID
+import typing as t
+
+from importlib import import_module
+
+# 依赖类名称 => 所在模块,首次访问时才导入,只使用OAuth2时不会导入OpenID相关模块
+__lazy_dependencies__ = {'OAuth2': '.oauth2', 'OpenID': '.openid'}
+
+__all__ = list(__lazy_dependencies__)
+
+
+def __getattr__(name: t.Text) -> t.Any:
+    """ 延迟导入依赖类
+
+    @param name: 依赖类名称
+    @return: t.Any
+    """
+    if name not in __lazy_dependencies__:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(__lazy_dependencies__[name], __name__), name)
+    globals()[name] = value
+    return value
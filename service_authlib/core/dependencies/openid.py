@@ -8,16 +8,10 @@ import typing as t
 
 from service_authlib.constants import AUTHLIB_CONFIG_KEY
 from service_core.core.service.dependency import Dependency
+from service_core.core.as_loader import load_dot_path_colon_obj
 from service_authlib.core.server.common.models import OAuth2TokenModel
 from service_authlib.core.server.common.models import OAuth2ClientModel
 from service_authlib.core.server.common import OAuth2AuthorizationServer
-from service_authlib.core.server.openid.grants.hybrid import HybridGrant
-from service_authlib.core.server.common.grants.password import PasswordGrant
-from service_authlib.core.server.openid.grants.implicit import ImplicitGrant
-from service_authlib.core.server.openid.extend.openid_code import OpenIDCode
-from service_authlib.core.server.common.grants.refresh_token import RefreshTokenGrant
-from service_authlib.core.server.common.grants.client_credentials import ClientCredentialsGrant
-from service_authlib.core.server.openid.grants.authorization_code import AuthorizationCodeGrant
 
 
 class OpenID(Dependency):
@@ -25,6 +19,28 @@ class OpenID(Dependency):
 
     name = 'OpenID'
 
+    # 授权类名称 => 授权类点路径,按注册顺序排列
+    grants = {
+        'hybrid': 'service_authlib.core.server.openid.grants.hybrid:HybridGrant',
+        'password': 'service_authlib.core.server.common.grants.password:PasswordGrant',
+        'implicit': 'service_authlib.core.server.openid.grants.implicit:ImplicitGrant',
+        'refresh_token': 'service_authlib.core.server.common.grants.refresh_token:RefreshTokenGrant',
+        'client_credentials': 'service_authlib.core.server.common.grants.client_credentials:ClientCredentialsGrant',
+        'token_exchange': 'service_authlib.core.server.common.grants.token_exchange:TokenExchangeGrant',
+        'device_code': 'service_authlib.core.server.common.grants.device_code:DeviceCodeGrant',
+        'authorization_code': 'service_authlib.core.server.openid.grants.authorization_code:AuthorizationCodeGrant'
+    }
+    # 默认关闭,需要在provider_options的grants中显式开启的授权类
+    explicit_grants = ('password',)
+    # 设备授权端点点路径
+    device_authorization_endpoint = (
+        'service_authlib.core.server.common.endpoints.device_authorization:DeviceAuthorizationEndpoint'
+    )
+    # 推送授权请求端点点路径
+    pushed_authorization_endpoint = (
+        'service_authlib.core.server.common.endpoints.pushed_authorization:PushedAuthorizationEndpoint'
+    )
+
     def __init__(
             self,
             alias: t.Text,
@@ -60,30 +76,76 @@ class OpenID(Dependency):
         self.server = OAuth2AuthorizationServer(
             self.container.service, token_model=OAuth2TokenModel, client_model=OAuth2ClientModel, **provider_options
         )
-        self.server.register_grant(
-            HybridGrant,
-            extensions=None
-        )
-        # self.server.register_grant(
-        #     PasswordGrant,
-        #     extensions=None
-        # )
-        self.server.register_grant(
-            ImplicitGrant,
-            extensions=None
-        )
-        self.server.register_grant(
-            RefreshTokenGrant,
-            extensions=None
-        )
-        self.server.register_grant(
-            ClientCredentialsGrant,
-            extensions=None
-        )
-        self.server.register_grant(
-            AuthorizationCodeGrant,
-            extensions=[OpenIDCode(require_nonce=True)]
-        )
+        # 静态配置的客户端常驻内存,优先于数据库查询
+        clients = self.container.config.get(f'{AUTHLIB_CONFIG_KEY}.{self.alias}.openid.clients', default=[])
+        self.server.load_static_clients(clients or [])
+        # 检查授权流程依赖的列,缺失时拒绝启动
+        if self.server.config.get('check_schema', True):
+            self.server.check_schema()
+        # 检查授权流程依赖的索引,缺失时仅告警
+        if self.server.config.get('check_indexes', True):
+            self.server.check_indexes()
+        # 只导入并注册开启的授权类,provider_options中grants未配置时开启除explicit_grants之外的全部授权类
+        enabled = self.server.config.get('grants', None) or [
+            name for name in self.grants if name not in self.explicit_grants
+        ]
+        for grant_name, path in self.grants.items():
+            if grant_name not in enabled:
+                continue
+            # 配置了设备授权才开启设备授权端点
+            if grant_name == 'device_code' and not self.server.config.get('device_code', None):
+                continue
+            # 配置了令牌交换才开启令牌交换授权
+            if grant_name == 'token_exchange' and not self.server.config.get('token_exchange', None):
+                continue
+            self.server.register_grant(
+                load_dot_path_colon_obj(path)[-1],
+                extensions=self.create_grant_extensions(grant_name)
+            )
+            if grant_name == 'device_code':
+                self.server.register_endpoint(load_dot_path_colon_obj(self.device_authorization_endpoint)[-1])
+        # 配置了推送授权请求才开启推送授权请求端点
+        if self.server.config.get('pushed_authorization', None):
+            self.server.register_endpoint(load_dot_path_colon_obj(self.pushed_authorization_endpoint)[-1])
+        # 载入客户端注册表快照,新启动的工作进程无需等待缓存预热
+        self.server.load_registry_snapshot()
+
+    def create_grant_extensions(self, grant_name: t.Text) -> t.Optional[t.List[t.Any]]:
+        """ 创建授权类扩展
+
+        @param grant_name: 授权类名称
+        @return: t.Optional[t.List[t.Any]]
+        """
+        if grant_name != 'authorization_code':
+            return None
+        from service_authlib.core.server.openid.extend.openid_code import OpenIDCode
+        return [OpenIDCode(require_nonce=True)]
+
+    def start(self) -> None:
+        """ 生命周期 - 启动阶段
+
+        @return: None
+        """
+        if self.server.invalidation_bus is not None:
+            self.server.invalidation_bus.start()
+        if self.server.registry_snapshot is not None:
+            self.server.registry_snapshot.start()
+        if self.server.audit_logger is not None:
+            self.server.audit_logger.start()
+
+    def stop(self) -> None:
+        """ 生命周期 - 停止阶段
+
+        @return: None
+        """
+        if self.server.invalidation_bus is not None:
+            self.server.invalidation_bus.stop()
+        if self.server.registry_snapshot is not None:
+            self.server.registry_snapshot.stop()
+        if self.server.audit_logger is not None:
+            self.server.audit_logger.stop()
+        # 模型是全局对象,移除监听以免停止后的服务实例无法回收
+        self.server.remove_listeners()
 
     def get_instance(self) -> OAuth2AuthorizationServer:
         """ 获取注入对象
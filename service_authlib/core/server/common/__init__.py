@@ -4,27 +4,74 @@
 
 from __future__ import annotations
 
+import time
+import json
 import typing as t
+import sqlalchemy as sa
 
 from http import HTTPStatus
+from logging import getLogger
 from authlib.oauth2 import HttpRequest
+from authlib.oauth2 import OAuth2Error
 from authlib.oauth2 import OAuth2Request
 from service_core.core.service import Service
 from authlib.oauth2 import AuthorizationServer
 from authlib.oauth2.rfc6750 import BearerToken
 from authlib.common.encoding import to_unicode
 from authlib.common.encoding import json_dumps
+from authlib.oauth2 import ClientAuthentication
 from authlib.common.security import generate_token
 from service_webserver.core.request import Request
 from service_webserver.core.response import Response
+from authlib.oauth2.rfc6749 import InvalidClientError
+from authlib.oauth2.rfc6749 import InvalidRequestError
 from authlib.oauth2.rfc6749.grants.base import BaseGrant
 from service_sqlalchemy.core.shortcuts import safe_transaction
 from authlib.oauth2.rfc8414 import AuthorizationServerMetadata
 from service_core.core.as_loader import load_dot_path_colon_obj
+from service_authlib.constants import DEFAULT_TOKEN_CACHE_CONFIG
+from service_authlib.constants import DEFAULT_DEVICE_CODE_CONFIG
+from service_authlib.constants import DEFAULT_SHARED_CACHE_CONFIG
+from service_authlib.constants import DEFAULT_TOKEN_EXCHANGE_CONFIG
+from service_authlib.constants import DEFAULT_PUSHED_AUTHORIZATION_CONFIG
 
+from .migrations import get_bind
+from .transfer import export_lines
+from .transfer import import_lines
+from .extend.cache import TTLCache
+from .extend.store import TTLStore
+from .extend.tracing import Tracer
 from .models import OAuth2UserModel
+from .models.base import make_digest
 from .models import OAuth2TokenModel
+from .migrations import check_columns
+from .extend.audit import AuditLogger
+from .migrations import check_indexes
 from .models import OAuth2ClientModel
+from .extend.tracing import NoopTracer
+from .extend.cache import NegativeCache
+from .repository import OAuth2Repository
+from .extend.cache import make_cache_key
+from .extend.consent import ConsentStore
+from .models.snapshot import TokenSnapshot
+from .extend.expiry import evaluate_expiry
+from .extend.store import create_ttl_store
+from .extend.rate_limit import RateLimiter
+from .extend.events import InvalidationBus
+from .extend.breaker import CircuitBreaker
+from .extend.codec import StatelessCodeCodec
+from .extend.shared import SharedMemoryCache
+from .extend.profiler import SamplingProfiler
+from .extend.policy import TokenPolicyResolver
+from .errors import TemporarilyUnavailableError
+from .extend.warmup import ClientRegistrySnapshot
+from .extend.admission import AdmissionController
+from .extend.registry import StaticClientRegistry
+from .extend.password import PasswordAuthenticator
+from .extend.credential import VerifiedCredentialCache
+from .endpoints.pushed_authorization import REQUEST_URI_PREFIX
+
+logger = getLogger(__name__)
 
 # 泛型类型 - create_oauth_request
 T = t.TypeVar('T')
@@ -62,6 +109,7 @@ class OAuth2AuthorizationServer(AuthorizationServer):
         @param config: 其它配置项
         """
         self.config = config
+        self.listeners = []
         self.token_model = token_model
         self.client_model = client_model
         metadata = config.get('metadata', {})
@@ -69,13 +117,53 @@ class OAuth2AuthorizationServer(AuthorizationServer):
             metadata = self.metadata_class(metadata)
             metadata.validate()
         self.service = service
-        token_generator = config.get(
-            'generate_token', self.create_bearer_token_generator()
+        self.tracer = self.create_tracer()
+        self.profiler = self.create_profiler()
+        self.breaker = self.create_circuit_breaker()
+        self.admission = self.create_admission_controller()
+        self.static_clients = StaticClientRegistry()
+        self.repository = OAuth2Repository(self, token_model=token_model, client_model=client_model)
+        self.rate_limiter = self.create_rate_limiter()
+        self.negative_cache = self.create_negative_cache()
+        self.token_cache = self.create_token_cache()
+        self.client_cache = self.create_client_cache()
+        self.registry_snapshot = self.create_registry_snapshot()
+        self.ttl_store = self.create_ttl_store()
+        self.code_codec = self.create_code_codec()
+        self.device_code_config = DEFAULT_DEVICE_CODE_CONFIG | (config.get('device_code', None) or {})
+        self.device_clients = self.create_device_client_cache()
+        self.device_client_auth = None if self.device_clients is None else ClientAuthentication(self.get_device_client)
+        token_exchange_conf = config.get('token_exchange', None)
+        self.token_exchange_config = DEFAULT_TOKEN_EXCHANGE_CONFIG | (
+                token_exchange_conf if isinstance(token_exchange_conf, dict) else {}
+        )
+        self.exchange_cache = TTLCache(maxsize=self.token_exchange_config['maxsize'])
+        self.pushed_authorization_config = DEFAULT_PUSHED_AUTHORIZATION_CONFIG | (
+                config.get('pushed_authorization', None) or {}
         )
+        self.credential_cache = self.create_credential_cache()
+        self.password_authenticator = self.create_password_authenticator()
+        self.consent_store = self.create_consent_store()
+        self.invalidation_bus = self.create_invalidation_bus()
+        self.audit_logger = self.create_audit_logger()
+        self.token_policy = TokenPolicyResolver(config.get('token_policy', None) or {})
+        # 客户端更新或删除后失效令牌策略
+        self.listen(self.client_model, 'after_update', self.on_policy_client_changed)
+        self.listen(self.client_model, 'after_delete', self.on_policy_client_changed)
+        token_generator = self.create_policy_token_generator(config.get(
+            'generate_token', self.create_bearer_token_generator()
+        ))
         super(OAuth2AuthorizationServer, self).__init__(
             self.get_oauth2_client, self.save_oauth2_token,
             generate_token=token_generator, metadata=metadata
         )
+        if self.credential_cache is not None:
+            self.register_client_auth_method(
+                'client_secret_basic', self.credential_cache.authenticate_client_secret_basic
+            )
+            self.register_client_auth_method(
+                'client_secret_post', self.credential_cache.authenticate_client_secret_post
+            )
 
     def get_oauth2_client(self, client_id: t.Text) -> OAuth2ClientModel:
         """ 获取客户端对象
@@ -83,12 +171,46 @@ class OAuth2AuthorizationServer(AuthorizationServer):
         @param client_id: 客户端对象id
         @return: OAuth2ClientModel
         """
-        with safe_transaction(self.service.orm, commit=False) as session:
-            return session.query(
-                self.client_model
-            ).filter(
-                self.client_model.client_id == client_id
-            ).first()
+        client = self.static_clients.get(client_id)
+        if client is not None:
+            return client
+        key = make_cache_key('client', client_id)
+        client = None if self.client_cache is None else self.client_cache.get(key, None)
+        if client is not None:
+            return client
+        client = None if self.registry_snapshot is None else self.registry_snapshot.get(client_id)
+        if client is not None:
+            return client
+        if self.negative_cache is not None and self.negative_cache.contains('client', client_id):
+            return None
+        try:
+            client = self.repository.get_client(client_id)
+        except TemporarilyUnavailableError:
+            # 降级: 使用最近一次查询到的客户端
+            client = self.breaker.recall(key)
+            if client is None:
+                raise
+            return client
+        self.breaker.remember(key, client)
+        if not client and self.negative_cache is not None:
+            self.negative_cache.add('client', client_id)
+        if client and self.client_cache is not None:
+            self.client_cache.set(key, client)
+        if client and self.rate_limiter is not None:
+            self.rate_limiter.update_client_limit(client)
+        return client
+
+    def load_static_clients(self, clients: t.Optional[t.List[t.Dict[t.Text, t.Any]]] = None) -> int:
+        """ 载入静态配置的客户端
+
+        @param clients: 客户端配置列表
+        @return: int 载入的客户端数
+        """
+        count = self.static_clients.load(clients)
+        if self.rate_limiter is not None:
+            for client in self.static_clients.clients.values():
+                self.rate_limiter.update_client_limit(client)
+        return count
 
     def save_oauth2_token(self, token: t.Dict[t.Text, t.Any], request: OAuth2Request) -> OAuth2TokenModel:
         """ 创建一个令牌对象
@@ -97,17 +219,22 @@ class OAuth2AuthorizationServer(AuthorizationServer):
         @param request: 请求对象
         @return: OAuth2TokenModel
         """
-        with safe_transaction(self.service.orm, commit=True) as session:
-            client = request.client
-            if request.user:
-                user_id = request.user.id
-            else:
-                user_id = client.user_id
-            token = self.token_model(
-                client_id=client.client_id,
-                user_id=user_id, **token
-            )
-            session.add(token)
+        with self.tracer.span('db.save_token'), self.breaker.guard():
+            with safe_transaction(self.service.orm, commit=True) as session:
+                client = request.client
+                if request.user:
+                    user_id = request.user.id
+                else:
+                    user_id = client.user_id
+                token = self.token_model(
+                    client_id=client.client_id,
+                    user_id=user_id, **token
+                )
+                session.add(token)
+        self.emit_audit(
+            'token_issued', client_id=client.client_id, user_id=user_id, grant_type=request.grant_type,
+            scope=token.scope, subject=make_digest(token.access_token)
+        )
         return token
 
     @staticmethod
@@ -128,7 +255,10 @@ class OAuth2AuthorizationServer(AuthorizationServer):
             url = f'{request.base_url}?{to_unicode(request.query_string)}'
         else:
             url = request.base_url
-        return request_cls(request.method, url, body=body, headers=request.headers)
+        instance = request_cls(request.method, url, body=body, headers=request.headers)
+        # 限流等组件需要来源IP
+        instance.remote_addr = request.remote_addr
+        return instance
 
     def create_oauth2_request(self, request: Request) -> OAuth2Request:
         """ 封为OAuth2Request
@@ -136,7 +266,8 @@ class OAuth2AuthorizationServer(AuthorizationServer):
         @param request: 原始请求对象
         @return: OAuth2Request
         """
-        return self.create_request(request, OAuth2Request, use_json=False)
+        with self.tracer.span('create_request'):
+            return self.create_request(request, OAuth2Request, use_json=False)
 
     def create_json_request(self, request: Request) -> HttpRequest:
         """ 封为HttpRequest
@@ -144,7 +275,8 @@ class OAuth2AuthorizationServer(AuthorizationServer):
         @param request: 原始请求对象
         @return: HttpRequest
         """
-        return self.create_request(request, HttpRequest, use_json=True)
+        with self.tracer.span('create_request'):
+            return self.create_request(request, HttpRequest, use_json=True)
 
     def handle_response(self, status: HTTPStatus, body: HttpResponse, headers: HttpHeaders) -> Response:
         """ 处理并构造响应对象
@@ -154,8 +286,9 @@ class OAuth2AuthorizationServer(AuthorizationServer):
         @param headers: 响应头
         @return: t.Tuple[HttpResponse, HTTPStatus, HttpHeaders]
         """
-        body = json_dumps(body) if isinstance(body, dict) else body
-        return Response(response=body, status=status, headers=dict(headers))
+        with self.tracer.span('handle_response'):
+            body = json_dumps(body) if isinstance(body, dict) else body
+            return Response(response=body, status=status, headers=dict(headers))
 
     @staticmethod
     def create_token_generator(
@@ -266,6 +399,944 @@ class OAuth2AuthorizationServer(AuthorizationServer):
             expires_generator=token_expires_in_generator,
         )
 
+    def create_policy_token_generator(self, generator: t.Callable) -> t.Callable:
+        """ 按客户端令牌策略包装令牌生成器
+
+        授权类未指定expires_in时使用策略中的有效秒数,策略关闭刷新令牌时不签发刷新令牌
+
+        @param generator: 令牌生成器
+        @return: t.Callable
+        """
+
+        def generate_token(
+                client: OAuth2ClientModel,
+                grant_type: t.Text,
+                user: t.Optional[OAuth2UserModel] = None,
+                scope: t.Optional[t.Text] = None,
+                expires_in: t.Optional[int] = None,
+                include_refresh_token: t.Optional[bool] = True
+        ) -> t.Dict[t.Text, t.Any]:
+            """ 按客户端令牌策略生成令牌
+
+            @param client: 客户端模型对象
+            @param grant_type: 授权类型
+            @param user: 用户模型对象
+            @param scope: 授权范围
+            @param expires_in: 过期时间
+            @param include_refresh_token: 包含刷新令牌? 默认包含
+            @return: t.Dict[t.Text, t.Any]
+            """
+            policy = self.token_policy.resolve(client)
+            if expires_in is None:
+                expires_in = policy.get_expires_in(grant_type)
+            return generator(
+                client, grant_type, user=user, scope=scope, expires_in=expires_in,
+                include_refresh_token=policy.include_refresh_token(include_refresh_token)
+            )
+
+        return generate_token
+
+    def listen(self, target: t.Any, identifier: t.Text, fn: t.Callable[..., t.Any]) -> None:
+        """ 注册模型事件监听并记录,模型是全局对象,停止时需要移除
+
+        @param target: 模型
+        @param identifier: 事件名称
+        @param fn: 监听函数
+        @return: None
+        """
+        sa.event.listen(target, identifier, fn)
+        self.listeners.append((target, identifier, fn))
+
+    def remove_listeners(self) -> None:
+        """ 移除注册过的模型事件监听
+
+        @return: None
+        """
+        while self.listeners:
+            target, identifier, fn = self.listeners.pop()
+            if sa.event.contains(target, identifier, fn):
+                sa.event.remove(target, identifier, fn)
+
+    def on_policy_client_changed(self, mapper: t.Any, connection: t.Any, target: OAuth2ClientModel) -> None:
+        """ 客户端更新或删除后回调
+
+        @param mapper: 映射对象
+        @param connection: 连接对象
+        @param target: 客户端对象
+        @return: None
+        """
+        self.token_policy.discard(target.client_id)
+
+    def create_rate_limiter(self) -> t.Optional[RateLimiter]:
+        """ 创建令牌端点限流器
+
+        {
+            'client_rate': 10,
+            'client_burst': 20,
+            'ip_rate': 50,
+            'ip_burst': 100
+        }
+
+        @return: t.Optional[RateLimiter]
+        """
+        conf = self.config.get('rate_limit', None)
+        if not conf:
+            return None
+        return RateLimiter(conf if isinstance(conf, dict) else {})
+
+    def create_negative_cache(self) -> t.Optional[NegativeCache]:
+        """ 创建不存在结果缓存
+
+        {
+            'maxsize': 10000,
+            'client_ttl': 30,
+            'refresh_token_ttl': 10
+        }
+
+        @return: t.Optional[NegativeCache]
+        """
+        conf = self.config.get('negative_cache', None)
+        if not conf:
+            return None
+        # 客户端或令牌被创建后立即失效对应的不存在记录
+        self.listen(self.client_model, 'after_insert', self.on_client_inserted)
+        self.listen(self.token_model, 'after_insert', self.on_token_inserted)
+        return NegativeCache(conf if isinstance(conf, dict) else {})
+
+    def on_client_inserted(self, mapper: t.Any, connection: t.Any, target: OAuth2ClientModel) -> None:
+        """ 客户端创建后回调
+
+        @param mapper: 映射对象
+        @param connection: 连接对象
+        @param target: 客户端对象
+        @return: None
+        """
+        self.negative_cache.discard('client', target.client_id)
+
+    def on_token_inserted(self, mapper: t.Any, connection: t.Any, target: OAuth2TokenModel) -> None:
+        """ 令牌创建后回调
+
+        @param mapper: 映射对象
+        @param connection: 连接对象
+        @param target: 令牌对象
+        @return: None
+        """
+        if target.refresh_token:
+            self.negative_cache.discard('refresh_token', target.refresh_token)
+
+    def create_credential_cache(self) -> t.Optional[VerifiedCredentialCache]:
+        """ 创建客户端密钥校验结果缓存
+
+        {
+            'maxsize': 10000,
+            'ttl': 300,
+            'secret_key': None
+        }
+
+        @return: t.Optional[VerifiedCredentialCache]
+        """
+        conf = self.config.get('client_secret_cache', None)
+        if not conf:
+            return None
+        # 客户端更新(如密钥轮换)后立即失效对应的校验结果
+        self.listen(self.client_model, 'after_update', self.on_client_updated)
+        return VerifiedCredentialCache(conf if isinstance(conf, dict) else {})
+
+    def on_client_updated(self, mapper: t.Any, connection: t.Any, target: OAuth2ClientModel) -> None:
+        """ 客户端更新后回调
+
+        @param mapper: 映射对象
+        @param connection: 连接对象
+        @param target: 客户端对象
+        @return: None
+        """
+        self.credential_cache.discard_client(target.client_id)
+
+    def create_password_authenticator(self) -> PasswordAuthenticator:
+        """ 创建密码模式用户认证器
+
+        {
+            'authenticator': None,
+            'executor': 'thread',
+            'max_workers': 4,
+            'max_queue': 64,
+            'timeout': 5
+        }
+
+        @return: PasswordAuthenticator
+        """
+        conf = self.config.get('password_grant', None) or {}
+        authenticator = conf.get('authenticator', None)
+        if isinstance(authenticator, str):
+            authenticator = load_dot_path_colon_obj(authenticator)[-1]
+        return (authenticator or PasswordAuthenticator)(self, conf)
+
+    def check_schema(self) -> None:
+        """ 检查授权流程依赖的列,缺失时拒绝启动
+
+        未执行迁移的库缺少摘要列,刷新令牌和nonce查询会报错或查不到,令牌写入也会失败
+
+        @return: None
+        """
+        try:
+            bind = get_bind(self.service.ORM)
+            missing = [] if bind is None else check_columns(bind)
+        except Exception as e:
+            logger.warning(f'skip oauth2 schema check, errs={e}')
+            return
+        if missing:
+            columns = ', '.join(f'{table}.{column}' for table, column in missing)
+            raise RuntimeError(
+                f'missing columns {columns}, please run service_authlib.core.server.common.migrations.upgrade'
+            )
+
+    def check_indexes(self) -> t.List[t.Tuple[t.Text, t.Text]]:
+        """ 检查授权流程依赖的索引,缺失时告警
+
+        @return: t.List[t.Tuple[t.Text, t.Text]]
+        """
+        try:
+            bind = get_bind(self.service.ORM)
+            return [] if bind is None else check_indexes(bind)
+        except Exception as e:
+            logger.warning(f'skip oauth2 index check, errs={e}')
+            return []
+
+    def export_records(
+            self,
+            name: t.Text,
+            fp: t.TextIO,
+            batch_size: int = 1000,
+            progress: t.Optional[t.Callable[[t.Text, int], None]] = None
+    ) -> int:
+        """ 流式导出令牌/客户端/授权码
+
+        @param name: client/token/code
+        @param fp: 文本输出流
+        @param batch_size: 每批拉取的行数
+        @param progress: 进度回调
+        @return: int 导出的行数
+        """
+        return export_lines(get_bind(self.service.ORM), name, fp, batch_size=batch_size, progress=progress)
+
+    def import_records(
+            self,
+            fp: t.TextIO,
+            batch_size: int = 1000,
+            progress: t.Optional[t.Callable[[t.Text, int], None]] = None,
+            keep_ids: bool = False
+    ) -> int:
+        """ 批量导入令牌/客户端/授权码
+
+        @param fp: 文本输入流
+        @param batch_size: 每批插入的行数
+        @param progress: 进度回调
+        @param keep_ids: 是否保留原id
+        @return: int 导入的行数
+        """
+        return import_lines(
+            get_bind(self.service.ORM), fp, batch_size=batch_size, progress=progress, keep_ids=keep_ids
+        )
+
+    def create_token_cache(self) -> t.Optional[t.Union[TTLCache, SharedMemoryCache]]:
+        """ 创建访问令牌缓存,配置了shared_cache时所有工作进程共享同一份缓存
+
+        {
+            'maxsize': 10000,
+            'ttl': 60
+        }
+
+        @return: t.Optional[t.Union[TTLCache, SharedMemoryCache]]
+        """
+        conf = self.config.get('token_cache', None)
+        if not conf:
+            return None
+        conf = DEFAULT_TOKEN_CACHE_CONFIG | (conf if isinstance(conf, dict) else {})
+        shared_conf = self.config.get('shared_cache', None)
+        if shared_conf:
+            return SharedMemoryCache('token', shared_conf if isinstance(shared_conf, dict) else {}, ttl=conf['ttl'])
+        return TTLCache(maxsize=conf['maxsize'], ttl=conf['ttl'])
+
+    def create_client_cache(self) -> t.Optional[SharedMemoryCache]:
+        """ 创建跨进程共享的客户端缓存
+
+        {
+            'directory': '/dev/shm',
+            'prefix': 'service_authlib',
+            'slots': 16384,
+            'slot_size': 512,
+            'probes': 8,
+            'check_interval': 1.0,
+            'client_ttl': 60
+        }
+
+        @return: t.Optional[SharedMemoryCache]
+        """
+        conf = self.config.get('shared_cache', None)
+        if not conf:
+            return None
+        conf = DEFAULT_SHARED_CACHE_CONFIG | (conf if isinstance(conf, dict) else {})
+        # 客户端更新或删除后立即失效所有工作进程中的缓存
+        self.listen(self.client_model, 'after_update', self.on_client_changed)
+        self.listen(self.client_model, 'after_delete', self.on_client_changed)
+        return SharedMemoryCache('client', conf, ttl=conf['client_ttl'])
+
+    def create_registry_snapshot(self) -> t.Optional[ClientRegistrySnapshot]:
+        """ 创建客户端注册表快照
+
+        {
+            'path': '/tmp/service_authlib-clients.snapshot',
+            'interval': 300,
+            'max_age': 86400,
+            'ttl': 300,
+            'maxsize': 10000,
+            'include_secrets': False
+        }
+
+        @return: t.Optional[ClientRegistrySnapshot]
+        """
+        conf = self.config.get('registry_snapshot', None)
+        if not conf:
+            return None
+        self.listen(self.client_model, 'after_update', self.on_snapshot_client_changed)
+        self.listen(self.client_model, 'after_delete', self.on_snapshot_client_changed)
+        return ClientRegistrySnapshot(self, conf if isinstance(conf, dict) else {})
+
+    def load_registry_snapshot(self) -> int:
+        """ 载入客户端注册表快照,预热客户端查询
+
+        @return: int 载入的客户端数
+        """
+        if self.registry_snapshot is None:
+            return 0
+        return self.registry_snapshot.load()
+
+    def on_snapshot_client_changed(self, mapper: t.Any, connection: t.Any, target: OAuth2ClientModel) -> None:
+        """ 客户端更新或删除后回调
+
+        @param mapper: 映射对象
+        @param connection: 连接对象
+        @param target: 客户端对象
+        @return: None
+        """
+        self.registry_snapshot.discard(target.client_id)
+
+    def on_client_changed(self, mapper: t.Any, connection: t.Any, target: OAuth2ClientModel) -> None:
+        """ 客户端更新或删除后回调
+
+        @param mapper: 映射对象
+        @param connection: 连接对象
+        @param target: 客户端对象
+        @return: None
+        """
+        self.client_cache.delete(make_cache_key('client', target.client_id))
+
+    def query_token(self, access_token: t.Text) -> t.Optional[OAuth2TokenModel]:
+        """ 查询访问令牌对象,供资源服务校验令牌
+
+        @param access_token: 访问令牌
+        @return: t.Optional[OAuth2TokenModel]
+        """
+        key = make_cache_key('access_token', access_token)
+        if self.token_cache is not None:
+            token = self.token_cache.get(key, None)
+            if token is not None:
+                return token
+        try:
+            token = self.repository.get_token(access_token)
+        except TemporarilyUnavailableError:
+            # 降级: 只有撤销状态是最新的(失效总线最近同步成功)时才使用最近一次查询到的令牌,调用方仍需检查过期和撤销
+            token = self.breaker.recall(key) if self.is_revocation_current() else None
+            if token is None:
+                raise
+            return token
+        self.breaker.remember(key, token)
+        if token is not None and self.token_cache is not None:
+            ttl = min(self.token_cache.ttl, token.get_expires_at() - time.time())
+            if ttl > 0:
+                self.token_cache.set(key, token, ttl=ttl)
+        return token
+
+    def is_revocation_current(self) -> bool:
+        """ 本节点的令牌撤销状态是否是最新的
+
+        其它节点的撤销只能通过失效总线获知,没有失效总线或最近没有同步成功时视为未知
+
+        @return: bool
+        """
+        return self.invalidation_bus is not None and self.invalidation_bus.is_current()
+
+    def validate_tokens(self, access_tokens: t.Sequence[t.Text], now: t.Optional[float] = None) -> bytes:
+        """ 批量校验访问令牌,供网关或批处理任务一次校验大量令牌
+
+        @param access_tokens: 访问令牌列表
+        @param now: 当前时间,默认time.time()
+        @return: bytes 与access_tokens顺序一致的状态掩码,见extend.expiry中的TOKEN_*状态位
+        """
+        issued_at, expires_in, revoked = self.repository.get_token_columns(access_tokens)
+        return evaluate_expiry(issued_at, expires_in, revoked, now=now)
+
+    def invalidate_token(self, access_token: t.Text) -> None:
+        """ 失效访问令牌缓存
+
+        @param access_token: 访问令牌
+        @return: None
+        """
+        key = make_cache_key('access_token', access_token).hex()
+        self.apply_invalidation('token', key)
+        self.broadcast_invalidation('token', key)
+
+    def revoke_tokens(
+            self,
+            user_id: t.Optional[t.Any] = None,
+            client_id: t.Optional[t.Text] = None
+    ) -> t.Dict[t.Text, int]:
+        """ 批量撤销令牌
+
+        撤销用户,客户端或(用户, 客户端)的全部令牌并删除全部未兑换的授权码,同时失效进程内令牌缓存
+
+        @param user_id: 用户id
+        @param client_id: 客户端id
+        @return: t.Dict[t.Text, int]
+        """
+        if user_id is None and client_id is None:
+            raise ValueError('revoke_tokens requires user_id or client_id')
+        tokens, codes = self.repository.revoke(user_id=user_id, client_id=client_id)
+        cached = self.evict_tokens(user_id=user_id, client_id=client_id)
+        self.broadcast_invalidation('revoke', json.dumps([user_id, client_id]))
+        logger.info(f'revoke tokens with user_id={user_id}, client_id={client_id}, tokens={tokens}, codes={codes}')
+        self.emit_audit(
+            'tokens_revoked', client_id=client_id, user_id=user_id, detail={'tokens': tokens, 'codes': codes}
+        )
+        return {'tokens': tokens, 'codes': codes, 'cached': cached}
+
+    def evict_tokens(self, user_id: t.Optional[t.Any] = None, client_id: t.Optional[t.Text] = None) -> int:
+        """ 失效用户,客户端或(用户, 客户端)的令牌缓存
+
+        @param user_id: 用户id
+        @param client_id: 客户端id
+        @return: int 失效的缓存条目数
+        """
+        cached = 0
+        if self.token_cache is not None:
+            cached = self.token_cache.evict(
+                lambda o: (user_id is None or o.user_id == user_id) and (client_id is None or o.client_id == client_id)
+            )
+        cached += self.breaker.evict(
+            lambda o: isinstance(o, TokenSnapshot) and (user_id is None or o.user_id == user_id) and (
+                    client_id is None or o.client_id == client_id
+            )
+        )
+        # 由被撤销令牌交换得到的令牌同样被撤销,一并失效
+        cached += self.exchange_cache.evict(
+            lambda o: (user_id is None or o['user_id'] == user_id) and (
+                    client_id is None or client_id in (o['client_id'], o['subject_client_id'])
+            )
+        )
+        return cached
+
+    def revoke_user_tokens(self, user_id: t.Any) -> t.Dict[t.Text, int]:
+        """ 批量撤销用户的全部令牌
+
+        @param user_id: 用户id
+        @return: t.Dict[t.Text, int]
+        """
+        return self.revoke_tokens(user_id=user_id)
+
+    def revoke_client_tokens(self, client_id: t.Text) -> t.Dict[t.Text, int]:
+        """ 批量撤销客户端的全部令牌
+
+        @param client_id: 客户端id
+        @return: t.Dict[t.Text, int]
+        """
+        return self.revoke_tokens(client_id=client_id)
+
+    def create_ttl_store(self) -> TTLStore:
+        """ 创建TTL存储
+
+        {
+            'backend': None,
+            'backend_options': {},
+            'maxsize': 100000
+        }
+
+        @return: TTLStore
+        """
+        conf = self.config.get('ttl_store', None) or {}
+        return create_ttl_store(conf)
+
+    def create_device_client_cache(self) -> t.Optional[TTLCache]:
+        """ 创建设备授权客户端缓存
+
+        设备码有效期内客户端会反复轮询令牌端点,缓存客户端避免每次轮询都查询客户端表
+
+        @return: t.Optional[TTLCache]
+        """
+        if not self.config.get('device_code', None):
+            return None
+        # 客户端更新或删除后立即失效缓存
+        self.listen(self.client_model, 'after_update', self.on_device_client_changed)
+        self.listen(self.client_model, 'after_delete', self.on_device_client_changed)
+        return TTLCache(ttl=self.device_code_config['expires_in'])
+
+    def on_device_client_changed(self, mapper: t.Any, connection: t.Any, target: OAuth2ClientModel) -> None:
+        """ 设备授权客户端更新或删除后回调
+
+        @param mapper: 映射对象
+        @param connection: 连接对象
+        @param target: 客户端对象
+        @return: None
+        """
+        self.device_clients.delete(target.client_id)
+
+    def get_device_client(self, client_id: t.Text) -> OAuth2ClientModel:
+        """ 获取设备授权客户端对象
+
+        只在设备码轮询时使用,其它授权模式和端点仍走get_oauth2_client
+
+        @param client_id: 客户端对象id
+        @return: OAuth2ClientModel
+        """
+        client = self.device_clients.get(client_id, None)
+        if client is not None:
+            return client
+        client = self.get_oauth2_client(client_id)
+        if client and self.static_clients.get(client_id) is None:
+            self.device_clients.set(client_id, client)
+        return client
+
+    def authenticate_device_client(self, request: OAuth2Request, methods: t.List[t.Text]) -> OAuth2ClientModel:
+        """ 认证设备码轮询的客户端
+
+        与authenticate_client使用相同的认证方法,仅查询客户端时优先使用设备授权客户端缓存
+
+        @param request: 请求对象
+        @param methods: 允许的认证方法
+        @return: OAuth2ClientModel
+        """
+        if self.device_client_auth is None:
+            return self.authenticate_client(request, methods)
+        with self.tracer.span('authenticate_client'):
+            return self.device_client_auth(request, methods)
+
+    def approve_device_code(self, user_code: t.Text, user: OAuth2UserModel, approved: t.Optional[bool] = True) -> bool:
+        """ 用户确认或拒绝设备授权
+
+        确认结果写入TTL存储并发布通知,正在等待的轮询请求会立即返回
+
+        @param user_code: 用户码
+        @param user: 当前用户
+        @param approved: 是否同意
+        @return: bool 用户码是否有效
+        """
+        device_code = self.ttl_store.get(f'user_code:{user_code}')
+        credential = device_code and self.ttl_store.get(f'device_code:{device_code}')
+        if not credential:
+            return False
+        ttl = max(credential['expires_at'] - time.time(), 1)
+        self.ttl_store.set(f'user_grant:{user_code}', [user.id, bool(approved)], ttl=ttl)
+        self.ttl_store.publish(f'device:{user_code}')
+        return True
+
+    def discard_device_credential(self, device_code: t.Text, user_code: t.Text) -> None:
+        """ 删除设备码相关数据
+
+        @param device_code: 设备码
+        @param user_code: 用户码
+        @return: None
+        """
+        for key in (f'device_code:{device_code}', f'device_poll:{device_code}',
+                    f'user_code:{user_code}', f'user_grant:{user_code}'):
+            self.ttl_store.delete(key)
+
+    def create_invalidation_bus(self) -> t.Optional[InvalidationBus]:
+        """ 创建跨节点缓存失效总线
+
+        {
+            'backend': 'database',
+            'backend_options': {},
+            'interval': 1.0,
+            'batch_size': 500,
+            'retention': 3600,
+            'gap_timeout': 30,
+            'max_gaps': 1000,
+            'max_lag': 5.0
+        }
+
+        @return: t.Optional[InvalidationBus]
+        """
+        conf = self.config.get('invalidation', None)
+        if not conf:
+            return None
+        # 客户端更新(如密钥轮换)或删除后通知其它节点
+        self.listen(self.client_model, 'after_update', self.on_client_invalidated)
+        self.listen(self.client_model, 'after_delete', self.on_client_invalidated)
+        return InvalidationBus(self, conf if isinstance(conf, dict) else {})
+
+    def on_client_invalidated(self, mapper: t.Any, connection: t.Any, target: OAuth2ClientModel) -> None:
+        """ 客户端更新或删除后回调
+
+        @param mapper: 映射对象
+        @param connection: 连接对象
+        @param target: 客户端对象
+        @return: None
+        """
+        self.broadcast_invalidation('client', target.client_id)
+
+    def broadcast_invalidation(self, kind: t.Text, key: t.Text) -> None:
+        """ 通知其它节点失效缓存
+
+        @param kind: 事件类型,如: client, token, revoke
+        @param key: 失效键
+        @return: None
+        """
+        if self.invalidation_bus is not None:
+            self.invalidation_bus.publish(kind, key)
+
+    def apply_invalidation(self, kind: t.Text, key: t.Text) -> None:
+        """ 在本节点失效缓存
+
+        @param kind: 事件类型,如: client, token, revoke
+        @param key: 失效键
+        @return: None
+        """
+        if kind == 'client':
+            self.breaker.forget(make_cache_key('client', key))
+            if self.client_cache is not None:
+                self.client_cache.delete(make_cache_key('client', key))
+            if self.registry_snapshot is not None:
+                self.registry_snapshot.discard(key)
+            self.token_policy.discard(key)
+            if self.device_clients is not None:
+                self.device_clients.delete(key)
+            if self.credential_cache is not None:
+                self.credential_cache.discard_client(key)
+            if self.negative_cache is not None:
+                self.negative_cache.discard('client', key)
+        elif kind == 'token':
+            self.breaker.forget(bytes.fromhex(key))
+            if self.token_cache is not None:
+                self.token_cache.delete(bytes.fromhex(key))
+        elif kind == 'revoke':
+            user_id, client_id = json.loads(key)
+            self.evict_tokens(user_id=user_id, client_id=client_id)
+        elif kind == 'consent' and self.consent_store is not None:
+            user_id, client_id = json.loads(key)
+            self.consent_store.discard(user_id=user_id, client_id=client_id)
+
+    def create_audit_logger(self) -> t.Optional[AuditLogger]:
+        """ 创建异步审计
+
+        {
+            'sinks': ['database'],
+            'path': '/var/log/service_authlib/audit.jsonl',
+            'maxsize': 10000,
+            'policy': 'drop_oldest',
+            'block_timeout': 0.05,
+            'batch_size': 500,
+            'interval': 1.0
+        }
+
+        @return: t.Optional[AuditLogger]
+        """
+        conf = self.config.get('audit', None)
+        if not conf:
+            return None
+        return AuditLogger(self, conf if isinstance(conf, dict) else {})
+
+    def emit_audit(self, event: t.Text, user_id: t.Optional[t.Any] = None, **fields: t.Any) -> None:
+        """ 记录审计事件,未配置审计时忽略
+
+        @param event: 事件类型,如: token_issued, code_redeemed, token_revoked, tokens_revoked
+        @param user_id: 用户id
+        @param fields: 其它字段
+        @return: None
+        """
+        if self.audit_logger is None:
+            return
+        user_id = None if user_id is None else str(user_id)
+        self.audit_logger.emit(event, user_id=user_id, **fields)
+
+    def create_code_codec(self) -> t.Optional[StatelessCodeCodec]:
+        """ 创建无状态授权码编解码器
+
+        {
+            'key': None,
+            'ttl': 300
+        }
+
+        @return: t.Optional[StatelessCodeCodec]
+        """
+        conf = self.config.get('stateless_code', None)
+        if not conf:
+            return None
+        return StatelessCodeCodec(self, conf if isinstance(conf, dict) else {})
+
+    def exists_nonce(self, nonce: t.Text) -> bool:
+        """ 检查nonce是否已被授权码使用
+
+        @param nonce: 随机码
+        @return: bool
+        """
+        if self.code_codec is not None and self.code_codec.exists_nonce(nonce):
+            return True
+        return self.repository.exists_nonce(nonce)
+
+    def create_token_response(self, request: t.Optional[Request] = None) -> Response:
+        """ 创建令牌响应对象
+
+        @param request: 请求对象
+        @return: Response
+        """
+        with self.tracer.trace('token'):
+            request = self.create_oauth2_request(request)
+            self.tracer.annotate(grant_type=request.grant_type)
+            with self.profiler.profile('token', request.grant_type):
+                return self.dispatch_token_request(request)
+
+    def dispatch_token_request(self, request: OAuth2Request) -> Response:
+        """ 分发令牌请求到授权类
+
+        @param request: 请求对象
+        @return: Response
+        """
+        # 存储熔断期间签发必然失败,立即返回
+        if self.breaker.is_open():
+            error = TemporarilyUnavailableError(retry_after=self.breaker.retry_after)
+            return self.handle_error_response(request, error)
+        # 限流必须在授权类分发之前,避免被限流的请求访问数据库
+        if self.rate_limiter is not None:
+            try:
+                with self.tracer.span('rate_limit'):
+                    self.rate_limiter.check(request)
+            except OAuth2Error as error:
+                return self.handle_error_response(request, error)
+        try:
+            grant = self.get_token_grant(request)
+        except OAuth2Error as error:
+            return self.handle_error_response(request, error)
+        # 准入控制在授权类校验之前,超出并发的请求排队,排不上或等不及的立即返回503
+        try:
+            with self.tracer.span('admission'):
+                ticket = self.admission.acquire(request.grant_type)
+        except OAuth2Error as error:
+            return self.handle_error_response(request, error)
+        try:
+            with self.tracer.span('validate_token_request'):
+                grant.validate_token_request()
+            with self.tracer.span('create_token_response'):
+                args = grant.create_token_response()
+            return self.handle_response(*args)
+        except OAuth2Error as error:
+            return self.handle_error_response(request, error)
+        finally:
+            self.admission.release(ticket)
+
+    def create_authorization_response(
+            self,
+            request: t.Optional[Request] = None,
+            grant_user: t.Optional[OAuth2UserModel] = None
+    ) -> Response:
+        """ 创建授权响应对象
+
+        @param request: 请求对象
+        @param grant_user: 同意授权的用户,为None表示拒绝
+        @return: Response
+        """
+        with self.tracer.trace('authorize'):
+            request = self.create_oauth2_request(request)
+            self.tracer.annotate(response_type=request.response_type)
+            with self.profiler.profile('authorize', request.response_type):
+                return self.dispatch_authorization_request(request, grant_user)
+
+    def dispatch_authorization_request(
+            self,
+            request: OAuth2Request,
+            grant_user: t.Optional[OAuth2UserModel] = None
+    ) -> Response:
+        """ 分发授权请求到授权类
+
+        @param request: 请求对象
+        @param grant_user: 同意授权的用户,为None表示拒绝
+        @return: Response
+        """
+        if self.breaker.is_open():
+            error = TemporarilyUnavailableError(retry_after=self.breaker.retry_after)
+            return self.handle_error_response(request, error)
+        try:
+            grant = self.get_authorization_grant(request)
+        except OAuth2Error as error:
+            return self.handle_error_response(request, error)
+        try:
+            with self.tracer.span('admission'):
+                ticket = self.admission.acquire('authorize')
+        except OAuth2Error as error:
+            return self.handle_error_response(request, error)
+        try:
+            with self.tracer.span('validate_authorization_request'):
+                redirect_uri = self.validate_authorization_grant(grant)
+            with self.tracer.span('create_authorization_response'):
+                args = grant.create_authorization_response(redirect_uri, grant_user)
+            self.discard_pushed_request(request)
+            return self.handle_response(*args)
+        except OAuth2Error as error:
+            return self.handle_error_response(request, error)
+        finally:
+            self.admission.release(ticket)
+
+    def get_authorization_grant(self, request: OAuth2Request) -> BaseGrant:
+        """ 获取授权对象,请求通过request_uri传递时先载入推送的授权请求
+
+        @param request: 请求对象
+        @return: BaseGrant
+        """
+        self.resolve_pushed_request(request)
+        return super(OAuth2AuthorizationServer, self).get_authorization_grant(request)
+
+    def resolve_pushed_request(self, request: OAuth2Request) -> None:
+        """ 用推送端点保存的授权请求参数替换当前请求参数
+
+        @param request: 请求对象
+        @return: None
+        """
+        # 已经解析过或由推送端点创建的请求
+        if hasattr(request, 'pushed'):
+            return
+        request.pushed = None
+        request_uri = request.data.get('request_uri')
+        if not request_uri:
+            if self.config.get('pushed_authorization', None) and self.pushed_authorization_config['require']:
+                raise InvalidRequestError('Missing "request_uri" in request.')
+            return
+        pushed = self.ttl_store.get(request_uri) if request_uri.startswith(REQUEST_URI_PREFIX) else None
+        if not pushed or pushed['client_id'] != request.client_id:
+            raise InvalidRequestError('Invalid "request_uri" in request.')
+        request.args = dict(pushed['data'])
+        request.data = dict(pushed['data'])
+        request.pushed = pushed | {'request_uri': request_uri}
+
+    def validate_authorization_grant(self, grant: BaseGrant) -> t.Text:
+        """ 校验授权请求,推送的授权请求直接使用预校验结果
+
+        @param grant: 授权对象
+        @return: t.Text 回调地址
+        """
+        pushed = getattr(grant.request, 'pushed', None)
+        if pushed is None:
+            return grant.validate_authorization_request()
+        client = self.get_oauth2_client(pushed['client_id'])
+        if not client:
+            raise InvalidClientError(state=grant.request.state)
+        grant.request.client = client
+        return pushed['redirect_uri']
+
+    def discard_pushed_request(self, request: OAuth2Request) -> None:
+        """ 授权响应创建后删除推送的授权请求,request_uri只能使用一次
+
+        @param request: 请求对象
+        @return: None
+        """
+        pushed = getattr(request, 'pushed', None)
+        if pushed is not None:
+            self.ttl_store.delete(pushed['request_uri'])
+
+    def authenticate_client(self, request: OAuth2Request, methods: t.List[t.Text]) -> OAuth2ClientModel:
+        """ 认证客户端
+
+        @param request: 请求对象
+        @param methods: 允许的认证方法
+        @return: OAuth2ClientModel
+        """
+        with self.tracer.span('authenticate_client'):
+            return super(OAuth2AuthorizationServer, self).authenticate_client(request, methods)
+
+    def register_client_auth_method(self, method: t.Text, func: t.Callable[..., t.Any]) -> None:
+        """ 注册客户端认证方法,同时注册到设备码轮询的客户端认证
+
+        @param method: 认证方法名称
+        @param func: 认证函数
+        @return: None
+        """
+        super(OAuth2AuthorizationServer, self).register_client_auth_method(method, func)
+        if self.device_client_auth is not None:
+            self.device_client_auth.register(method, func)
+
+    def create_admission_controller(self) -> AdmissionController:
+        """ 创建准入控制器,未配置时创建不做限制的准入控制器
+
+        {
+            'max_in_flight': 128,
+            'limits': {'default': 64, 'password': 16, 'authorize': 32},
+            'priorities': {'refresh_token': 0, 'client_credentials': 0, 'default': 10},
+            'max_queue': 256,
+            'queue_timeout': 1.0
+        }
+
+        @return: AdmissionController
+        """
+        conf = self.config.get('admission', None)
+        return AdmissionController(conf if isinstance(conf, dict) else {}, enabled=bool(conf))
+
+    def create_circuit_breaker(self) -> CircuitBreaker:
+        """ 创建存储熔断器,未配置时创建关闭状态的熔断器
+
+        {
+            'failure_threshold': 5,
+            'reset_timeout': 30,
+            'deadline': 2.0,
+            'stale_ttl': 3600,
+            'maxsize': 10000
+        }
+
+        @return: CircuitBreaker
+        """
+        conf = self.config.get('circuit_breaker', None)
+        if conf:
+            # 客户端更新(如密钥轮换)或删除后立即失效降级缓存
+            self.listen(self.client_model, 'after_update', self.on_breaker_client_changed)
+            self.listen(self.client_model, 'after_delete', self.on_breaker_client_changed)
+        return CircuitBreaker(conf if isinstance(conf, dict) else {}, enabled=bool(conf))
+
+    def on_breaker_client_changed(self, mapper: t.Any, connection: t.Any, target: OAuth2ClientModel) -> None:
+        """ 客户端更新或删除后回调
+
+        @param mapper: 映射对象
+        @param connection: 连接对象
+        @param target: 客户端对象
+        @return: None
+        """
+        self.breaker.forget(make_cache_key('client', target.client_id))
+
+    def create_profiler(self) -> SamplingProfiler:
+        """ 创建采样分析器,未配置时同样创建以便运行时通过enable开启
+
+        {
+            'rates': {'token': 0, 'authorize': 0, 'password': 0},
+            'max_stacks': 10000
+        }
+
+        @return: SamplingProfiler
+        """
+        conf = self.config.get('profiling', None)
+        return SamplingProfiler(conf if isinstance(conf, dict) else {})
+
+    def create_tracer(self) -> Tracer:
+        """ 创建请求阶段追踪器
+
+        {
+            'exporter': None,
+            'exporter_options': {},
+            'slow_threshold': 500,
+            'slow_maxlen': 100
+        }
+
+        @return: Tracer
+        """
+        conf = self.config.get('tracing', None)
+        if not conf:
+            return NoopTracer()
+        return Tracer(conf if isinstance(conf, dict) else {})
+
     def get_consent_grant(self, request: OAuth2Request) -> BaseGrant:
         """ 获取同意后授权对象
 
@@ -273,10 +1344,74 @@ class OAuth2AuthorizationServer(AuthorizationServer):
         @return: BaseGrant
         """
         grant = self.get_authorization_grant(request)
-        grant.validate_consent_request()
+        if getattr(request, 'pushed', None) is None:
+            grant.validate_consent_request()
+        else:
+            redirect_uri = self.validate_authorization_grant(grant)
+            # prompt等依赖当前终端用户的校验(如OpenID的validate_request_prompt)在同意阶段执行
+            grant.execute_hook('after_validate_consent_request', redirect_uri)
+            grant.redirect_uri = redirect_uri
         grant.prompt = None if not hasattr(grant, 'prompt') else grant.prompt
+        grant.consented = self.has_consent(grant)
         return grant
 
+    def create_consent_store(self) -> t.Optional[ConsentStore]:
+        """ 创建授权同意记录
+
+        {
+            'ttl': 2592000,
+            'maxsize': 10000,
+            'cache_ttl': 60
+        }
+
+        @return: t.Optional[ConsentStore]
+        """
+        conf = self.config.get('consent', None)
+        if not conf:
+            return None
+        return ConsentStore(self, conf if isinstance(conf, dict) else {})
+
+    def has_consent(self, grant: BaseGrant) -> bool:
+        """ 当前用户是否已同意本次请求的授权范围
+
+        已同意时调用方可以跳过同意页面直接调用create_authorization_response,prompt=consent时总是需要同意
+
+        @param grant: 授权对象
+        @return: bool
+        """
+        request = grant.request
+        if self.consent_store is None or request.user is None:
+            return False
+        if 'consent' in (request.data.get('prompt') or '').split():
+            return False
+        return self.consent_store.has_consent(request.user.id, request.client.client_id, request.scope)
+
+    def remember_consent(self, grant: BaseGrant, ttl: t.Optional[int] = None) -> None:
+        """ 记录当前用户同意的授权范围
+
+        @param grant: validate_consent_request返回的授权对象
+        @param ttl: 有效秒数
+        @return: None
+        """
+        request = grant.request
+        if self.consent_store is None or request.user is None:
+            return
+        self.consent_store.remember(request.user.id, request.client.client_id, request.scope, ttl=ttl)
+        self.broadcast_invalidation('consent', json.dumps([request.user.id, request.client.client_id]))
+
+    def revoke_consents(self, user_id: t.Optional[t.Any] = None, client_id: t.Optional[t.Text] = None) -> int:
+        """ 批量撤销用户,客户端或(用户, 客户端)的同意记录
+
+        @param user_id: 用户id
+        @param client_id: 客户端id
+        @return: int 撤销的记录数
+        """
+        if self.consent_store is None:
+            return 0
+        count = self.consent_store.revoke(user_id=user_id, client_id=client_id)
+        self.broadcast_invalidation('consent', json.dumps([user_id, client_id]))
+        return count
+
     def validate_consent_request(self, request: Request, end_user: t.Optional[OAuth2UserModel] = None) -> BaseGrant:
         """ 验证是否合法请求
 
@@ -0,0 +1,61 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import typing as t
+
+from logging import getLogger
+from authlib.oauth2.rfc8628 import DeviceAuthorizationEndpoint as BaseDeviceAuthorizationEndpoint
+
+logger = getLogger(__name__)
+
+
+class DeviceAuthorizationEndpoint(BaseDeviceAuthorizationEndpoint):
+    """ 设备授权端点
+
+    doc: https://docs.authlib.org/en/latest/specs/rfc8628.html
+
+    1. provider_options中device_code.verification_uri必须配置为用户输入user_code的页面地址
+    2. 生成的device_code和user_code只写入TTL存储,不写数据库
+    """
+
+    def __init__(self, server: t.Any) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        """
+        super(DeviceAuthorizationEndpoint, self).__init__(server)
+        self.config = server.device_code_config
+        self.EXPIRES_IN = self.config['expires_in']
+        self.INTERVAL = self.config['interval']
+
+    def get_verification_uri(self) -> t.Text:
+        """ 获取用户输入user_code的页面地址
+
+        @return: t.Text
+        """
+        verification_uri = self.config['verification_uri']
+        if not verification_uri:
+            raise RuntimeError('device_code.verification_uri is required in provider_options')
+        return verification_uri
+
+    def save_device_credential(self, client_id: t.Text, scope: t.Text, data: t.Dict[t.Text, t.Any]) -> None:
+        """ 保存设备码凭证
+
+        @param client_id: 客户端id
+        @param scope: 授权范围
+        @param data: 设备码数据
+        @return: None
+        """
+        store = self.server.ttl_store
+        credential = {
+            'client_id': client_id, 'scope': scope,
+            'device_code': data['device_code'], 'user_code': data['user_code'],
+            'interval': data['interval'], 'expires_at': int(time.time()) + data['expires_in']
+        }
+        logger.debug(f'create device code with client_id={client_id}, user_code={data["user_code"]}')
+        store.set(f'device_code:{data["device_code"]}', credential, ttl=data['expires_in'])
+        store.set(f'user_code:{data["user_code"]}', data['device_code'], ttl=data['expires_in'])
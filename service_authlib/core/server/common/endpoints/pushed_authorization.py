@@ -0,0 +1,108 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from logging import getLogger
+from authlib.oauth2 import OAuth2Error
+from authlib.oauth2 import OAuth2Request
+from authlib.common.security import generate_token
+from authlib.oauth2.rfc6749 import InvalidRequestError
+
+logger = getLogger(__name__)
+
+# request_uri前缀
+REQUEST_URI_PREFIX = 'urn:ietf:params:oauth:request_uri:'
+
+
+class PushedAuthorizationEndpoint(object):
+    """ 推送授权请求端点
+
+    doc: https://datatracker.ietf.org/doc/html/rfc9126
+
+    1. 客户端认证后只校验一次授权请求,校验通过的参数和回调地址写入TTL存储,不写数据库
+    2. /authorize只需传递client_id和request_uri,同意页面渲染和提交时直接使用预校验结果,不再重复校验
+    3. prompt依赖终端用户,不在推送时处理,同意页面渲染时仍执行授权类的after_validate_consent_request钩子
+    4. 默认只接受client_secret_basic/client_secret_post认证,公开客户端需在pushed_authorization.auth_methods中显式加入none
+    5. request_uri在授权响应创建后删除,只能使用一次
+
+    请求1: /par
+    Content-Type: application/x-www-form-urlencoded
+
+    client_id:spa
+    response_type:code
+    redirect_uri:https://www.baidu.com/
+    code_challenge:E9Melhoa2OwvFrEMTJguCHaoeK1t8URWbuGJSstw-cM
+    code_challenge_method:S256
+
+    响应1:
+    Content-Type: application/json
+
+    {
+        "request_uri": "urn:ietf:params:oauth:request_uri:6esc_11ACC5bwc014ltc14eY22c",
+        "expires_in": 60
+    }
+
+    请求2: /authorize?client_id=spa&request_uri=urn%3Aietf%3Aparams%3Aoauth%3Arequest_uri%3A6esc_11ACC5bwc014ltc14eY22c
+    """
+    ENDPOINT_NAME = 'pushed_authorization_request'
+    # 客户端认证参数不随授权请求保存
+    CLIENT_AUTH_PARAMS = ('client_secret', 'client_assertion', 'client_assertion_type')
+
+    def __init__(self, server: t.Any) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        """
+        self.server = server
+        self.config = server.pushed_authorization_config
+
+    def __call__(self, request: OAuth2Request) -> t.Tuple[int, t.Dict[t.Text, t.Any], t.List[t.Tuple[t.Text, t.Text]]]:
+        return self.create_endpoint_response(request)
+
+    def create_endpoint_request(self, request: t.Any) -> OAuth2Request:
+        """ 封装成OAuth2Request
+
+        @param request: 原始请求对象
+        @return: OAuth2Request
+        """
+        return self.server.create_oauth2_request(request)
+
+    def create_endpoint_response(
+            self,
+            request: OAuth2Request
+    ) -> t.Tuple[int, t.Dict[t.Text, t.Any], t.List[t.Tuple[t.Text, t.Text]]]:
+        """ 校验并保存授权请求
+
+        @param request: 请求对象
+        @return: t.Tuple[int, t.Dict[t.Text, t.Any], t.List[t.Tuple[t.Text, t.Text]]]
+        """
+        client = self.server.authenticate_client(request, self.config['auth_methods'])
+        if 'request_uri' in request.data:
+            raise InvalidRequestError('"request_uri" is not allowed in pushed authorization request.')
+        if request.data.get('client_id', client.client_id) != client.client_id:
+            raise InvalidRequestError('Mismatched "client_id" in request.')
+        data = {k: v for k, v in request.data.items() if k not in self.CLIENT_AUTH_PARAMS}
+        data['client_id'] = client.client_id
+        pushed = OAuth2Request('POST', request.uri, body=data, headers=request.headers)
+        pushed.user = request.user
+        pushed.pushed = None
+        try:
+            grant = self.server.get_authorization_grant(pushed)
+            redirect_uri = grant.validate_authorization_request()
+        except OAuth2Error as error:
+            # 推送端点直接返回错误,不重定向到回调地址
+            error.redirect_uri = None
+            raise
+        expires_in = self.config['expires_in']
+        request_uri = f'{REQUEST_URI_PREFIX}{generate_token(32)}'
+        # prompt依赖终端用户的登录状态,推送时不处理,在同意阶段由授权类的钩子处理
+        value = {'client_id': client.client_id, 'data': data, 'redirect_uri': redirect_uri}
+        self.server.ttl_store.set(request_uri, value, ttl=expires_in)
+        logger.debug(f'push authorization request with client_id={client.client_id}')
+        body = {'request_uri': request_uri, 'expires_in': expires_in}
+        headers = [('Content-Type', 'application/json'), ('Cache-Control', 'no-store'), ('Pragma', 'no-cache')]
+        return 201, body, headers
@@ -0,0 +1,66 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import math
+import typing as t
+
+from authlib.oauth2 import OAuth2Error
+
+
+class SlowDownError(OAuth2Error):
+    """ 请求过于频繁
+
+    doc: https://datatracker.ietf.org/doc/html/rfc8628#section-3.5
+    """
+    error = 'slow_down'
+    status_code = 429
+
+    def __init__(self, retry_after: t.Optional[float] = None, **kwargs: t.Any) -> None:
+        """ 初始化实例
+
+        @param retry_after: 建议重试等待秒数
+        @param kwargs: 其它参数
+        """
+        self.retry_after = retry_after
+        super(SlowDownError, self).__init__(**kwargs)
+
+    def get_headers(self) -> t.List[t.Tuple[t.Text, t.Text]]:
+        """ 获取响应头部
+
+        @return: t.List[t.Tuple[t.Text, t.Text]]
+        """
+        headers = list(super(SlowDownError, self).get_headers())
+        if self.retry_after:
+            headers.append(('Retry-After', str(math.ceil(self.retry_after))))
+        return headers
+
+
+class TemporarilyUnavailableError(OAuth2Error):
+    """ 服务暂时不可用
+
+    doc: https://datatracker.ietf.org/doc/html/rfc6749#section-4.1.2.1
+    """
+    error = 'temporarily_unavailable'
+    status_code = 503
+
+    def __init__(self, retry_after: t.Optional[float] = None, **kwargs: t.Any) -> None:
+        """ 初始化实例
+
+        @param retry_after: 建议重试等待秒数
+        @param kwargs: 其它参数
+        """
+        self.retry_after = retry_after
+        super(TemporarilyUnavailableError, self).__init__(**kwargs)
+
+    def get_headers(self) -> t.List[t.Tuple[t.Text, t.Text]]:
+        """ 获取响应头部
+
+        @return: t.List[t.Tuple[t.Text, t.Text]]
+        """
+        headers = list(super(TemporarilyUnavailableError, self).get_headers())
+        if self.retry_after:
+            headers.append(('Retry-After', str(math.ceil(self.retry_after))))
+        return headers
@@ -0,0 +1,196 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import heapq
+import typing as t
+import itertools
+
+from threading import Lock
+from threading import Event
+from logging import getLogger
+from collections import Counter
+from service_authlib.constants import DEFAULT_ADMISSION_CONFIG
+from service_authlib.core.server.common.errors import TemporarilyUnavailableError
+
+logger = getLogger(__name__)
+
+
+class Waiter(object):
+    """ 排队中的请求 """
+
+    __slots__ = ('key', 'priority', 'event', 'admitted', 'rejected')
+
+    def __init__(self, key: t.Text, priority: int) -> None:
+        """ 初始化实例
+
+        @param key: 授权类型
+        @param priority: 优先级
+        """
+        self.key = key
+        self.priority = priority
+        self.event = Event()
+        self.admitted = False
+        self.rejected = False
+
+
+class AdmissionController(object):
+    """ 准入控制器
+
+    在授权类分发之前限制并发,超出并发的请求进入有界的优先级队列,排不上或等不及的请求立即返回503
+
+    1. 同时限制总并发和每个授权类型的并发,避免登录高峰拖慢所有授权类型
+    2. refresh_token和client_credentials默认优先于交互式授权,队列排满时挤掉优先级最低的请求
+    3. 按各授权类型的平均处理时间预估排队时间,超过queue_timeout时立即拒绝而不是等到超时
+    """
+
+    def __init__(self, config: t.Optional[t.Dict[t.Text, t.Any]] = None, enabled: bool = True) -> None:
+        """ 初始化实例
+
+        @param config: 准入控制配置
+        @param enabled: 是否开启,关闭时acquire不做任何处理
+        """
+        self.lock = Lock()
+        self.enabled = enabled
+        config = config or {}
+        self.config = DEFAULT_ADMISSION_CONFIG | config
+        self.limits = DEFAULT_ADMISSION_CONFIG['limits'] | (config.get('limits', None) or {})
+        self.priorities = DEFAULT_ADMISSION_CONFIG['priorities'] | (config.get('priorities', None) or {})
+        self.queue = []
+        self.seq = itertools.count()
+        self.total = 0
+        self.in_flight = Counter()
+        self.service_time = {}
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+
+    def get_limit(self, key: t.Text) -> int:
+        """ 获取授权类型的最大并发数
+
+        @param key: 授权类型
+        @return: int
+        """
+        return self.limits.get(key, self.limits['default'])
+
+    def get_priority(self, key: t.Text) -> int:
+        """ 获取授权类型的优先级
+
+        @param key: 授权类型
+        @return: int
+        """
+        return self.priorities.get(key, self.priorities['default'])
+
+    def estimate_wait(self, priority: int) -> float:
+        """ 持有锁时预估排队秒数
+
+        @param priority: 优先级
+        @return: float
+        """
+        ahead = [w for _, _, w in self.queue if w.priority <= priority]
+        if not ahead:
+            return 0.0
+        avg = sum(self.service_time.get(w.key, 0.0) for w in ahead) / len(ahead)
+        return avg * len(ahead) / max(self.config['max_in_flight'], 1)
+
+    def dispatch(self) -> None:
+        """ 持有锁时按优先级放行排队请求
+
+        @return: None
+        """
+        skipped = []
+        while self.queue and self.total < self.config['max_in_flight']:
+            item = heapq.heappop(self.queue)
+            waiter = item[2]
+            if self.in_flight[waiter.key] >= self.get_limit(waiter.key):
+                skipped.append(item)
+                continue
+            self.total += 1
+            self.admitted += 1
+            self.in_flight[waiter.key] += 1
+            waiter.admitted = True
+            waiter.event.set()
+        for item in skipped:
+            heapq.heappush(self.queue, item)
+
+    def reject(self, retry_after: float, description: t.Text) -> None:
+        """ 拒绝请求
+
+        @param retry_after: 建议重试等待秒数
+        @param description: 拒绝原因
+        @return: None
+        """
+        self.rejected += 1
+        raise TemporarilyUnavailableError(retry_after=max(retry_after, 1), description=description)
+
+    def acquire(self, key: t.Optional[t.Text]) -> t.Optional[t.Tuple[t.Text, float]]:
+        """ 申请执行许可
+
+        @param key: 授权类型或端点
+        @return: t.Optional[t.Tuple[t.Text, float]] 许可,执行结束后必须调用release
+        """
+        if not self.enabled:
+            return None
+        key = key or 'default'
+        timeout = self.config['queue_timeout']
+        priority = self.get_priority(key)
+        waiter = Waiter(key, priority)
+        item = (priority, next(self.seq), waiter)
+        with self.lock:
+            estimate = self.estimate_wait(priority)
+            if estimate > timeout:
+                self.reject(estimate, 'server is overloaded')
+            if len(self.queue) >= self.config['max_queue']:
+                worst = max(self.queue)
+                if worst[0] <= priority:
+                    self.reject(estimate or timeout, 'server is overloaded')
+                # 挤掉优先级最低且最晚到达的排队请求
+                self.queue.remove(worst)
+                heapq.heapify(self.queue)
+                worst[2].rejected = True
+                worst[2].event.set()
+                self.shed += 1
+            heapq.heappush(self.queue, item)
+            self.dispatch()
+        if not waiter.admitted:
+            waiter.event.wait(timeout)
+        with self.lock:
+            if waiter.admitted:
+                return key, time.monotonic()
+            if not waiter.rejected:
+                self.queue.remove(item)
+                heapq.heapify(self.queue)
+            self.reject(self.estimate_wait(priority) or timeout, 'request waited too long')
+
+    def release(self, ticket: t.Optional[t.Tuple[t.Text, float]]) -> None:
+        """ 归还执行许可
+
+        @param ticket: acquire返回的许可
+        @return: None
+        """
+        if ticket is None:
+            return
+        key, start = ticket
+        elapsed = time.monotonic() - start
+        with self.lock:
+            self.total -= 1
+            self.in_flight[key] -= 1
+            # 指数加权平均处理时间,用于预估排队时间
+            self.service_time[key] = elapsed if key not in self.service_time else (
+                    0.8 * self.service_time[key] + 0.2 * elapsed
+            )
+            self.dispatch()
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 获取准入统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self.lock:
+            return {
+                'in_flight': dict(self.in_flight), 'queued': len(self.queue),
+                'admitted': self.admitted, 'rejected': self.rejected, 'shed': self.shed
+            }
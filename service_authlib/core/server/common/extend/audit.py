@@ -0,0 +1,271 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import typing as t
+
+from threading import Lock
+from threading import Event
+from threading import Thread
+from logging import getLogger
+from collections import deque
+from threading import Condition
+from service_authlib.constants import DEFAULT_AUDIT_CONFIG
+from service_sqlalchemy.core.shortcuts import safe_transaction
+from service_core.core.as_loader import load_dot_path_colon_obj
+from service_authlib.core.server.common.models.audit import OAuth2AuditModel
+
+logger = getLogger(__name__)
+
+# 审计事件: 与oauth2_audit表列同名的字典
+AuditEvent = t.Dict[t.Text, t.Any]
+
+
+class AuditSink(object):
+    """ 审计输出基类
+
+    其它输出(如消息队列)需继承此类并实现write方法,write在后台线程中按批调用
+    """
+
+    def write(self, events: t.List[AuditEvent]) -> None:
+        """ 批量写入审计事件
+
+        @param events: 审计事件列表
+        @return: None
+        """
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        """ 关闭输出
+
+        @return: None
+        """
+
+
+class DatabaseAuditSink(AuditSink):
+    """ 数据库输出,每批事件一条批量插入语句写入oauth2_audit表 """
+
+    def __init__(self, server: t.Any) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        """
+        self.server = server
+        self.table = OAuth2AuditModel.__table__
+        self.columns = [c.name for c in self.table.columns if c.name != 'id']
+
+    def write(self, events: t.List[AuditEvent]) -> None:
+        """ 批量写入审计事件
+
+        @param events: 审计事件列表
+        @return: None
+        """
+        values = []
+        for event in events:
+            value = {name: event.get(name) for name in self.columns}
+            value['detail'] = json.dumps(value['detail'], default=str) if value['detail'] else None
+            values.append(value)
+        with safe_transaction(self.server.service.ORM, commit=True) as session:
+            session.execute(self.table.insert(), values)
+
+
+class JsonLinesAuditSink(AuditSink):
+    """ 只追加的JSON Lines文件输出,每个事件一行 """
+
+    def __init__(self, path: t.Text, fsync: bool = False) -> None:
+        """ 初始化实例
+
+        @param path: 文件路径
+        @param fsync: 每批写入后是否fsync
+        """
+        self.path = path
+        self.fsync = fsync
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, events: t.List[AuditEvent]) -> None:
+        """ 批量写入审计事件
+
+        @param events: 审计事件列表
+        @return: None
+        """
+        self.file.write(''.join(json.dumps(e, separators=(',', ':'), default=str) + '\n' for e in events))
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        """ 关闭输出
+
+        @return: None
+        """
+        self.file.close()
+
+
+class AuditLogger(object):
+    """ 异步批量审计
+
+    请求路径上emit只把事件放入有界内存队列,后台线程按批写入所有输出,审计写入不再占用令牌签发的延迟
+
+    1. 队列满时按policy处理: drop_new丢弃新事件,drop_oldest丢弃最老事件,block最多阻塞block_timeout秒
+    2. 丢弃的事件计入dropped,写入失败的事件计入failed,可通过stats获取
+    3. 队列积压达到batch_size时立即唤醒后台线程,否则按interval写入
+    """
+
+    policies = ('drop_new', 'drop_oldest', 'block')
+
+    def __init__(self, server: t.Any, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        @param config: 审计配置
+        """
+        self.server = server
+        self.config = DEFAULT_AUDIT_CONFIG | (config or {})
+        if self.config['policy'] not in self.policies:
+            raise ValueError(f'audit policy must be one of {self.policies}')
+        self.queue = deque()
+        self.lock = Lock()
+        self.not_full = Condition(self.lock)
+        self.not_empty = Condition(self.lock)
+        self.counter_lock = Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.sinks = [self.create_sink(sink) for sink in self.config['sinks']]
+        self.stopped = Event()
+        self.thread = None
+
+    def create_sink(self, sink: t.Union[t.Text, AuditSink]) -> AuditSink:
+        """ 根据配置创建审计输出
+
+        @param sink: database/jsonl/点路径或输出对象
+        @return: AuditSink
+        """
+        if isinstance(sink, AuditSink):
+            return sink
+        if sink == 'database':
+            return DatabaseAuditSink(self.server)
+        if sink == 'jsonl':
+            return JsonLinesAuditSink(self.config['path'])
+        return load_dot_path_colon_obj(sink)[-1]()
+
+    def emit(self, event: t.Text, **fields: t.Any) -> bool:
+        """ 记录审计事件
+
+        @param event: 事件类型,如: token_issued, code_redeemed, token_revoked
+        @param fields: 其它字段
+        @return: bool 是否进入队列
+        """
+        record = {'event': event, 'created_at': int(time.time())} | fields
+        maxsize = self.config['maxsize']
+        with self.lock:
+            if len(self.queue) >= maxsize:
+                policy = self.config['policy']
+                if policy == 'drop_oldest':
+                    self.queue.popleft()
+                    self.dropped += 1
+                elif policy == 'block':
+                    self.not_full.wait_for(lambda: len(self.queue) < maxsize, self.config['block_timeout'])
+                if len(self.queue) >= maxsize:
+                    self.dropped += 1
+                    return False
+            self.queue.append(record)
+            self.enqueued += 1
+            if len(self.queue) >= self.config['batch_size']:
+                self.not_empty.notify()
+        return True
+
+    def drain(self) -> t.List[AuditEvent]:
+        """ 取出一批事件
+
+        @return: t.List[AuditEvent]
+        """
+        with self.lock:
+            count = min(len(self.queue), self.config['batch_size'])
+            events = [self.queue.popleft() for _ in range(count)]
+            if events:
+                self.not_full.notify_all()
+        return events
+
+    def flush(self) -> int:
+        """ 写入队列中的全部事件
+
+        @return: int 写入的事件数
+        """
+        total = 0
+        while True:
+            events = self.drain()
+            if not events:
+                return total
+            failed = False
+            for sink in self.sinks:
+                try:
+                    sink.write(events)
+                except Exception as e:
+                    failed = True
+                    logger.warning(f'write {len(events)} oauth2 audit events to {sink.__class__.__name__} failed, {e}')
+            with self.counter_lock:
+                if failed:
+                    self.failed += len(events)
+                else:
+                    self.written += len(events)
+            total += len(events)
+
+    def run(self) -> None:
+        """ 后台线程循环
+
+        @return: None
+        """
+        while not self.stopped.is_set():
+            with self.lock:
+                if len(self.queue) < self.config['batch_size']:
+                    self.not_empty.wait(self.config['interval'])
+            self.flush()
+        self.flush()
+
+    def start(self) -> None:
+        """ 启动后台线程
+
+        @return: None
+        """
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = Thread(target=self.run, name='oauth2-audit', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """ 停止后台线程,停止前写入剩余事件并关闭输出
+
+        @return: None
+        """
+        if self.thread is None:
+            return
+        self.stopped.set()
+        with self.lock:
+            self.not_empty.notify()
+        self.thread.join()
+        self.thread = None
+        for sink in self.sinks:
+            sink.close()
+
+    def stats(self) -> t.Dict[t.Text, int]:
+        """ 获取审计统计
+
+        @return: t.Dict[t.Text, int]
+        """
+        with self.lock:
+            queued = len(self.queue)
+        return {
+            'queued': queued, 'enqueued': self.enqueued, 'dropped': self.dropped,
+            'written': self.written, 'failed': self.failed
+        }
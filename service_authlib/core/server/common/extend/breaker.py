@@ -0,0 +1,191 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import typing as t
+
+from threading import Lock
+from logging import getLogger
+from contextlib import contextmanager
+from service_authlib.constants import DEFAULT_CIRCUIT_BREAKER_CONFIG
+from service_authlib.core.server.common.errors import TemporarilyUnavailableError
+
+from .cache import TTLCache
+
+try:
+    from eventlet import Timeout
+except ImportError:
+    Timeout = None
+
+logger = getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """ 存储调用超过截止时间 """
+
+
+class CircuitBreaker(object):
+    """ 存储熔断器
+
+    包裹授权服务器对数据库的调用,连续失败或超时达到阈值后熔断,熔断期间立即失败,不再占用worker等待数据库
+
+    1. 安装eventlet时通过eventlet.Timeout强制截止,否则调用结束后超时的调用同样计为失败
+    2. 熔断reset_timeout秒后进入半开状态,只放行一个探测调用,成功则恢复
+    3. stale缓存保存最近一次成功查询的客户端和令牌,熔断期间用于降级查询,客户端变更和令牌撤销时同步失效
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, config: t.Optional[t.Dict[t.Text, t.Any]] = None, enabled: bool = True) -> None:
+        """ 初始化实例
+
+        @param config: 熔断配置
+        @param enabled: 是否开启,关闭时guard不做任何处理
+        """
+        self.lock = Lock()
+        self.enabled = enabled
+        self.config = DEFAULT_CIRCUIT_BREAKER_CONFIG | (config or {})
+        self.deadline = self.config['deadline']
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.stale = TTLCache(maxsize=self.config['maxsize'], ttl=self.config['stale_ttl'])
+
+    @property
+    def retry_after(self) -> float:
+        """ 距离下次探测的秒数
+
+        @return: float
+        """
+        return max(self.opened_at + self.config['reset_timeout'] - time.monotonic(), 1)
+
+    def is_open(self) -> bool:
+        """ 是否处于熔断状态且未到探测时间
+
+        @return: bool
+        """
+        if not self.enabled or self.state == self.CLOSED:
+            return False
+        return self.state == self.OPEN and time.monotonic() < self.opened_at + self.config['reset_timeout']
+
+    def before_call(self) -> None:
+        """ 调用前检查熔断状态
+
+        @return: None
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() >= self.opened_at + self.config['reset_timeout']:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+        raise TemporarilyUnavailableError(retry_after=self.retry_after, description='storage circuit is open')
+
+    def on_success(self) -> None:
+        """ 记录成功调用
+
+        @return: None
+        """
+        with self.lock:
+            if self.state != self.CLOSED:
+                logger.info('storage circuit closed')
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def on_failure(self, reason: t.Text) -> None:
+        """ 记录失败调用
+
+        @param reason: 失败原因
+        @return: None
+        """
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.config['failure_threshold']:
+                if self.state != self.OPEN:
+                    logger.warning(f'storage circuit opened after {self.failures} failures, last: {reason}')
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    @contextmanager
+    def guard(self) -> t.Iterator[None]:
+        """ 包裹一次存储调用
+
+        @return: t.Iterator[None]
+        """
+        if not self.enabled:
+            yield
+            return
+        self.before_call()
+        start = time.monotonic()
+        timeout = None if Timeout is None else Timeout(self.deadline, DeadlineExceeded)
+        try:
+            yield
+        except DeadlineExceeded:
+            self.on_failure(f'deadline {self.deadline}s exceeded')
+            raise TemporarilyUnavailableError(retry_after=self.retry_after, description='storage deadline exceeded')
+        except TemporarilyUnavailableError:
+            with self.lock:
+                self.probing = False
+            raise
+        except Exception as e:
+            self.on_failure(repr(e))
+            raise
+        finally:
+            if timeout is not None:
+                timeout.cancel()
+        elapsed = time.monotonic() - start
+        if elapsed > self.deadline:
+            self.on_failure(f'call took {elapsed:.3f}s')
+        else:
+            self.on_success()
+
+    def remember(self, key: t.Hashable, value: t.Any) -> None:
+        """ 保存降级时可用的查询结果
+
+        @param key: 缓存键
+        @param value: 查询结果
+        @return: None
+        """
+        if self.enabled and value is not None:
+            self.stale.set(key, value)
+
+    def recall(self, key: t.Hashable) -> t.Any:
+        """ 降级时获取最近一次查询结果
+
+        @param key: 缓存键
+        @return: t.Any
+        """
+        return self.stale.get(key, None) if self.enabled else None
+
+    def forget(self, key: t.Hashable) -> None:
+        """ 删除降级时可用的查询结果
+
+        @param key: 缓存键
+        @return: None
+        """
+        self.stale.delete(key)
+
+    def evict(self, predicate: t.Callable[[t.Any], bool]) -> int:
+        """ 删除满足条件的降级查询结果
+
+        @param predicate: 查询结果过滤函数
+        @return: int
+        """
+        return self.stale.evict(predicate)
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 获取熔断状态
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return {'state': self.state, 'failures': self.failures, 'enabled': self.enabled}
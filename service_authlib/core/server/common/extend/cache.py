@@ -0,0 +1,161 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import typing as t
+
+from threading import Lock
+from hashlib import blake2b
+from collections import OrderedDict
+from service_authlib.constants import DEFAULT_NEGATIVE_CACHE_CONFIG
+
+
+def make_cache_key(*parts: t.Any) -> bytes:
+    """ 生成定长的缓存键
+
+    键值可能来自请求参数,统一哈希成16字节避免超长输入撑爆内存
+
+    @param parts: 键组成部分
+    @return: bytes
+    """
+    return blake2b('\x00'.join(map(str, parts)).encode('utf-8'), digest_size=16).digest()
+
+
+class TTLCache(object):
+    """ 有界过期缓存
+
+    超出容量时淘汰最久未使用的条目,过期条目在访问时惰性删除
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60) -> None:
+        """ 初始化实例
+
+        @param maxsize: 最大条目数
+        @param ttl: 默认过期秒数
+        """
+        self.ttl = ttl
+        self.lock = Lock()
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+
+    def __len__(self) -> int:
+        """ 当前条目数
+
+        @return: int
+        """
+        return len(self.data)
+
+    def __contains__(self, key: t.Hashable) -> bool:
+        """ 是否存在未过期条目
+
+        @param key: 缓存键
+        @return: bool
+        """
+        return self.get(key, None) is not None
+
+    def get(self, key: t.Hashable, default: t.Any = None) -> t.Any:
+        """ 获取缓存值
+
+        @param key: 缓存键
+        @param default: 默认值
+        @return: t.Any
+        """
+        with self.lock:
+            item = self.data.get(key, None)
+            if item is None:
+                return default
+            if item[0] < time.monotonic():
+                del self.data[key]
+                return default
+            self.data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: t.Hashable, value: t.Any, ttl: t.Optional[float] = None) -> None:
+        """ 设置缓存值
+
+        @param key: 缓存键
+        @param value: 缓存值
+        @param ttl: 过期秒数
+        @return: None
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.data[key] = (expires_at, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key: t.Hashable) -> bool:
+        """ 删除缓存值
+
+        @param key: 缓存键
+        @return: bool
+        """
+        with self.lock:
+            return self.data.pop(key, None) is not None
+
+    def evict(self, predicate: t.Callable[[t.Any], bool]) -> int:
+        """ 删除满足条件的缓存值
+
+        @param predicate: 缓存值过滤函数
+        @return: int
+        """
+        with self.lock:
+            keys = [k for k, (_, v) in self.data.items() if predicate(v)]
+            for k in keys:
+                del self.data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        """ 清空缓存
+
+        @return: None
+        """
+        with self.lock:
+            self.data.clear()
+
+
+class NegativeCache(object):
+    """ 不存在结果缓存
+
+    记录数据库中确认不存在的标识,短时间内重复查询时直接返回,所有键均哈希为定长
+    """
+
+    def __init__(self, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param config: 缓存配置
+        """
+        self.config = DEFAULT_NEGATIVE_CACHE_CONFIG | (config or {})
+        self.cache = TTLCache(maxsize=self.config['maxsize'])
+
+    def add(self, kind: t.Text, value: t.Text) -> None:
+        """ 记录不存在的标识
+
+        @param kind: 标识类型,如: client, refresh_token
+        @param value: 标识值
+        @return: None
+        """
+        ttl = self.config.get(f'{kind}_ttl', self.cache.ttl)
+        self.cache.set(make_cache_key(kind, value), True, ttl=ttl)
+
+    def contains(self, kind: t.Text, value: t.Text) -> bool:
+        """ 是否已确认不存在
+
+        @param kind: 标识类型
+        @param value: 标识值
+        @return: bool
+        """
+        return make_cache_key(kind, value) in self.cache
+
+    def discard(self, kind: t.Text, value: t.Text) -> None:
+        """ 移除不存在的标识
+
+        @param kind: 标识类型
+        @param value: 标识值
+        @return: None
+        """
+        self.cache.delete(make_cache_key(kind, value))
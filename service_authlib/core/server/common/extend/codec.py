@@ -0,0 +1,181 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import base64
+import hashlib
+import typing as t
+
+from logging import getLogger
+from authlib.oauth2 import OAuth2Request
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from service_authlib.constants import DEFAULT_STATELESS_CODE_CONFIG
+from service_authlib.core.server.common.models.base import make_digest
+
+from .store import LocalTTLStore
+
+logger = getLogger(__name__)
+
+
+class StatelessAuthorizationCode(object):
+    """ 无状态授权码
+
+    由加密授权码解密得到,实现与OAuth2AuthorizationCodeModel相同的读取接口
+    """
+
+    __slots__ = (
+        'code', 'client_id', 'user_id', 'redirect_uri', 'scope', 'nonce',
+        'code_challenge', 'code_challenge_method', 'auth_time', 'expires_at'
+    )
+
+    def __init__(self, code: t.Text, data: t.Dict[t.Text, t.Any]) -> None:
+        """ 初始化实例
+
+        @param code: 授权码
+        @param data: 解密后的授权码数据
+        """
+        self.code = code
+        self.client_id = data['cid']
+        self.user_id = data['uid']
+        self.redirect_uri = data['uri']
+        self.scope = data['scp']
+        self.nonce = data['non']
+        self.code_challenge = data['cc']
+        self.code_challenge_method = data['ccm']
+        self.auth_time = data['iat']
+        self.expires_at = data['exp']
+
+    def get_redirect_uri(self) -> t.Optional[t.Text]:
+        """ 获取重定向地址
+
+        @return: t.Optional[t.Text]
+        """
+        return self.redirect_uri
+
+    def get_scope(self) -> t.Optional[t.Text]:
+        """ 获取授权范围
+
+        @return: t.Optional[t.Text]
+        """
+        return self.scope
+
+    def get_auth_time(self) -> int:
+        """ 获取授权时间
+
+        @return: int
+        """
+        return self.auth_time
+
+    def get_nonce(self) -> t.Optional[t.Text]:
+        """ 获取随机码
+
+        @return: t.Optional[t.Text]
+        """
+        return self.nonce
+
+    def is_expired(self) -> bool:
+        """ 授权码是否过期
+
+        @return: bool
+        """
+        return time.time() > self.expires_at
+
+
+class StatelessCodeCodec(object):
+    """ 无状态授权码编解码器
+
+    授权码为AES-GCM加密的数据块,携带client_id/user_id/redirect_uri/scope/nonce/PKCE/auth_time,
+    签发时不写数据库,兑换时通过TTL存储中的已使用标记保证只能兑换一次
+
+    1. provider_options中stateless_code.key必须配置且在多进程/多实例间保持一致
+    2. nonce同样记录在TTL存储中,用于OpenID防重放检查
+    3. 已使用标记必须对所有进程可见,ttl_store必须配置共享后端,进程内存储无法保证授权码只能兑换一次
+    """
+
+    aad = b'oauth2-authorization-code'
+
+    def __init__(self, server: t.Any, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        @param config: 无状态授权码配置
+        """
+        self.server = server
+        self.config = DEFAULT_STATELESS_CODE_CONFIG | (config or {})
+        key = self.config['key']
+        if not key:
+            raise RuntimeError('stateless_code.key is required in provider_options')
+        if isinstance(server.ttl_store, LocalTTLStore):
+            raise RuntimeError('stateless_code requires a shared ttl_store.backend in provider_options')
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        self.ttl = self.config['ttl']
+        self.aesgcm = AESGCM(hashlib.sha256(key).digest())
+
+    def encode(self, request: OAuth2Request) -> t.Text:
+        """ 生成加密授权码
+
+        @param request: oauth2请求对象
+        @return: t.Text
+        """
+        now = int(time.time())
+        nonce = request.data.get('nonce')
+        data = {
+            'cid': request.client.client_id, 'uid': request.user.id,
+            'uri': request.redirect_uri, 'scp': request.scope, 'non': nonce,
+            'cc': request.data.get('code_challenge'), 'ccm': request.data.get('code_challenge_method'),
+            'iat': now, 'exp': now + self.ttl
+        }
+        iv = os.urandom(12)
+        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        code = base64.urlsafe_b64encode(iv + self.aesgcm.encrypt(iv, payload, self.aad)).rstrip(b'=')
+        if nonce:
+            self.server.ttl_store.set(f'code_nonce:{make_digest(nonce)}', 1, ttl=self.ttl)
+        return code.decode('ascii')
+
+    def decode(self, code: t.Text) -> t.Optional[StatelessAuthorizationCode]:
+        """ 解密授权码
+
+        @param code: 授权码
+        @return: t.Optional[StatelessAuthorizationCode]
+        """
+        try:
+            raw = base64.urlsafe_b64decode(code + '=' * (-len(code) % 4))
+            payload = self.aesgcm.decrypt(raw[:12], raw[12:], self.aad)
+        except (ValueError, InvalidTag):
+            return None
+        return StatelessAuthorizationCode(code, json.loads(payload))
+
+    def claim(self, code: t.Text, client_id: t.Text) -> t.Optional[StatelessAuthorizationCode]:
+        """ 解密授权码并原子地标记为已使用
+
+        @param code: 授权码
+        @param client_id: 客户端id
+        @return: t.Optional[StatelessAuthorizationCode]
+        """
+        instance = self.decode(code)
+        if instance is None or instance.client_id != client_id:
+            logger.warning(f'wrong client_id or code')
+            return None
+        if instance.is_expired():
+            logger.warning(f'code has been expired')
+            return None
+        ttl = max(instance.expires_at - time.time(), 1)
+        if not self.server.ttl_store.add(f'code_spent:{make_digest(code)}', 1, ttl=ttl):
+            logger.warning(f'code has been used')
+            return None
+        return instance
+
+    def exists_nonce(self, nonce: t.Text) -> bool:
+        """ 检查nonce是否已被无状态授权码使用
+
+        @param nonce: 随机码
+        @return: bool
+        """
+        return self.server.ttl_store.get(f'code_nonce:{make_digest(nonce)}') is not None
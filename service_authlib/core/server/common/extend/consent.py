@@ -0,0 +1,154 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import typing as t
+import sqlalchemy as sa
+
+from logging import getLogger
+from datetime import datetime
+from authlib.oauth2.rfc6749.util import list_to_scope
+from authlib.oauth2.rfc6749.util import scope_to_list
+from service_authlib.constants import DEFAULT_CONSENT_CONFIG
+from service_sqlalchemy.core.shortcuts import safe_transaction
+from service_authlib.core.server.common.models.consent import OAuth2ConsentModel
+
+from .cache import TTLCache
+from .cache import make_cache_key
+
+logger = getLogger(__name__)
+
+
+class ConsentStore(object):
+    """ 授权同意记录
+
+    按(用户, 客户端)记录已同意的授权范围和过期时间,请求的授权范围是已同意范围的子集时视为已同意
+
+    1. 查询结果(包括没有记录)缓存cache_ttl秒,记录和撤销时同步失效缓存
+    2. 支持按用户,客户端或(用户, 客户端)批量撤销
+    3. 并发记录同一(用户, 客户端)触发唯一约束冲突时重试为更新
+    """
+
+    def __init__(self, server: t.Any, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        @param config: 同意记录配置
+        """
+        self.server = server
+        self.config = DEFAULT_CONSENT_CONFIG | (config or {})
+        self.table = OAuth2ConsentModel.__table__
+        self.cache = TTLCache(maxsize=self.config['maxsize'], ttl=self.config['cache_ttl'])
+        self.select_stmt = sa.select(self.table.c.id, self.table.c.scope, self.table.c.expires_at).where(
+            self.table.c.user_id == sa.bindparam('user_id'),
+            self.table.c.client_id == sa.bindparam('client_id')
+        ).limit(1)
+
+    def query(self, user_id: t.Any, client_id: t.Text) -> t.Tuple[t.FrozenSet[t.Text], int]:
+        """ 查询已同意的授权范围
+
+        @param user_id: 用户id
+        @param client_id: 客户端id
+        @return: t.Tuple[t.FrozenSet[t.Text], int] 已同意的授权范围和过期时间,没有记录时过期时间为0
+        """
+        key = make_cache_key('consent', user_id, client_id)
+        consent = self.cache.get(key, None)
+        if consent is not None:
+            return consent
+        with safe_transaction(self.server.service.ORM, commit=False) as session:
+            row = session.execute(self.select_stmt, {'user_id': user_id, 'client_id': client_id}).first()
+        consent = (frozenset(scope_to_list(row[1]) or []), row[2]) if row else (frozenset(), 0)
+        # 缓存不能比同意记录活得更久
+        ttl = consent[1] - time.time()
+        self.cache.set(key, consent, ttl=min(self.cache.ttl, ttl) if ttl > 0 else None)
+        return consent
+
+    def has_consent(self, user_id: t.Any, client_id: t.Text, scope: t.Optional[t.Text] = None) -> bool:
+        """ 是否已同意授权范围
+
+        @param user_id: 用户id
+        @param client_id: 客户端id
+        @param scope: 请求的授权范围
+        @return: bool
+        """
+        scopes, expires_at = self.query(user_id, client_id)
+        if expires_at <= time.time():
+            return False
+        return set(scope_to_list(scope) or []) <= scopes
+
+    def remember(
+            self,
+            user_id: t.Any,
+            client_id: t.Text,
+            scope: t.Optional[t.Text] = None,
+            ttl: t.Optional[int] = None
+    ) -> None:
+        """ 记录同意的授权范围,与未过期的已同意范围合并
+
+        @param user_id: 用户id
+        @param client_id: 客户端id
+        @param scope: 同意的授权范围
+        @param ttl: 有效秒数
+        @return: None
+        """
+        now = int(time.time())
+        expires_at = now + (self.config['ttl'] if ttl is None else ttl)
+        params = {'user_id': user_id, 'client_id': client_id}
+        for attempt in range(2):
+            try:
+                with safe_transaction(self.server.service.ORM, commit=True) as session:
+                    row = session.execute(self.select_stmt, params).first()
+                    scopes = set(scope_to_list(scope) or [])
+                    if row and row[2] > now:
+                        scopes |= set(scope_to_list(row[1]) or [])
+                    values = {'scope': list_to_scope(sorted(scopes)), 'expires_at': expires_at}
+                    if row:
+                        # Core语句不会触发su.Timestamp的更新事件,需要显式更新updated
+                        stmt = self.table.update().where(self.table.c.id == row[0])
+                        session.execute(stmt.values(values | {'updated': datetime.utcnow()}))
+                    else:
+                        session.execute(self.table.insert().values(values | params))
+                break
+            except sa.exc.IntegrityError:
+                # 并发请求已插入同一(用户, 客户端)的记录,重试一次即按更新合并
+                if attempt:
+                    raise
+                logger.debug(f'retry remember consent with user_id={user_id}, client_id={client_id}')
+        logger.debug(f'remember consent with user_id={user_id}, client_id={client_id}, scope={values["scope"]}')
+        self.discard(user_id, client_id)
+
+    def revoke(self, user_id: t.Optional[t.Any] = None, client_id: t.Optional[t.Text] = None) -> int:
+        """ 批量撤销同意记录
+
+        @param user_id: 用户id
+        @param client_id: 客户端id
+        @return: int 撤销的记录数
+        """
+        if user_id is None and client_id is None:
+            raise ValueError('revoke requires user_id or client_id')
+        where = []
+        if user_id is not None:
+            where.append(self.table.c.user_id == user_id)
+        if client_id is not None:
+            where.append(self.table.c.client_id == client_id)
+        with safe_transaction(self.server.service.ORM, commit=True) as session:
+            count = session.execute(self.table.delete().where(*where)).rowcount
+        self.discard(user_id, client_id)
+        logger.info(f'revoke consents with user_id={user_id}, client_id={client_id}, consents={count}')
+        return count
+
+    def discard(self, user_id: t.Optional[t.Any] = None, client_id: t.Optional[t.Text] = None) -> None:
+        """ 失效同意记录缓存
+
+        @param user_id: 用户id
+        @param client_id: 客户端id
+        @return: None
+        """
+        if user_id is not None and client_id is not None:
+            self.cache.delete(make_cache_key('consent', user_id, client_id))
+            return
+        # 按用户或客户端批量失效时缓存键为哈希,只能清空
+        self.cache.clear()
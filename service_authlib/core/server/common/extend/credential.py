@@ -0,0 +1,132 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import os
+import hmac
+import typing as t
+
+from logging import getLogger
+from authlib.oauth2 import OAuth2Request
+from authlib.oauth2.rfc6749 import InvalidClientError
+from authlib.oauth2.rfc6749.util import extract_basic_authorization
+from service_authlib.constants import DEFAULT_CLIENT_SECRET_CACHE_CONFIG
+
+from .cache import TTLCache
+
+logger = getLogger(__name__)
+
+
+class VerifiedCredentialCache(object):
+    """ 客户端密钥校验结果缓存
+
+    密钥以bcrypt/argon2等哈希存储时每次校验都很耗CPU,校验成功后按HMAC(client_id, client_secret)缓存一段时间
+
+    1. 缓存值记录校验时数据库中的密钥哈希,密钥轮换后哈希不一致自动失效
+    2. 客户端更新时通过discard_client主动删除该客户端的全部缓存
+    """
+
+    def __init__(self, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param config: 缓存配置
+        """
+        self.config = DEFAULT_CLIENT_SECRET_CACHE_CONFIG | (config or {})
+        secret_key = self.config['secret_key']
+        self.secret_key = secret_key.encode('utf-8') if secret_key else os.urandom(32)
+        self.cache = TTLCache(maxsize=self.config['maxsize'], ttl=self.config['ttl'])
+
+    def make_key(self, client_id: t.Text, client_secret: t.Text) -> bytes:
+        """ 生成缓存键
+
+        @param client_id: 客户端id
+        @param client_secret: 客户端密钥明文
+        @return: bytes
+        """
+        message = f'{client_id}\x00{client_secret}'.encode('utf-8')
+        return hmac.new(self.secret_key, message, 'sha256').digest()
+
+    def check_client_secret(self, client: t.Any, client_secret: t.Text) -> bool:
+        """ 校验客户端密钥
+
+        @param client: 客户端对象
+        @param client_secret: 客户端密钥明文
+        @return: bool
+        """
+        key = self.make_key(client.client_id, client_secret)
+        if self.cache.get(key, None) == (client.client_id, client.client_secret):
+            return True
+        if not client.check_client_secret(client_secret):
+            return False
+        self.cache.set(key, (client.client_id, client.client_secret))
+        return True
+
+    def discard_client(self, client_id: t.Text) -> int:
+        """ 删除客户端的全部缓存
+
+        @param client_id: 客户端id
+        @return: int
+        """
+        return self.cache.evict(lambda v: v[0] == client_id)
+
+    def validate_client(
+            self,
+            query_client: t.Callable[[t.Text], t.Any],
+            client_id: t.Optional[t.Text],
+            request: OAuth2Request,
+            status_code: int = 400
+    ) -> t.Any:
+        """ 查询并校验客户端存在
+
+        @param query_client: 客户端查询函数
+        @param client_id: 客户端id
+        @param request: 请求对象
+        @param status_code: 失败时状态码
+        @return: t.Any
+        """
+        client = query_client(client_id) if client_id else None
+        if not client:
+            raise InvalidClientError(state=request.state, status_code=status_code)
+        return client
+
+    def authenticate_client_secret_basic(
+            self, query_client: t.Callable[[t.Text], t.Any], request: OAuth2Request
+    ) -> t.Optional[t.Any]:
+        """ 通过Basic Auth认证客户端
+
+        @param query_client: 客户端查询函数
+        @param request: 请求对象
+        @return: t.Optional[t.Any]
+        """
+        client_id, client_secret = extract_basic_authorization(request.headers)
+        if not client_id or not client_secret:
+            return None
+        client = self.validate_client(query_client, client_id, request, status_code=401)
+        if client.check_token_endpoint_auth_method('client_secret_basic') \
+                and self.check_client_secret(client, client_secret):
+            return client
+        logger.debug(f'authenticate {client_id} via client_secret_basic failed')
+        return None
+
+    def authenticate_client_secret_post(
+            self, query_client: t.Callable[[t.Text], t.Any], request: OAuth2Request
+    ) -> t.Optional[t.Any]:
+        """ 通过Post表单认证客户端
+
+        @param query_client: 客户端查询函数
+        @param request: 请求对象
+        @return: t.Optional[t.Any]
+        """
+        # 与authlib一致只读取请求体,不接受通过查询参数传递的密钥,避免密钥出现在访问日志和代理中
+        client_id = request.form.get('client_id')
+        client_secret = request.form.get('client_secret')
+        if not client_id or not client_secret:
+            return None
+        client = self.validate_client(query_client, client_id, request)
+        if client.check_token_endpoint_auth_method('client_secret_post') \
+                and self.check_client_secret(client, client_secret):
+            return client
+        logger.debug(f'authenticate {client_id} via client_secret_post failed')
+        return None
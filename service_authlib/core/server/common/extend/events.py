@@ -0,0 +1,348 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import uuid
+import typing as t
+import sqlalchemy as sa
+
+from queue import Empty
+from queue import Queue
+from threading import Lock
+from threading import Event
+from threading import Thread
+from logging import getLogger
+from collections import OrderedDict
+from service_sqlalchemy.core.shortcuts import safe_transaction
+from service_core.core.as_loader import load_dot_path_colon_obj
+from service_authlib.constants import DEFAULT_INVALIDATION_CONFIG
+from service_authlib.core.server.common.models.event import OAuth2EventModel
+
+logger = getLogger(__name__)
+
+# 失效事件: (发布节点, 事件类型, 失效键)
+InvalidationEvent = t.Tuple[t.Text, t.Text, t.Text]
+
+
+class InvalidationChannel(object):
+    """ 缓存失效通道基类
+
+    共享后端(如Redis Pub/Sub)需继承此类并实现publish和poll方法
+    """
+
+    def publish(self, events: t.List[InvalidationEvent]) -> None:
+        """ 批量发布失效事件
+
+        @param events: 失效事件列表
+        @return: None
+        """
+        raise NotImplementedError()
+
+    def poll(self, limit: int) -> t.List[InvalidationEvent]:
+        """ 拉取其它节点发布的失效事件
+
+        @param limit: 最多拉取的事件数
+        @return: t.List[InvalidationEvent]
+        """
+        raise NotImplementedError()
+
+    def cleanup(self) -> None:
+        """ 清理过期事件
+
+        @return: None
+        """
+
+
+class LocalInvalidationChannel(InvalidationChannel):
+    """ 进程内发布订阅通道
+
+    同一进程内同名通道的订阅者互相可见,用于测试或替代共享的发布订阅后端
+    """
+
+    lock = Lock()
+    subscribers = {}
+
+    def __init__(self, name: t.Text = 'default') -> None:
+        """ 初始化实例
+
+        @param name: 通道名
+        """
+        self.name = name
+        self.queue = Queue()
+        with self.lock:
+            self.subscribers.setdefault(name, []).append(self.queue)
+
+    def publish(self, events: t.List[InvalidationEvent]) -> None:
+        """ 批量发布失效事件
+
+        @param events: 失效事件列表
+        @return: None
+        """
+        with self.lock:
+            queues = list(self.subscribers.get(self.name, []))
+        for queue in queues:
+            queue.put(events)
+
+    def poll(self, limit: int) -> t.List[InvalidationEvent]:
+        """ 拉取其它节点发布的失效事件
+
+        @param limit: 最多拉取的事件数
+        @return: t.List[InvalidationEvent]
+        """
+        events = []
+        while len(events) < limit:
+            try:
+                events.extend(self.queue.get_nowait())
+            except Empty:
+                break
+        return events
+
+    def close(self) -> None:
+        """ 取消订阅
+
+        @return: None
+        """
+        with self.lock:
+            queues = self.subscribers.get(self.name, [])
+            if self.queue in queues:
+                queues.remove(self.queue)
+
+
+class DatabaseInvalidationChannel(InvalidationChannel):
+    """ 数据库轮询通道
+
+    事件写入oauth2_event表,各节点记录已处理的最大id并按id递增轮询,不依赖额外的中间件
+
+    1. 并发事务的提交顺序与id顺序不一致,较小的id可能晚于较大的id可见
+    2. 轮询时跳过的id作为空洞记录,之后的轮询同时拉取空洞id,空洞超过gap_timeout秒仍未出现时视为已回滚
+    """
+
+    def __init__(
+            self,
+            server: t.Any,
+            retention: float = 3600,
+            gap_timeout: float = 30,
+            max_gaps: int = 1000
+    ) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        @param retention: 事件保留秒数
+        @param gap_timeout: 等待id空洞的秒数
+        @param max_gaps: 最多跟踪的id空洞数
+        """
+        self.server = server
+        self.retention = retention
+        self.gap_timeout = gap_timeout
+        self.max_gaps = max_gaps
+        self.table = OAuth2EventModel.__table__
+        self.last_id = None
+        self.gaps = OrderedDict()
+        self.poll_stmt = sa.select(
+            self.table.c.id, self.table.c.node, self.table.c.kind, self.table.c.key
+        ).where(sa.or_(
+            self.table.c.id > sa.bindparam('last_id'),
+            self.table.c.id.in_(sa.bindparam('gaps', expanding=True))
+        )).order_by(self.table.c.id).limit(sa.bindparam('limit'))
+
+    def publish(self, events: t.List[InvalidationEvent]) -> None:
+        """ 批量发布失效事件
+
+        @param events: 失效事件列表
+        @return: None
+        """
+        now = int(time.time())
+        values = [{'node': node, 'kind': kind, 'key': key, 'created_at': now} for node, kind, key in events]
+        with safe_transaction(self.server.service.ORM, commit=True) as session:
+            session.execute(self.table.insert(), values)
+
+    def poll(self, limit: int) -> t.List[InvalidationEvent]:
+        """ 拉取其它节点发布的失效事件,首次拉取只记录当前最大id
+
+        @param limit: 最多拉取的事件数
+        @return: t.List[InvalidationEvent]
+        """
+        with safe_transaction(self.server.service.ORM, commit=False) as session:
+            if self.last_id is None:
+                self.last_id = session.execute(sa.select(sa.func.max(self.table.c.id))).scalar() or 0
+                return []
+            params = {'last_id': self.last_id, 'gaps': list(self.gaps), 'limit': limit}
+            rows = session.execute(self.poll_stmt, params).fetchall()
+        self.track_gaps([row[0] for row in rows])
+        return [(node, kind, key) for _, node, kind, key in rows]
+
+    def track_gaps(self, ids: t.List[int]) -> None:
+        """ 根据拉取到的id更新最大id和id空洞
+
+        @param ids: 按顺序拉取到的id列表
+        @return: None
+        """
+        now = time.monotonic()
+        for event_id in ids:
+            if event_id <= self.last_id:
+                self.gaps.pop(event_id, None)
+                continue
+            # 只跟踪离新id最近的max_gaps个空洞
+            for missing in range(max(self.last_id + 1, event_id - self.max_gaps), event_id):
+                self.gaps[missing] = now
+            self.last_id = event_id
+        while self.gaps:
+            missing, since = next(iter(self.gaps.items()))
+            if len(self.gaps) <= self.max_gaps and now - since <= self.gap_timeout:
+                break
+            self.gaps.popitem(last=False)
+
+    def cleanup(self) -> None:
+        """ 清理过期事件
+
+        @return: None
+        """
+        stmt = self.table.delete().where(self.table.c.created_at < int(time.time() - self.retention))
+        with safe_transaction(self.server.service.ORM, commit=True) as session:
+            session.execute(stmt)
+
+
+class InvalidationBus(object):
+    """ 缓存失效总线
+
+    本节点的失效事件先在本地生效,再合并后批量发布,后台线程按间隔发布并拉取其它节点的事件
+
+    1. 同一间隔内相同(类型, 键)的事件只发布一次,拉取到的事件同样去重后再应用,批量撤销不会引起失效风暴
+    2. 事件携带节点id,节点忽略自己发布的事件
+    """
+
+    def __init__(self, server: t.Any, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        @param config: 失效总线配置
+        """
+        self.server = server
+        self.config = DEFAULT_INVALIDATION_CONFIG | (config or {})
+        self.node = uuid.uuid4().hex
+        self.lock = Lock()
+        self.pending = OrderedDict()
+        self.stopped = Event()
+        self.thread = None
+        self.synced_at = None
+        self.channel = self.create_channel()
+
+    def create_channel(self) -> InvalidationChannel:
+        """ 根据配置创建失效通道
+
+        @return: InvalidationChannel
+        """
+        backend = self.config['backend']
+        options = self.config['backend_options'] or {}
+        if isinstance(backend, InvalidationChannel):
+            return backend
+        if backend == 'local':
+            return LocalInvalidationChannel(**options)
+        if backend == 'database':
+            return DatabaseInvalidationChannel(
+                self.server, retention=self.config['retention'],
+                gap_timeout=self.config['gap_timeout'], max_gaps=self.config['max_gaps']
+            )
+        return load_dot_path_colon_obj(backend)[-1](**options)
+
+    def publish(self, kind: t.Text, key: t.Text) -> None:
+        """ 登记待发布的失效事件
+
+        @param kind: 事件类型
+        @param key: 失效键
+        @return: None
+        """
+        with self.lock:
+            self.pending[(kind, key)] = None
+
+    def flush(self) -> int:
+        """ 合并发布待发布的失效事件,发布失败时未发布的事件重新排队等待下次发布
+
+        @return: int 发布的事件数
+        """
+        with self.lock:
+            pending, self.pending = list(self.pending), OrderedDict()
+        batch_size = self.config['batch_size']
+        for i in range(0, len(pending), batch_size):
+            try:
+                self.channel.publish([(self.node, kind, key) for kind, key in pending[i:i + batch_size]])
+            except Exception:
+                with self.lock:
+                    failed = OrderedDict.fromkeys(pending[i:])
+                    failed.update(self.pending)
+                    self.pending = failed
+                raise
+        return len(pending)
+
+    def receive(self) -> int:
+        """ 拉取并应用其它节点的失效事件
+
+        @return: int 应用的事件数
+        """
+        events = OrderedDict()
+        for node, kind, key in self.channel.poll(self.config['batch_size']):
+            if node != self.node:
+                events[(kind, key)] = None
+        for kind, key in events:
+            self.server.apply_invalidation(kind, key)
+        self.synced_at = time.monotonic()
+        return len(events)
+
+    def is_current(self) -> bool:
+        """ 最近是否成功拉取过其它节点的失效事件
+
+        @return: bool
+        """
+        return self.synced_at is not None and time.monotonic() - self.synced_at <= self.config['max_lag']
+
+    def run_once(self) -> None:
+        """ 执行一次发布和拉取
+
+        @return: None
+        """
+        try:
+            self.flush()
+            self.receive()
+        except Exception as e:
+            logger.warning(f'sync oauth2 invalidation events failed, {e}')
+
+    def run(self) -> None:
+        """ 后台线程循环
+
+        @return: None
+        """
+        last_cleanup = time.monotonic()
+        while not self.stopped.wait(self.config['interval']):
+            self.run_once()
+            if time.monotonic() - last_cleanup > self.config['retention']:
+                last_cleanup = time.monotonic()
+                try:
+                    self.channel.cleanup()
+                except Exception as e:
+                    logger.warning(f'cleanup oauth2 invalidation events failed, {e}')
+        self.run_once()
+
+    def start(self) -> None:
+        """ 启动后台线程
+
+        @return: None
+        """
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = Thread(target=self.run, name='oauth2-invalidation', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """ 停止后台线程,停止前发布剩余事件
+
+        @return: None
+        """
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
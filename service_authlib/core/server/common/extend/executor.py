@@ -0,0 +1,146 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import typing as t
+
+from threading import Lock
+from concurrent.futures import Executor
+from concurrent.futures import TimeoutError
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from service_authlib.core.server.common.errors import TemporarilyUnavailableError
+
+
+def timed_call(func: t.Callable[..., t.Any], args: t.Tuple[t.Any, ...]) -> t.Tuple[float, t.Any]:
+    """ 执行任务并返回开始时间
+
+    进程池中执行时也需要被pickle,所以必须是模块级函数
+
+    @param func: 任务函数
+    @param args: 任务参数
+    @return: t.Tuple[float, t.Any]
+    """
+    return time.time(), func(*args)
+
+
+class BoundedExecutor(object):
+    """ 有界执行器
+
+    将bcrypt/argon2/pbkdf2等耗CPU的计算放到独立的线程池或进程池中执行,避免阻塞同一个worker上的其它请求
+
+    1. max_workers限制同时执行的任务数
+    2. max_queue限制排队的任务数,超出后立即拒绝
+    3. 统计提交,拒绝,超时,完成数以及排队等待时间
+    """
+
+    def __init__(self, kind: t.Text = 'thread', max_workers: int = 4, max_queue: int = 64) -> None:
+        """ 初始化实例
+
+        @param kind: 执行器类型,可选thread,process
+        @param max_workers: 最大并发数
+        @param max_queue: 最大排队数
+        """
+        self.kind = kind
+        self.lock = Lock()
+        self.pool = None
+        self.max_queue = max_queue
+        self.max_workers = max_workers
+        self.pending = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.completed = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def create_pool(self) -> Executor:
+        """ 创建执行池
+
+        @return: Executor
+        """
+        if self.kind == 'process':
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='service_authlib')
+
+    def run(self, func: t.Callable[..., t.Any], *args: t.Any, timeout: t.Optional[float] = None) -> t.Any:
+        """ 提交任务并等待结果
+
+        @param func: 任务函数,进程池时必须可被pickle
+        @param args: 任务参数
+        @param timeout: 等待超时秒数
+        @return: t.Any
+        """
+        with self.lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise TemporarilyUnavailableError(retry_after=1, description='Too many pending credential checks')
+            if self.pool is None:
+                self.pool = self.create_pool()
+            self.pending += 1
+            self.submitted += 1
+        queued_at = time.time()
+        try:
+            future = self.pool.submit(timed_call, func, args)
+        except Exception:
+            # 提交失败(执行池已关闭,进程池参数无法pickle等)时不会触发on_done,需要归还计数
+            with self.lock:
+                self.pending -= 1
+                self.submitted -= 1
+            raise
+        future.add_done_callback(self.on_done)
+        try:
+            started_at, result = future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            with self.lock:
+                self.timeouts += 1
+            raise TemporarilyUnavailableError(retry_after=1, description='Credential check timed out')
+        waited = max(started_at - queued_at, 0.0)
+        with self.lock:
+            self.total_wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+        return result
+
+    def on_done(self, future: t.Any) -> None:
+        """ 任务结束回调
+
+        @param future: 任务对象
+        @return: None
+        """
+        with self.lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 获取执行器统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self.lock:
+            return {
+                'kind': self.kind,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'pending': self.pending,
+                'queued': max(self.pending - self.max_workers, 0),
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'completed': self.completed,
+                'avg_wait_time': self.total_wait_time / self.completed if self.completed else 0.0,
+                'max_wait_time': self.max_wait_time
+            }
+
+    def shutdown(self) -> None:
+        """ 关闭执行池
+
+        @return: None
+        """
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
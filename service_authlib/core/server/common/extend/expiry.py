@@ -0,0 +1,102 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import typing as t
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# 令牌状态位,多个状态按位或
+TOKEN_VALID = 0
+TOKEN_EXPIRED = 1
+TOKEN_REVOKED = 2
+TOKEN_MISSING = 4
+
+
+def evaluate_expiry(
+        issued_at: t.Sequence[t.Optional[int]],
+        expires_in: t.Sequence[t.Optional[int]],
+        revoked: t.Sequence[t.Optional[bool]],
+        now: t.Optional[float] = None,
+        use_numpy: t.Optional[bool] = None
+) -> bytes:
+    """ 批量计算令牌过期和撤销状态
+
+    三个等长的列数组一次计算,安装了numpy时向量化计算,否则逐行计算,结果完全一致
+
+    1. now > issued_at + expires_in视为过期,与is_expired一致
+    2. issued_at为None表示令牌不存在,状态为TOKEN_MISSING
+    3. 返回每个令牌一个字节的状态掩码,0表示有效,可通过bytes.count(0)统计有效令牌数
+
+    @param issued_at: 签发时间列
+    @param expires_in: 有效秒数列
+    @param revoked: 是否撤销列
+    @param now: 当前时间,默认time.time()
+    @param use_numpy: 是否使用numpy,默认安装了numpy时使用
+    @return: bytes
+    """
+    if not len(issued_at) == len(expires_in) == len(revoked):
+        raise ValueError('issued_at, expires_in and revoked must have the same length')
+    now = time.time() if now is None else now
+    use_numpy = numpy is not None if use_numpy is None else use_numpy
+    if use_numpy and numpy is None:
+        raise RuntimeError('vectorized expiry requires numpy, please run pip install numpy')
+    if use_numpy:
+        return evaluate_expiry_numpy(issued_at, expires_in, revoked, now)
+    return evaluate_expiry_python(issued_at, expires_in, revoked, now)
+
+
+def evaluate_expiry_numpy(
+        issued_at: t.Sequence[t.Optional[int]],
+        expires_in: t.Sequence[t.Optional[int]],
+        revoked: t.Sequence[t.Optional[bool]],
+        now: float
+) -> bytes:
+    """ 向量化计算令牌状态
+
+    @param issued_at: 签发时间列
+    @param expires_in: 有效秒数列
+    @param revoked: 是否撤销列
+    @param now: 当前时间
+    @return: bytes
+    """
+    issued = numpy.array(issued_at, dtype=numpy.float64)
+    expires = numpy.array(expires_in, dtype=numpy.float64)
+    missing = numpy.isnan(issued)
+    expired = ~missing & (now > issued + numpy.nan_to_num(expires))
+    mask = expired.astype(numpy.uint8) * TOKEN_EXPIRED
+    mask |= numpy.array(revoked, dtype=bool).astype(numpy.uint8) * TOKEN_REVOKED
+    mask[missing] = TOKEN_MISSING
+    return mask.tobytes()
+
+
+def evaluate_expiry_python(
+        issued_at: t.Sequence[t.Optional[int]],
+        expires_in: t.Sequence[t.Optional[int]],
+        revoked: t.Sequence[t.Optional[bool]],
+        now: float
+) -> bytes:
+    """ 逐行计算令牌状态
+
+    @param issued_at: 签发时间列
+    @param expires_in: 有效秒数列
+    @param revoked: 是否撤销列
+    @param now: 当前时间
+    @return: bytes
+    """
+    mask = bytearray(len(issued_at))
+    for i, (issued, expires, is_revoked) in enumerate(zip(issued_at, expires_in, revoked)):
+        if issued is None:
+            mask[i] = TOKEN_MISSING
+            continue
+        if now > issued + (expires or 0):
+            mask[i] |= TOKEN_EXPIRED
+        if is_revoked:
+            mask[i] |= TOKEN_REVOKED
+    return bytes(mask)
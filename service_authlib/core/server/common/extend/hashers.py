@@ -0,0 +1,221 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import hmac
+import base64
+import hashlib
+import typing as t
+
+from authlib.common.security import generate_token
+
+try:
+    import bcrypt
+except ImportError:
+    bcrypt = None
+
+try:
+    from argon2 import PasswordHasher as Argon2PasswordHasher
+    from argon2.exceptions import VerificationError as Argon2VerificationError
+except ImportError:
+    Argon2PasswordHasher = None
+    Argon2VerificationError = None
+
+
+class BaseHasher(object):
+    """ 哈希器基类 """
+
+    algorithm = None
+
+    def identify(self, encoded: t.Text) -> bool:
+        """ 是否由当前哈希器生成
+
+        @param encoded: 哈希值
+        @return: bool
+        """
+        return encoded.startswith(f'{self.algorithm}$')
+
+    def encode(self, raw: t.Text) -> t.Text:
+        """ 生成哈希值
+
+        @param raw: 明文
+        @return: t.Text
+        """
+        raise NotImplementedError()
+
+    def verify(self, raw: t.Text, encoded: t.Text) -> bool:
+        """ 校验明文与哈希值
+
+        @param raw: 明文
+        @param encoded: 哈希值
+        @return: bool
+        """
+        raise NotImplementedError()
+
+
+class PBKDF2Hasher(BaseHasher):
+    """ PBKDF2哈希器
+
+    格式: pbkdf2_sha256$<iterations>$<salt>$<hash>
+    """
+
+    algorithm = 'pbkdf2_sha256'
+    iterations = 260000
+
+    def encode(self, raw: t.Text, salt: t.Optional[t.Text] = None, iterations: t.Optional[int] = None) -> t.Text:
+        """ 生成哈希值
+
+        @param raw: 明文
+        @param salt: 盐值
+        @param iterations: 迭代次数
+        @return: t.Text
+        """
+        salt = salt or generate_token(22)
+        iterations = iterations or self.iterations
+        digest = hashlib.pbkdf2_hmac('sha256', raw.encode('utf-8'), salt.encode('utf-8'), iterations)
+        return f'{self.algorithm}${iterations}${salt}${base64.b64encode(digest).decode("ascii")}'
+
+    def verify(self, raw: t.Text, encoded: t.Text) -> bool:
+        """ 校验明文与哈希值
+
+        @param raw: 明文
+        @param encoded: 哈希值
+        @return: bool
+        """
+        # 格式错误的哈希值按校验失败处理
+        try:
+            algorithm, iterations, salt, _ = encoded.split('$', 3)
+            iterations = int(iterations)
+        except ValueError:
+            return False
+        if iterations <= 0:
+            return False
+        return hmac.compare_digest(encoded, self.encode(raw, salt=salt, iterations=iterations))
+
+
+class BcryptHasher(BaseHasher):
+    """ Bcrypt哈希器
+
+    依赖: pip install bcrypt
+    """
+
+    algorithm = 'bcrypt'
+
+    def identify(self, encoded: t.Text) -> bool:
+        """ 是否由当前哈希器生成
+
+        @param encoded: 哈希值
+        @return: bool
+        """
+        return encoded.startswith(('$2a$', '$2b$', '$2y$'))
+
+    def encode(self, raw: t.Text) -> t.Text:
+        """ 生成哈希值
+
+        @param raw: 明文
+        @return: t.Text
+        """
+        if bcrypt is None:
+            raise RuntimeError('bcrypt hasher requires bcrypt, please run pip install bcrypt')
+        return bcrypt.hashpw(raw.encode('utf-8'), bcrypt.gensalt()).decode('ascii')
+
+    def verify(self, raw: t.Text, encoded: t.Text) -> bool:
+        """ 校验明文与哈希值
+
+        @param raw: 明文
+        @param encoded: 哈希值
+        @return: bool
+        """
+        if bcrypt is None:
+            raise RuntimeError('bcrypt hasher requires bcrypt, please run pip install bcrypt')
+        try:
+            return bcrypt.checkpw(raw.encode('utf-8'), encoded.encode('ascii'))
+        except ValueError:
+            return False
+
+
+class Argon2Hasher(BaseHasher):
+    """ Argon2哈希器
+
+    依赖: pip install argon2-cffi
+    """
+
+    algorithm = 'argon2'
+
+    def identify(self, encoded: t.Text) -> bool:
+        """ 是否由当前哈希器生成
+
+        @param encoded: 哈希值
+        @return: bool
+        """
+        return encoded.startswith('$argon2')
+
+    def encode(self, raw: t.Text) -> t.Text:
+        """ 生成哈希值
+
+        @param raw: 明文
+        @return: t.Text
+        """
+        if Argon2PasswordHasher is None:
+            raise RuntimeError('argon2 hasher requires argon2-cffi, please run pip install argon2-cffi')
+        return Argon2PasswordHasher().hash(raw)
+
+    def verify(self, raw: t.Text, encoded: t.Text) -> bool:
+        """ 校验明文与哈希值
+
+        @param raw: 明文
+        @param encoded: 哈希值
+        @return: bool
+        """
+        if Argon2PasswordHasher is None:
+            raise RuntimeError('argon2 hasher requires argon2-cffi, please run pip install argon2-cffi')
+        try:
+            return Argon2PasswordHasher().verify(encoded, raw)
+        except Argon2VerificationError:
+            return False
+
+
+HASHERS = {h.algorithm: h for h in (PBKDF2Hasher(), BcryptHasher(), Argon2Hasher())}
+
+
+def identify_hasher(encoded: t.Optional[t.Text]) -> t.Optional[BaseHasher]:
+    """ 识别哈希值对应的哈希器
+
+    @param encoded: 哈希值
+    @return: t.Optional[BaseHasher]
+    """
+    if not encoded:
+        return None
+    for hasher in HASHERS.values():
+        if hasher.identify(encoded):
+            return hasher
+    return None
+
+
+def make_password(raw: t.Text, algorithm: t.Text = PBKDF2Hasher.algorithm) -> t.Text:
+    """ 生成明文的哈希值
+
+    @param raw: 明文
+    @param algorithm: 哈希算法
+    @return: t.Text
+    """
+    return HASHERS[algorithm].encode(raw)
+
+
+def check_password(raw: t.Optional[t.Text], encoded: t.Optional[t.Text]) -> bool:
+    """ 校验明文与哈希值
+
+    无法识别的哈希值按明文比较,兼容历史数据
+
+    @param raw: 明文
+    @param encoded: 哈希值
+    @return: bool
+    """
+    if not raw or not encoded:
+        return False
+    hasher = identify_hasher(encoded)
+    if hasher is None:
+        return hmac.compare_digest(raw.encode('utf-8'), encoded.encode('utf-8'))
+    return hasher.verify(raw, encoded)
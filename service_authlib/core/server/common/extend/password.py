@@ -0,0 +1,96 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from logging import getLogger
+from authlib.common.security import generate_token
+from service_authlib.constants import DEFAULT_PASSWORD_GRANT_CONFIG
+from service_authlib.core.server.common.models.user import OAuth2UserModel
+
+from .hashers import make_password
+from .hashers import check_password
+from .hashers import identify_hasher
+from .executor import BoundedExecutor
+
+logger = getLogger(__name__)
+
+
+class PasswordAuthenticator(object):
+    """ 密码模式用户认证器
+
+    按用户名查询oauth2_user表,并在有界执行器中校验password字段中的密码哈希
+
+    1. 只接受可识别的哈希格式(pbkdf2_sha256,bcrypt,argon2),明文密码一律认证失败
+    2. 用户不存在或密码不是哈希时同样校验一次固定的哈希,避免通过响应时间枚举用户名
+    3. 自定义认证器可继承此类并通过password_grant.authenticator配置注入,query_user返回(用户, 密码哈希)
+    4. 密码哈希只在认证时单独查询,不会进入用户快照和缓存
+    """
+
+    def __init__(self, server: t.Any, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        @param config: 密码模式配置
+        """
+        self.server = server
+        self.config = DEFAULT_PASSWORD_GRANT_CONFIG | (config or {})
+        self.executor = BoundedExecutor(
+            kind=self.config['executor'],
+            max_workers=self.config['max_workers'],
+            max_queue=self.config['max_queue']
+        )
+        # 用户不存在时用于对齐耗时的哈希,明文随机生成,任何密码都不会校验通过
+        self.dummy_password = make_password(generate_token(32))
+
+    def query_user(self, username: t.Text) -> t.Optional[t.Tuple[OAuth2UserModel, t.Optional[t.Text]]]:
+        """ 按用户名查询用户及密码哈希
+
+        @param username: 用户名
+        @return: t.Optional[t.Tuple[OAuth2UserModel, t.Optional[t.Text]]]
+        """
+        logger.debug(f'query oauth2 user with name={username}')
+        return self.server.repository.get_user_password(username)
+
+    def verify_password(self, password: t.Text, encoded: t.Optional[t.Text]) -> bool:
+        """ 在执行器中校验密码
+
+        @param password: 密码明文
+        @param encoded: 密码哈希
+        @return: bool
+        """
+        if identify_hasher(encoded) is None:
+            return False
+        return self.executor.run(check_password, password, encoded, timeout=self.config['timeout'])
+
+    def authenticate(self, username: t.Text, password: t.Text) -> t.Optional[OAuth2UserModel]:
+        """ 认证用户
+
+        @param username: 用户名
+        @param password: 密码明文
+        @return: t.Optional[OAuth2UserModel]
+        """
+        result = self.query_user(username)
+        if not result:
+            self.verify_password(password, self.dummy_password)
+            logger.warning(f'wrong username')
+            return None
+        user, encoded = result
+        if identify_hasher(encoded) is None:
+            self.verify_password(password, self.dummy_password)
+            logger.warning(f'wrong password')
+            return None
+        if not self.verify_password(password, encoded):
+            logger.warning(f'wrong password')
+            return None
+        return user
+
+    def stats(self) -> t.Dict[t.Text, t.Any]:
+        """ 获取密码校验执行器统计
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return self.executor.stats()
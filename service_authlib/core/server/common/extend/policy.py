@@ -0,0 +1,134 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from logging import getLogger
+from service_authlib.constants import DEFAULT_TOKEN_POLICY_CONFIG
+
+from .cache import TTLCache
+
+logger = getLogger(__name__)
+
+
+class TokenPolicy(object):
+    """ 客户端令牌策略 """
+
+    __slots__ = ('expires_in', 'default_expires_in', 'refresh_token')
+
+    def __init__(
+            self,
+            expires_in: t.Optional[t.Dict[t.Text, int]] = None,
+            default_expires_in: t.Optional[int] = None,
+            refresh_token: t.Optional[bool] = None
+    ) -> None:
+        """ 初始化实例
+
+        @param expires_in: 按授权类型配置的有效秒数
+        @param default_expires_in: 未按授权类型配置时的有效秒数
+        @param refresh_token: 是否签发刷新令牌,None表示由授权类决定
+        """
+        self.expires_in = expires_in or {}
+        self.default_expires_in = default_expires_in
+        self.refresh_token = refresh_token
+
+    def get_expires_in(self, grant_type: t.Text) -> t.Optional[int]:
+        """ 获取有效秒数
+
+        @param grant_type: 授权类型
+        @return: t.Optional[int] None表示使用全局配置
+        """
+        return self.expires_in.get(grant_type, self.default_expires_in)
+
+    def include_refresh_token(self, include_refresh_token: bool) -> bool:
+        """ 是否签发刷新令牌,策略只能关闭授权类原本会签发的刷新令牌
+
+        @param include_refresh_token: 授权类是否签发刷新令牌
+        @return: bool
+        """
+        return include_refresh_token and self.refresh_token is not False
+
+
+# 未配置策略的客户端共用的空策略
+EMPTY_TOKEN_POLICY = TokenPolicy()
+
+
+class TokenPolicyResolver(object):
+    """ 客户端令牌策略解析
+
+    高频内部客户端可以配置更长的令牌有效期,减少签发次数
+
+    1. 策略读取client_metadata中的token_policy,provider_options中token_policy.clients按client_id覆盖
+    2. 每个客户端只解析一次并缓存,签发令牌时获取有效秒数只需一次字典查询
+    3. 客户端更新或删除后通过discard失效
+
+    {
+        "token_policy": {
+            "expires_in": {"client_credentials": 86400},
+            "default_expires_in": 3600,
+            "refresh_token": false
+        }
+    }
+    """
+
+    def __init__(self, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param config: 令牌策略配置
+        """
+        self.config = DEFAULT_TOKEN_POLICY_CONFIG | (config or {})
+        self.overrides = self.config['clients'] or {}
+        self.cache = TTLCache(maxsize=self.config['maxsize'], ttl=self.config['ttl'])
+
+    @staticmethod
+    def make_policy(conf: t.Dict[t.Text, t.Any]) -> TokenPolicy:
+        """ 根据配置创建策略
+
+        @param conf: 策略配置
+        @return: TokenPolicy
+        """
+        if not conf:
+            return EMPTY_TOKEN_POLICY
+        expires_in = conf.get('expires_in', None)
+        default_expires_in = conf.get('default_expires_in', None)
+        # expires_in为整数时对所有授权类型生效
+        if isinstance(expires_in, int):
+            expires_in, default_expires_in = {}, expires_in
+        refresh_token = conf.get('refresh_token', None)
+        return TokenPolicy(
+            expires_in={k: int(v) for k, v in (expires_in or {}).items()},
+            default_expires_in=None if default_expires_in is None else int(default_expires_in),
+            refresh_token=None if refresh_token is None else bool(refresh_token)
+        )
+
+    def resolve(self, client: t.Any) -> TokenPolicy:
+        """ 获取客户端令牌策略
+
+        @param client: 客户端对象
+        @return: TokenPolicy
+        """
+        if client is None:
+            return EMPTY_TOKEN_POLICY
+        policy = self.cache.get(client.client_id, None)
+        if policy is not None:
+            return policy
+        metadata = client.client_metadata or {}
+        conf = (metadata.get('token_policy', None) or {}) | (self.overrides.get(client.client_id, None) or {})
+        try:
+            policy = self.make_policy(conf)
+        except (TypeError, ValueError, AttributeError) as e:
+            logger.warning(f'invalid token_policy for client_id={client.client_id}, {e}')
+            policy = EMPTY_TOKEN_POLICY
+        self.cache.set(client.client_id, policy)
+        return policy
+
+    def discard(self, client_id: t.Text) -> None:
+        """ 失效客户端令牌策略
+
+        @param client_id: 客户端id
+        @return: None
+        """
+        self.cache.delete(client_id)
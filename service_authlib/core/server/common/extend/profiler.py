@@ -0,0 +1,252 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import io
+import sys
+import time
+import pstats
+import typing as t
+
+from threading import Lock
+from collections import Counter
+from contextlib import contextmanager
+from service_authlib.constants import DEFAULT_PROFILING_CONFIG
+
+# 函数标识: (文件名, 行号, 函数名)
+FunctionKey = t.Tuple[t.Text, int, t.Text]
+
+
+def get_function_key(frame: t.Any, event: t.Text, arg: t.Any) -> FunctionKey:
+    """ 获取调用事件对应的函数标识
+
+    @param frame: 栈帧
+    @param event: 事件类型
+    @param arg: 事件参数
+    @return: FunctionKey
+    """
+    if event.startswith('c_'):
+        module = getattr(arg, '__module__', None) or ''
+        return '~', 0, f'<built-in method {module}.{getattr(arg, "__qualname__", arg)}>'
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class CallRecorder(object):
+    """ 单次请求的调用记录器
+
+    通过sys.setprofile记录当前线程的调用,同时生成折叠栈耗时和pstats兼容的函数统计
+    """
+
+    def __init__(self) -> None:
+        """ 初始化实例 """
+        self.stack = []
+        self.stats = {}
+        self.collapsed = Counter()
+
+    def callback(self, frame: t.Any, event: t.Text, arg: t.Any) -> None:
+        """ sys.setprofile回调
+
+        @param frame: 栈帧
+        @param event: 事件类型
+        @param arg: 事件参数
+        @return: None
+        """
+        now = time.perf_counter()
+        if event in ('call', 'c_call'):
+            self.stack.append([get_function_key(frame, event, arg), now, 0.0])
+            return
+        # 开始记录前已进入的函数返回时栈为空
+        if not self.stack:
+            return
+        key, start, children = self.stack.pop()
+        elapsed = now - start
+        own = elapsed - children
+        parent = self.stack[-1][0] if self.stack else None
+        if self.stack:
+            self.stack[-1][2] += elapsed
+        recursive = any(item[0] == key for item in self.stack)
+        cc, nc, tt, ct, callers = self.stats.get(key, (0, 0, 0.0, 0.0, {}))
+        self.stats[key] = (cc + (0 if recursive else 1), nc + 1, tt + own, ct + (0 if recursive else elapsed), callers)
+        if parent is not None:
+            p_nc, p_cc, p_tt, p_ct = callers.get(parent, (0, 0, 0.0, 0.0))
+            callers[parent] = (p_nc + 1, p_cc + (0 if recursive else 1), p_tt + own, p_ct + elapsed)
+        names = [item[0][2] for item in self.stack]
+        names.append(key[2])
+        self.collapsed[';'.join(names)] += own
+
+    @contextmanager
+    def record(self) -> t.Iterator[CallRecorder]:
+        """ 在当前线程记录调用
+
+        @return: t.Iterator[CallRecorder]
+        """
+        previous = sys.getprofile()
+        sys.setprofile(self.callback)
+        try:
+            yield self
+        finally:
+            sys.setprofile(previous)
+
+
+class ProfileStats(object):
+    """ 供pstats.Stats读取的统计对象 """
+
+    def __init__(self, stats: t.Dict[FunctionKey, t.Tuple]) -> None:
+        """ 初始化实例
+
+        @param stats: 函数统计
+        """
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        """ pstats.Stats要求的接口
+
+        @return: None
+        """
+
+
+class SamplingProfiler(object):
+    """ 采样分析器
+
+    按端点或授权类型每N个请求分析1个,分析结果在内存中聚合,可导出为折叠栈(flamegraph.pl/speedscope)或pstats文件
+
+    1. 未开启任何采样时只做一次字典判空,开销可忽略
+    2. 可通过enable/disable在运行时开关,不需要重新部署
+    """
+
+    def __init__(self, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param config: 采样分析配置
+        """
+        self.lock = Lock()
+        self.config = DEFAULT_PROFILING_CONFIG | (config or {})
+        self.rates = {k: int(v) for k, v in (self.config['rates'] or {}).items() if v}
+        self.counters = Counter()
+        self.samples = Counter()
+        self.stats = {}
+        self.collapsed = Counter()
+
+    def enable(self, key: t.Text, every: int = 100) -> None:
+        """ 开启采样
+
+        @param key: 端点(token, authorize)或授权类型
+        @param every: 每every个请求分析1个
+        @return: None
+        """
+        with self.lock:
+            self.rates[key] = int(every)
+
+    def disable(self, key: t.Optional[t.Text] = None) -> None:
+        """ 关闭采样
+
+        @param key: 端点或授权类型,None表示全部关闭
+        @return: None
+        """
+        with self.lock:
+            if key is None:
+                self.rates.clear()
+            else:
+                self.rates.pop(key, None)
+
+    def should_sample(self, *keys: t.Optional[t.Text]) -> t.Optional[t.Text]:
+        """ 本次请求是否需要分析
+
+        @param keys: 端点和授权类型
+        @return: t.Optional[t.Text] 命中的采样键
+        """
+        if not self.rates:
+            return None
+        with self.lock:
+            for key in keys:
+                every = self.rates.get(key, None)
+                if not every:
+                    continue
+                self.counters[key] += 1
+                if self.counters[key] % every == 0:
+                    return key
+        return None
+
+    @contextmanager
+    def profile(self, *keys: t.Optional[t.Text]) -> t.Iterator[t.Optional[CallRecorder]]:
+        """ 按采样比例分析一次请求
+
+        @param keys: 端点和授权类型
+        @return: t.Iterator[t.Optional[CallRecorder]]
+        """
+        key = self.should_sample(*keys)
+        if key is None:
+            yield None
+            return
+        recorder = CallRecorder()
+        try:
+            with recorder.record():
+                yield recorder
+        finally:
+            self.merge(key, recorder)
+
+    def merge(self, key: t.Text, recorder: CallRecorder) -> None:
+        """ 聚合一次分析结果
+
+        @param key: 采样键
+        @param recorder: 调用记录器
+        @return: None
+        """
+        with self.lock:
+            self.samples[key] += 1
+            for stack, value in recorder.collapsed.items():
+                stack = f'{key};{stack}'
+                if stack in self.collapsed or len(self.collapsed) < self.config['max_stacks']:
+                    self.collapsed[stack] += value
+            for func, (cc, nc, tt, ct, callers) in recorder.stats.items():
+                o_cc, o_nc, o_tt, o_ct, o_callers = self.stats.get(func, (0, 0, 0.0, 0.0, {}))
+                for caller, value in callers.items():
+                    old = o_callers.get(caller, (0, 0, 0.0, 0.0))
+                    o_callers[caller] = tuple(a + b for a, b in zip(old, value))
+                self.stats[func] = (o_cc + cc, o_nc + nc, o_tt + tt, o_ct + ct, o_callers)
+
+    def dump_collapsed(self, path: t.Optional[t.Text] = None) -> t.Text:
+        """ 导出折叠栈,每行为"采样键;调用栈 微秒数"
+
+        @param path: 文件路径,None表示只返回文本
+        @return: t.Text
+        """
+        with self.lock:
+            lines = [f'{stack} {int(value * 1e6)}' for stack, value in self.collapsed.items() if value >= 1e-6]
+        text = '\n'.join(lines)
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+    def dump_stats(self, path: t.Optional[t.Text] = None, sort: t.Text = 'cumulative', limit: int = 50) -> t.Text:
+        """ 导出pstats统计
+
+        @param path: pstats文件路径,None表示只返回文本
+        @param sort: 文本排序字段
+        @param limit: 文本最多行数
+        @return: t.Text
+        """
+        with self.lock:
+            stats = {k: (cc, nc, tt, ct, dict(callers)) for k, (cc, nc, tt, ct, callers) in self.stats.items()}
+        if not stats:
+            return ''
+        stream = io.StringIO()
+        profile_stats = pstats.Stats(ProfileStats(stats), stream=stream)
+        if path is not None:
+            profile_stats.dump_stats(path)
+        profile_stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def reset(self) -> None:
+        """ 清空分析结果
+
+        @return: None
+        """
+        with self.lock:
+            self.samples.clear()
+            self.stats.clear()
+            self.collapsed.clear()
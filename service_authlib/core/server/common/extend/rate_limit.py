@@ -0,0 +1,172 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import typing as t
+
+from threading import Lock
+from logging import getLogger
+from collections import OrderedDict
+from authlib.oauth2 import OAuth2Request
+from service_core.core.as_loader import load_dot_path_colon_obj
+from service_authlib.constants import DEFAULT_RATE_LIMIT_CONFIG
+from authlib.oauth2.rfc6749.util import extract_basic_authorization
+from service_authlib.core.server.common.errors import SlowDownError
+
+logger = getLogger(__name__)
+
+
+class RateLimitBackend(object):
+    """ 限流后端基类
+
+    共享后端(如Redis)需继承此类并实现consume方法,本地后端可直接替换共享后端
+    """
+
+    def consume(self, key: t.Text, rate: float, burst: float, cost: float = 1.0) -> float:
+        """ 从令牌桶中消费令牌
+
+        @param key: 令牌桶键
+        @param rate: 每秒补充令牌数
+        @param burst: 令牌桶容量
+        @param cost: 本次消费令牌数
+        @return: float 0表示放行,否则为建议重试等待秒数
+        """
+        raise NotImplementedError()
+
+
+class LocalRateLimitBackend(RateLimitBackend):
+    """ 进程内令牌桶限流后端 """
+
+    def __init__(self, maxsize: int = 100000) -> None:
+        """ 初始化实例
+
+        @param maxsize: 最大令牌桶数量,超出后淘汰最久未使用的令牌桶
+        """
+        self.lock = Lock()
+        self.maxsize = maxsize
+        self.buckets = OrderedDict()
+
+    def consume(self, key: t.Text, rate: float, burst: float, cost: float = 1.0) -> float:
+        """ 从令牌桶中消费令牌
+
+        @param key: 令牌桶键
+        @param rate: 每秒补充令牌数
+        @param burst: 令牌桶容量
+        @param cost: 本次消费令牌数
+        @return: float 0表示放行,否则为建议重试等待秒数
+        """
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.pop(key, None)
+            tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+            if tokens >= cost:
+                tokens, wait = tokens - cost, 0.0
+            else:
+                wait = (cost - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            # 被淘汰的令牌桶等同于重新装满,不会误伤正常请求
+            while len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class RateLimiter(object):
+    """ 令牌端点限流器
+
+    在授权类分发前按client_id和来源IP限流,整个过程不访问数据库
+
+    1. 默认限额来自provider_options中的rate_limit配置
+    2. oauth2_client表中client_metadata字段字典值中可通过rate_limit声明单客户端限额,如: {"rate": 100, "burst": 200}
+    3. 客户端限额在首次查询到客户端后生效,此前使用默认限额
+    """
+
+    def __init__(self, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param config: 限流配置
+        """
+        self.config = DEFAULT_RATE_LIMIT_CONFIG | (config or {})
+        self.local = LocalRateLimitBackend(maxsize=self.config['maxsize'])
+        self.backend = self.create_backend(self.config['backend'], self.config['backend_options'] or {})
+        self.client_limits = {}
+
+    def create_backend(
+            self,
+            conf: t.Optional[t.Union[RateLimitBackend, t.Text]],
+            options: t.Dict[t.Text, t.Any]
+    ) -> RateLimitBackend:
+        """ 创建限流后端
+
+        @param conf: 限流后端配置
+        @param options: 限流后端参数
+        @return: RateLimitBackend
+        """
+        if isinstance(conf, RateLimitBackend):
+            return conf
+        if isinstance(conf, str):
+            return load_dot_path_colon_obj(conf)[-1](**options)
+        return self.local
+
+    def update_client_limit(self, client: t.Any) -> None:
+        """ 根据客户端元数据更新限额
+
+        @param client: 客户端对象
+        @return: None
+        """
+        limit = client.client_metadata.get('rate_limit') or {}
+        if not limit:
+            self.client_limits.pop(client.client_id, None)
+            return
+        rate = float(limit.get('rate', self.config['client_rate']))
+        burst = float(limit.get('burst', self.config['client_burst']))
+        self.client_limits[client.client_id] = (rate, burst)
+
+    @staticmethod
+    def get_client_id(request: OAuth2Request) -> t.Optional[t.Text]:
+        """ 从请求中提取client_id
+
+        @param request: 请求对象
+        @return: t.Optional[t.Text]
+        """
+        client_id, _ = extract_basic_authorization(request.headers)
+        return client_id or request.data.get('client_id')
+
+    def consume(self, key: t.Text, rate: float, burst: float) -> float:
+        """ 消费令牌,共享后端异常时退化为本地后端
+
+        @param key: 令牌桶键
+        @param rate: 每秒补充令牌数
+        @param burst: 令牌桶容量
+        @return: float
+        """
+        if not rate or rate <= 0:
+            return 0.0
+        if self.backend is not self.local:
+            try:
+                return self.backend.consume(key, rate, burst)
+            except Exception as e:
+                logger.warning(f'rate limit backend unavailable, fallback to local, errs={e}')
+        return self.local.consume(key, rate, burst)
+
+    def check(self, request: OAuth2Request) -> None:
+        """ 检查请求是否超出限额
+
+        @param request: 请求对象
+        @return: None
+        """
+        wait = 0.0
+        client_id = self.get_client_id(request)
+        if client_id:
+            default = (self.config['client_rate'], self.config['client_burst'])
+            rate, burst = self.client_limits.get(client_id, default)
+            wait = max(wait, self.consume(f'client:{client_id}', rate, burst))
+        remote_addr = getattr(request, 'remote_addr', None)
+        if remote_addr:
+            rate, burst = self.config['ip_rate'], self.config['ip_burst']
+            wait = max(wait, self.consume(f'ip:{remote_addr}', rate, burst))
+        if wait > 0:
+            logger.warning(f'token request rate limited, client_id={client_id}, remote_addr={remote_addr}')
+            raise SlowDownError(retry_after=wait, description='Too many token requests, slow down')
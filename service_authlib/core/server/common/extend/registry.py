@@ -0,0 +1,79 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from logging import getLogger
+from service_authlib.core.server.common.models.snapshot import ClientSnapshot
+
+logger = getLogger(__name__)
+
+
+class StaticClientRegistry(object):
+    """ 静态客户端注册表
+
+    AUTHLIB.<alias>.oauth2/openid.clients中声明的客户端在setup阶段载入内存,查询客户端时优先命中,不访问oauth2_client表
+
+    1. client_id必须配置,client_secret支持明文或pbkdf2_sha256/bcrypt/argon2哈希
+    2. client_metadata之外的其它键(如grant_types,scope)同样合并到client_metadata中
+
+    AUTHLIB:
+      default:
+        oauth2:
+          clients:
+            - client_id: order
+              client_secret: pbkdf2_sha256$260000$...
+              user_id: 1
+              grant_types: [client_credentials]
+              scope: stock
+    """
+
+    fields = ('id', 'user_id', 'client_id', 'client_secret', 'client_id_issued_at', 'client_secret_expires_at')
+
+    def __init__(self) -> None:
+        """ 初始化实例 """
+        self.clients = {}
+
+    def make_client(self, conf: t.Dict[t.Text, t.Any]) -> ClientSnapshot:
+        """ 根据配置创建客户端快照
+
+        @param conf: 客户端配置
+        @return: ClientSnapshot
+        """
+        if not conf.get('client_id', None):
+            raise ValueError(f'client_id is required in static client {conf}')
+        fields = {k: v for k, v in conf.items() if k in self.fields}
+        metadata = {k: v for k, v in conf.items() if k not in self.fields and k != 'client_metadata'}
+        fields['client_metadata'] = metadata | (conf.get('client_metadata', None) or {})
+        fields.setdefault('client_id_issued_at', 0)
+        fields.setdefault('client_secret_expires_at', 0)
+        return ClientSnapshot(**fields)
+
+    def load(self, clients: t.Optional[t.List[t.Dict[t.Text, t.Any]]] = None) -> int:
+        """ 载入静态客户端
+
+        @param clients: 客户端配置列表
+        @return: int 载入的客户端数
+        """
+        for conf in clients or []:
+            client = self.make_client(conf)
+            self.clients[client.client_id] = client
+        logger.debug(f'load {len(self.clients)} static oauth2 clients')
+        return len(self.clients)
+
+    def get(self, client_id: t.Text) -> t.Optional[ClientSnapshot]:
+        """ 获取静态客户端
+
+        @param client_id: 客户端id
+        @return: t.Optional[ClientSnapshot]
+        """
+        return self.clients.get(client_id, None)
+
+    def __contains__(self, client_id: t.Text) -> bool:
+        return client_id in self.clients
+
+    def __len__(self) -> int:
+        return len(self.clients)
@@ -0,0 +1,410 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import os
+import mmap
+import time
+import json
+import stat
+import tempfile
+import struct
+import typing as t
+
+from threading import Lock
+from logging import getLogger
+from contextlib import contextmanager
+from service_authlib.constants import DEFAULT_SHARED_CACHE_CONFIG
+from service_authlib.core.server.common.models.snapshot import Snapshot
+from service_authlib.core.server.common.models.snapshot import UserSnapshot
+from service_authlib.core.server.common.models.snapshot import TokenSnapshot
+from service_authlib.core.server.common.models.snapshot import ClientSnapshot
+from service_authlib.core.server.common.models.snapshot import AuthorizationCodeSnapshot
+
+from .cache import make_cache_key
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = getLogger(__name__)
+
+# 文件头: 魔数, 槽位数, 槽位字节数
+HEADER = struct.Struct('<8sII')
+# 槽位头: 序号(奇数表示正在写), 键, 过期时间, 值长度
+SLOT_HEADER = struct.Struct('<I16sdI')
+MAGIC = b'OA2SHM01'
+EMPTY_KEY = b'\x00' * 16
+# 允许从共享文件还原的快照类型
+SNAPSHOT_TYPES = {
+    cls.__name__: cls for cls in (ClientSnapshot, TokenSnapshot, UserSnapshot, AuthorizationCodeSnapshot)
+}
+
+
+def dumps(value: t.Any) -> bytes:
+    """ 序列化缓存值,快照保存类型名和字段字典
+
+    @param value: 缓存值
+    @return: bytes
+    """
+    if isinstance(value, Snapshot):
+        value = {'__snapshot__': value.__class__.__name__, 'fields': value.as_dict()}
+    return json.dumps(value, separators=(',', ':'), default=dict).encode('utf-8')
+
+
+def loads(data: bytes) -> t.Any:
+    """ 反序列化缓存值,未知的快照类型视为未命中
+
+    @param data: 序列化后的值
+    @return: t.Any
+    """
+    value = json.loads(data)
+    if not isinstance(value, dict) or '__snapshot__' not in value:
+        return value
+    snapshot_type = SNAPSHOT_TYPES.get(value['__snapshot__'])
+    return None if snapshot_type is None else snapshot_type(**value['fields'])
+
+
+class SharedMemoryCache(object):
+    """ 跨进程共享缓存
+
+    基于mmap的定长槽位哈希表,同一主机的多个工作进程映射同一个文件,共享一份热数据
+
+    1. 读不加锁,通过槽位序号(seqlock)检测并重试并发写,写通过文件锁(fcntl)串行
+    2. 每个键在起始槽位后最多探测probes个槽位,没有空位时覆盖最早过期的槽位,内存占用固定
+    3. 值通过JSON序列化(快照保存类型名和字段),超过槽位大小的值不缓存,过期时间使用墙上时间以便跨进程比较
+    4. 布局不一致时新建文件并原子替换,不截断其它进程正在映射的文件,其它进程定期发现替换后切换到新文件,布局不同时停用
+    """
+
+    def __init__(self, name: t.Text, config: t.Optional[t.Dict[t.Text, t.Any]] = None, ttl: float = 60) -> None:
+        """ 初始化实例
+
+        @param name: 表名,同名表在进程间共享
+        @param config: 共享缓存配置
+        @param ttl: 默认过期秒数
+        """
+        self.ttl = ttl
+        self.lock = Lock()
+        self.config = DEFAULT_SHARED_CACHE_CONFIG | (config or {})
+        self.slots = self.config['slots']
+        self.probes = min(self.config['probes'], self.slots)
+        self.slot_size = self.config['slot_size']
+        self.max_value_size = self.slot_size - SLOT_HEADER.size
+        self.path = os.path.join(self.config['directory'], f'{self.config["prefix"]}-{name}.cache')
+        self.size = HEADER.size + self.slots * self.slot_size
+        self.header = HEADER.pack(MAGIC, self.slots, self.slot_size)
+        self.checked_at = time.monotonic()
+        self.fd = self.attach()
+        self.mm = mmap.mmap(self.fd, self.size)
+
+    def open(self) -> int:
+        """ 打开共享文件,拒绝符号链接和非当前用户独占的文件
+
+        @return: int
+        """
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0)
+        fd = os.open(self.path, flags, 0o600)
+        st = os.fstat(fd)
+        owner = os.getuid() if hasattr(os, 'getuid') else st.st_uid
+        if not stat.S_ISREG(st.st_mode) or st.st_uid != owner or st.st_mode & 0o077:
+            os.close(fd)
+            raise RuntimeError(f'shared cache {self.path} must be a regular file owned by current user with mode 0600')
+        return fd
+
+    @contextmanager
+    def locked(self) -> t.Iterator[None]:
+        """ 获取进程内和跨进程的写锁
+
+        @return: t.Iterator[None]
+        """
+        with self.lock:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def is_current(self, fd: int) -> bool:
+        """ 文件描述符是否仍指向当前路径上的文件
+
+        @param fd: 文件描述符
+        @return: bool
+        """
+        st = os.fstat(fd)
+        try:
+            path_st = os.lstat(self.path)
+        except FileNotFoundError:
+            return False
+        return (st.st_dev, st.st_ino) == (path_st.st_dev, path_st.st_ino)
+
+    def is_valid(self, fd: int) -> bool:
+        """ 文件布局是否与当前配置一致
+
+        @param fd: 文件描述符
+        @return: bool
+        """
+        return os.fstat(fd).st_size == self.size and os.pread(fd, HEADER.size, 0) == self.header
+
+    def attach(self) -> int:
+        """ 打开共享文件,文件不存在或布局不一致时新建文件并原子替换
+
+        其它进程可能仍在映射旧文件,截断旧文件会使其读到清零的槽位或收到SIGBUS,因此不修改旧文件
+
+        @return: int
+        """
+        while True:
+            fd = self.open()
+            with self.lock:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    # 等待文件锁期间其它进程可能已经替换了文件,重新打开
+                    current = self.is_current(fd)
+                    valid = current and self.is_valid(fd)
+                    if current and not valid:
+                        self.replace()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+            if valid:
+                return fd
+            os.close(fd)
+
+    def replace(self) -> None:
+        """ 按当前配置新建文件并原子替换
+
+        @return: None
+        """
+        logger.warning(f'initialize shared cache {self.path} with {self.slots} slots of {self.slot_size} bytes')
+        directory, name = os.path.split(self.path)
+        fd, path = tempfile.mkstemp(prefix=f'{name}.', suffix='.tmp', dir=directory)
+        try:
+            os.ftruncate(fd, self.size)
+            os.pwrite(fd, self.header, 0)
+        finally:
+            os.close(fd)
+        try:
+            os.replace(path, self.path)
+        except OSError:
+            os.unlink(path)
+            raise
+
+    def refresh(self) -> bool:
+        """ 定期检查共享文件是否被其它进程替换,布局一致时切换到新文件,否则停用
+
+        @return: bool 是否可用
+        """
+        now = time.monotonic()
+        if now - self.checked_at < self.config['check_interval']:
+            return self.mm is not None
+        self.checked_at = now
+        if self.fd is not None and self.is_current(self.fd):
+            return self.mm is not None
+        with self.lock:
+            try:
+                fd = self.open()
+            except (OSError, RuntimeError) as e:
+                logger.warning(f'reopen shared cache {self.path} failed, {e}')
+                fd = None
+            if fd is not None and not self.is_valid(fd):
+                logger.warning(f'shared cache {self.path} was replaced with a different layout, stop using it')
+                os.close(fd)
+                fd = None
+            # 旧映射由垃圾回收释放,正在读取的线程不受影响
+            old_fd, self.fd = self.fd, fd
+            self.mm = None if fd is None else mmap.mmap(fd, self.size)
+            if old_fd is not None:
+                os.close(old_fd)
+        return self.mm is not None
+
+    def make_key(self, key: t.Hashable) -> bytes:
+        """ 生成16字节的键
+
+        @param key: 缓存键
+        @return: bytes
+        """
+        return key if isinstance(key, bytes) and len(key) == 16 else make_cache_key(key)
+
+    def offsets(self, key: bytes) -> t.Iterator[int]:
+        """ 键的探测槽位偏移
+
+        @param key: 16字节的键
+        @return: t.Iterator[int]
+        """
+        start = int.from_bytes(key[:8], 'little') % self.slots
+        for i in range(self.probes):
+            yield HEADER.size + (start + i) % self.slots * self.slot_size
+
+    def read(self, offset: int) -> t.Optional[t.Tuple[bytes, float, bytes]]:
+        """ 无锁读取槽位
+
+        @param offset: 槽位偏移
+        @return: t.Optional[t.Tuple[bytes, float, bytes]]
+        """
+        for _ in range(8):
+            seq, key, expires_at, length = SLOT_HEADER.unpack_from(self.mm, offset)
+            if seq & 1:
+                continue
+            start = offset + SLOT_HEADER.size
+            value = self.mm[start:start + min(length, self.max_value_size)]
+            if SLOT_HEADER.unpack_from(self.mm, offset)[0] == seq:
+                return key, expires_at, value
+        return None
+
+    def write(self, offset: int, key: bytes, expires_at: float, value: bytes) -> None:
+        """ 持有写锁时写入槽位
+
+        @param offset: 槽位偏移
+        @param key: 16字节的键
+        @param expires_at: 过期时间
+        @param value: 序列化后的值
+        @return: None
+        """
+        seq = SLOT_HEADER.unpack_from(self.mm, offset)[0]
+        struct.pack_into('<I', self.mm, offset, (seq + 1) & 0xFFFFFFFF)
+        start = offset + SLOT_HEADER.size
+        self.mm[start:start + len(value)] = value
+        SLOT_HEADER.pack_into(self.mm, offset, (seq + 2) & 0xFFFFFFFF, key, expires_at, len(value))
+
+    def get(self, key: t.Hashable, default: t.Any = None) -> t.Any:
+        """ 获取缓存值
+
+        @param key: 缓存键
+        @param default: 默认值
+        @return: t.Any
+        """
+        if not self.refresh():
+            return default
+        now = time.time()
+        key = self.make_key(key)
+        for offset in self.offsets(key):
+            slot = self.read(offset)
+            if slot is None or slot[0] != key or slot[1] < now:
+                continue
+            try:
+                return loads(slot[2])
+            except (ValueError, TypeError):
+                return default
+        return default
+
+    def set(self, key: t.Hashable, value: t.Any, ttl: t.Optional[float] = None) -> bool:
+        """ 设置缓存值
+
+        @param key: 缓存键
+        @param value: 缓存值
+        @param ttl: 过期秒数
+        @return: bool 值过大时不缓存
+        """
+        if not self.refresh():
+            return False
+        now = time.time()
+        key = self.make_key(key)
+        data = dumps(value)
+        if len(data) > self.max_value_size:
+            logger.debug(f'skip shared cache value of {len(data)} bytes')
+            return False
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self.locked():
+            target, target_expires_at = None, None
+            for offset in self.offsets(key):
+                _, slot_key, slot_expires_at, _ = SLOT_HEADER.unpack_from(self.mm, offset)
+                if slot_key == key:
+                    target = offset
+                    break
+                # 优先复用空槽位或已过期槽位,否则覆盖最早过期的槽位
+                slot_expires_at = 0 if slot_expires_at < now else slot_expires_at
+                if target is None or slot_expires_at < target_expires_at:
+                    target, target_expires_at = offset, slot_expires_at
+            self.write(target, key, expires_at, data)
+        return True
+
+    def delete(self, key: t.Hashable) -> bool:
+        """ 删除缓存值
+
+        @param key: 缓存键
+        @return: bool
+        """
+        if not self.refresh():
+            return False
+        key = self.make_key(key)
+        with self.locked():
+            for offset in self.offsets(key):
+                if SLOT_HEADER.unpack_from(self.mm, offset)[1] == key:
+                    self.write(offset, EMPTY_KEY, 0, b'')
+                    return True
+        return False
+
+    def evict(self, predicate: t.Callable[[t.Any], bool]) -> int:
+        """ 删除满足条件的缓存值,需要遍历所有槽位
+
+        @param predicate: 缓存值过滤函数
+        @return: int
+        """
+        if not self.refresh():
+            return 0
+        count, now = 0, time.time()
+        with self.locked():
+            for i in range(self.slots):
+                offset = HEADER.size + i * self.slot_size
+                _, key, expires_at, length = SLOT_HEADER.unpack_from(self.mm, offset)
+                if key == EMPTY_KEY or expires_at < now:
+                    continue
+                start = offset + SLOT_HEADER.size
+                try:
+                    value = loads(self.mm[start:start + length])
+                except (ValueError, TypeError):
+                    value = None
+                if value is None or predicate(value):
+                    self.write(offset, EMPTY_KEY, 0, b'')
+                    count += 1
+        return count
+
+    def clear(self) -> None:
+        """ 清空缓存
+
+        @return: None
+        """
+        if not self.refresh():
+            return
+        with self.locked():
+            for i in range(self.slots):
+                self.write(HEADER.size + i * self.slot_size, EMPTY_KEY, 0, b'')
+
+    def close(self) -> None:
+        """ 解除映射并关闭文件
+
+        @return: None
+        """
+        if self.mm is not None:
+            self.mm.close()
+        if self.fd is not None:
+            os.close(self.fd)
+        self.mm, self.fd = None, None
+        # 关闭后不再重新打开
+        self.checked_at = float('inf')
+
+    def __contains__(self, key: t.Hashable) -> bool:
+        """ 是否存在未过期条目
+
+        @param key: 缓存键
+        @return: bool
+        """
+        return self.get(key, None) is not None
+
+    def __len__(self) -> int:
+        """ 当前未过期条目数
+
+        @return: int
+        """
+        if not self.refresh():
+            return 0
+        now = time.time()
+        return sum(
+            1 for i in range(self.slots)
+            if SLOT_HEADER.unpack_from(self.mm, HEADER.size + i * self.slot_size)[2] >= now
+        )
@@ -0,0 +1,177 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from threading import Lock
+from threading import Event
+from service_authlib.constants import DEFAULT_TTL_STORE_CONFIG
+from service_core.core.as_loader import load_dot_path_colon_obj
+
+from .cache import TTLCache
+
+
+class TTLStore(object):
+    """ TTL存储基类
+
+    存放设备码,一次性标记等短期数据,共享后端(如Redis)需继承此类,值必须可被JSON序列化
+    """
+
+    def get(self, key: t.Text) -> t.Any:
+        """ 获取值
+
+        @param key: 键
+        @return: t.Any
+        """
+        raise NotImplementedError()
+
+    def set(self, key: t.Text, value: t.Any, ttl: float) -> None:
+        """ 设置值
+
+        @param key: 键
+        @param value: 值
+        @param ttl: 过期秒数
+        @return: None
+        """
+        raise NotImplementedError()
+
+    def add(self, key: t.Text, value: t.Any, ttl: float) -> bool:
+        """ 键不存在时设置值
+
+        @param key: 键
+        @param value: 值
+        @param ttl: 过期秒数
+        @return: bool 是否设置成功
+        """
+        raise NotImplementedError()
+
+    def delete(self, key: t.Text) -> None:
+        """ 删除值
+
+        @param key: 键
+        @return: None
+        """
+        raise NotImplementedError()
+
+    def publish(self, channel: t.Text) -> None:
+        """ 发布完成通知
+
+        @param channel: 通道
+        @return: None
+        """
+        raise NotImplementedError()
+
+    def wait(self, channel: t.Text, timeout: float, check: t.Optional[t.Callable[[], bool]] = None) -> bool:
+        """ 等待完成通知
+
+        订阅后先调用check再等待,避免错过订阅前已经发布的通知
+
+        @param channel: 通道
+        @param timeout: 最长等待秒数
+        @param check: 订阅后检查是否已完成的函数
+        @return: bool 是否收到通知或已完成
+        """
+        raise NotImplementedError()
+
+
+class LocalTTLStore(TTLStore):
+    """ 进程内TTL存储 """
+
+    def __init__(self, maxsize: int = 100000) -> None:
+        """ 初始化实例
+
+        @param maxsize: 最大条目数
+        """
+        self.lock = Lock()
+        self.events = {}
+        self.cache = TTLCache(maxsize=maxsize)
+
+    def get(self, key: t.Text) -> t.Any:
+        """ 获取值
+
+        @param key: 键
+        @return: t.Any
+        """
+        return self.cache.get(key, None)
+
+    def set(self, key: t.Text, value: t.Any, ttl: float) -> None:
+        """ 设置值
+
+        @param key: 键
+        @param value: 值
+        @param ttl: 过期秒数
+        @return: None
+        """
+        self.cache.set(key, value, ttl=ttl)
+
+    def add(self, key: t.Text, value: t.Any, ttl: float) -> bool:
+        """ 键不存在时设置值
+
+        @param key: 键
+        @param value: 值
+        @param ttl: 过期秒数
+        @return: bool 是否设置成功
+        """
+        with self.lock:
+            if key in self.cache:
+                return False
+            self.cache.set(key, value, ttl=ttl)
+            return True
+
+    def delete(self, key: t.Text) -> None:
+        """ 删除值
+
+        @param key: 键
+        @return: None
+        """
+        self.cache.delete(key)
+
+    def publish(self, channel: t.Text) -> None:
+        """ 发布完成通知
+
+        @param channel: 通道
+        @return: None
+        """
+        with self.lock:
+            waiter = self.events.pop(channel, None)
+        if waiter is not None:
+            waiter[0].set()
+
+    def wait(self, channel: t.Text, timeout: float, check: t.Optional[t.Callable[[], bool]] = None) -> bool:
+        """ 等待完成通知
+
+        @param channel: 通道
+        @param timeout: 最长等待秒数
+        @param check: 订阅后检查是否已完成的函数
+        @return: bool 是否收到通知或已完成
+        """
+        with self.lock:
+            waiter = self.events.setdefault(channel, [Event(), 0])
+            waiter[1] += 1
+        try:
+            if check is not None and check():
+                return True
+            return waiter[0].wait(timeout)
+        finally:
+            with self.lock:
+                waiter[1] -= 1
+                if waiter[1] <= 0 and self.events.get(channel) is waiter:
+                    self.events.pop(channel, None)
+
+
+def create_ttl_store(config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> TTLStore:
+    """ 根据配置创建TTL存储
+
+    @param config: 存储配置
+    @return: TTLStore
+    """
+    config = DEFAULT_TTL_STORE_CONFIG | (config or {})
+    backend = config['backend']
+    if isinstance(backend, TTLStore):
+        return backend
+    if isinstance(backend, str):
+        return load_dot_path_colon_obj(backend)[-1](**(config['backend_options'] or {}))
+    return LocalTTLStore(maxsize=config['maxsize'])
@@ -0,0 +1,267 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import typing as t
+
+from threading import local
+from logging import getLogger
+from collections import deque
+from contextlib import contextmanager
+from service_authlib.constants import DEFAULT_TRACING_CONFIG
+from service_core.core.as_loader import load_dot_path_colon_obj
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+logger = getLogger(__name__)
+
+
+class Span(object):
+    """ 阶段耗时记录 """
+
+    __slots__ = ('name', 'parent', 'depth', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name: t.Text, parent: t.Optional[Span] = None, **attributes: t.Any) -> None:
+        """ 初始化实例
+
+        @param name: 阶段名
+        @param parent: 父阶段
+        @param attributes: 阶段属性
+        """
+        self.name = name
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        """ 耗时毫秒数
+
+        @return: float
+        """
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class SpanExporter(object):
+    """ 链路导出器基类
+
+    接口与OpenTelemetry的SpanExporter保持一致,一次请求结束后按开始顺序批量导出所有阶段
+    """
+
+    def export(self, spans: t.List[Span]) -> None:
+        """ 导出一次请求的所有阶段
+
+        @param spans: 阶段列表,第一个为根阶段
+        @return: None
+        """
+        raise NotImplementedError()
+
+    def shutdown(self) -> None:
+        """ 关闭导出器
+
+        @return: None
+        """
+
+
+class NoopSpanExporter(SpanExporter):
+    """ 不导出的链路导出器 """
+
+    def export(self, spans: t.List[Span]) -> None:
+        """ 导出一次请求的所有阶段
+
+        @param spans: 阶段列表,第一个为根阶段
+        @return: None
+        """
+
+
+class OpenTelemetrySpanExporter(SpanExporter):
+    """ 导出到OpenTelemetry的链路导出器
+
+    使用全局TracerProvider按记录的起止时间重建阶段,需要安装opentelemetry-api
+    """
+
+    def __init__(self, name: t.Text = 'service_authlib') -> None:
+        """ 初始化实例
+
+        @param name: instrumentation名称
+        """
+        if otel_trace is None:
+            raise RuntimeError('opentelemetry-api is required for OpenTelemetrySpanExporter')
+        self.tracer = otel_trace.get_tracer(name)
+
+    def export(self, spans: t.List[Span]) -> None:
+        """ 导出一次请求的所有阶段
+
+        @param spans: 阶段列表,第一个为根阶段
+        @return: None
+        """
+        created = {}
+        for span in spans:
+            parent = created.get(id(span.parent), None)
+            context = None if parent is None else otel_trace.set_span_in_context(parent)
+            otel_span = self.tracer.start_span(
+                span.name, context=context, attributes=span.attributes, start_time=span.start_ns
+            )
+            if span.error is not None:
+                otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, span.error))
+            created[id(span)] = otel_span
+        for span in reversed(spans):
+            created[id(span)].end(end_time=span.end_ns)
+
+
+class Tracer(object):
+    """ 请求阶段追踪器
+
+    一次请求内的阶段保存在线程本地变量中,请求结束后导出,耗时超过阈值时在日志中记录各阶段耗时
+
+    1. 没有进行中的请求时span不做任何记录
+    2. 最近的慢请求保存在slow_requests中,便于排查
+    """
+
+    def __init__(self, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param config: 追踪配置
+        """
+        self.local = local()
+        self.config = DEFAULT_TRACING_CONFIG | (config or {})
+        self.exporter = self.create_exporter()
+        self.slow_threshold = self.config['slow_threshold']
+        self.slow_requests = deque(maxlen=self.config['slow_maxlen'])
+
+    def create_exporter(self) -> SpanExporter:
+        """ 根据配置创建链路导出器
+
+        @return: SpanExporter
+        """
+        exporter = self.config['exporter']
+        options = self.config['exporter_options'] or {}
+        if isinstance(exporter, SpanExporter):
+            return exporter
+        if exporter == 'opentelemetry':
+            return OpenTelemetrySpanExporter(**options)
+        if isinstance(exporter, str):
+            return load_dot_path_colon_obj(exporter)[-1](**options)
+        return NoopSpanExporter()
+
+    @contextmanager
+    def trace(self, name: t.Text, **attributes: t.Any) -> t.Iterator[t.Optional[Span]]:
+        """ 追踪一次请求,嵌套调用时等同于span
+
+        @param name: 请求名,如: token, authorize
+        @param attributes: 请求属性
+        @return: t.Iterator[t.Optional[Span]]
+        """
+        if getattr(self.local, 'spans', None) is not None:
+            with self.span(name, **attributes) as span:
+                yield span
+            return
+        root = Span(name, **attributes)
+        self.local.spans, self.local.current = [root], root
+        try:
+            yield root
+        except Exception as e:
+            root.error = repr(e)
+            raise
+        finally:
+            root.end_ns = time.time_ns()
+            spans = self.local.spans
+            self.local.spans, self.local.current = None, None
+            self.finish(spans)
+
+    @contextmanager
+    def span(self, name: t.Text, **attributes: t.Any) -> t.Iterator[t.Optional[Span]]:
+        """ 追踪请求内的一个阶段
+
+        @param name: 阶段名,如: authenticate_client, db.query
+        @param attributes: 阶段属性
+        @return: t.Iterator[t.Optional[Span]]
+        """
+        spans = getattr(self.local, 'spans', None)
+        if spans is None:
+            yield None
+            return
+        parent = self.local.current
+        span = Span(name, parent=parent, **attributes)
+        spans.append(span)
+        self.local.current = span
+        try:
+            yield span
+        except Exception as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            self.local.current = parent
+
+    def annotate(self, **attributes: t.Any) -> None:
+        """ 给当前阶段添加属性
+
+        @param attributes: 阶段属性
+        @return: None
+        """
+        current = getattr(self.local, 'current', None)
+        if current is not None:
+            current.attributes.update(attributes)
+
+    def finish(self, spans: t.List[Span]) -> None:
+        """ 导出阶段并记录慢请求
+
+        @param spans: 阶段列表,第一个为根阶段
+        @return: None
+        """
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            logger.warning(f'export oauth2 spans failed, {e}')
+        root = spans[0]
+        if self.slow_threshold is None or root.duration < self.slow_threshold:
+            return
+        stages = [(s.depth, s.name, round(s.duration, 3)) for s in spans]
+        self.slow_requests.append({'name': root.name, 'attributes': root.attributes, 'stages': stages})
+        breakdown = ', '.join(f'{name}={duration}ms' for _, name, duration in stages[1:])
+        logger.warning(f'slow oauth2 request {root.name} {root.attributes} took {root.duration:.3f}ms: {breakdown}')
+
+
+class NoopTracer(Tracer):
+    """ 不做任何记录的追踪器,未配置tracing时使用 """
+
+    def __init__(self) -> None:
+        """ 初始化实例 """
+        super(NoopTracer, self).__init__({'slow_threshold': None, 'slow_maxlen': 0})
+
+    @contextmanager
+    def trace(self, name: t.Text, **attributes: t.Any) -> t.Iterator[None]:
+        """ 追踪一次请求
+
+        @param name: 请求名
+        @param attributes: 请求属性
+        @return: t.Iterator[None]
+        """
+        yield None
+
+    @contextmanager
+    def span(self, name: t.Text, **attributes: t.Any) -> t.Iterator[None]:
+        """ 追踪请求内的一个阶段
+
+        @param name: 阶段名
+        @param attributes: 阶段属性
+        @return: t.Iterator[None]
+        """
+        yield None
+
+    def annotate(self, **attributes: t.Any) -> None:
+        """ 给当前阶段添加属性
+
+        @param attributes: 阶段属性
+        @return: None
+        """
@@ -0,0 +1,168 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import typing as t
+
+from threading import Event
+from threading import Thread
+from logging import getLogger
+from service_authlib.constants import DEFAULT_REGISTRY_SNAPSHOT_CONFIG
+from service_authlib.core.server.common.models.snapshot import ClientSnapshot
+
+from .cache import TTLCache
+
+logger = getLogger(__name__)
+
+
+class ClientRegistrySnapshot(object):
+    """ 客户端注册表磁盘快照
+
+    部署后新启动的工作进程缓存为空,前几分钟的客户端查询全部落到数据库,快照用于在setup阶段预热
+
+    1. 后台线程按interval把oauth2_client表写入本地文件,先写临时文件再原子替换,文件权限为0600
+    2. setup阶段载入未过期的快照,客户端在ttl秒内直接命中内存,过期后回到正常的缓存/数据库查询
+    3. 客户端更新或删除时通过discard同步失效,避免快照中的旧数据被继续使用
+    4. 默认不写入client_secret,载入的客户端首次使用时回到正常的缓存/数据库查询补全密钥,include_secrets为True时写入密钥哈希
+    """
+
+    version = 1
+
+    def __init__(self, server: t.Any, config: t.Optional[t.Dict[t.Text, t.Any]] = None) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        @param config: 快照配置
+        """
+        self.server = server
+        self.config = DEFAULT_REGISTRY_SNAPSHOT_CONFIG | (config or {})
+        self.clients = TTLCache(maxsize=self.config['maxsize'], ttl=self.config['ttl'])
+        # 快照中不含密钥的客户端id
+        self.pending = set()
+        self.stopped = Event()
+        self.thread = None
+
+    def get(self, client_id: t.Text) -> t.Optional[ClientSnapshot]:
+        """ 获取快照中的客户端
+
+        @param client_id: 客户端id
+        @return: t.Optional[ClientSnapshot]
+        """
+        client = self.clients.get(client_id, None)
+        if client is None or client_id not in self.pending:
+            return client
+        # 快照中不含密钥,交给正常的缓存/数据库查询重新加载
+        self.discard(client_id)
+        return None
+
+    def discard(self, client_id: t.Text) -> None:
+        """ 失效快照中的客户端
+
+        @param client_id: 客户端id
+        @return: None
+        """
+        self.clients.delete(client_id)
+        self.pending.discard(client_id)
+
+    def load(self) -> int:
+        """ 载入快照文件
+
+        @return: int 载入的客户端数
+        """
+        path = self.config['path']
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f'load oauth2 client snapshot {path} failed, {e}')
+            return 0
+        if data.get('version') != self.version:
+            return 0
+        if time.time() - data.get('created_at', 0) > self.config['max_age']:
+            logger.debug(f'skip expired oauth2 client snapshot {path}')
+            return 0
+        secrets = data.get('secrets', False)
+        for fields in data.get('clients', []):
+            client = ClientSnapshot(**fields)
+            self.clients.set(client.client_id, client)
+            if not secrets:
+                self.pending.add(client.client_id)
+            if self.server.rate_limiter is not None:
+                self.server.rate_limiter.update_client_limit(client)
+        logger.debug(f'load {len(self.clients)} oauth2 clients from snapshot {path}')
+        return len(self.clients)
+
+    def dump(self) -> int:
+        """ 写入快照文件
+
+        @return: int 写入的客户端数
+        """
+        path = self.config['path']
+        clients = self.server.repository.list_clients(self.config['maxsize'])
+        secrets = self.config['include_secrets']
+        data = {'version': self.version, 'created_at': time.time(), 'secrets': secrets, 'clients': []}
+        for client in clients:
+            fields = client.as_dict()
+            if not secrets:
+                fields.pop('client_secret', None)
+            data['clients'].append(fields)
+        temp = f'{path}.{os.getpid()}.tmp'
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(temp, path)
+        except Exception:
+            if os.path.exists(temp):
+                os.unlink(temp)
+            raise
+        logger.debug(f'dump {len(clients)} oauth2 clients to snapshot {path}')
+        return len(clients)
+
+    def run_once(self) -> None:
+        """ 执行一次写入
+
+        @return: None
+        """
+        try:
+            self.dump()
+        except Exception as e:
+            logger.warning(f'dump oauth2 client snapshot failed, {e}')
+
+    def run(self) -> None:
+        """ 后台线程循环
+
+        @return: None
+        """
+        while not self.stopped.wait(self.config['interval']):
+            self.run_once()
+
+    def start(self) -> None:
+        """ 启动后台线程
+
+        @return: None
+        """
+        if self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = Thread(target=self.run, name='oauth2-snapshot', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """ 停止后台线程,停止前写入最后一次快照
+
+        @return: None
+        """
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        self.run_once()
@@ -0,0 +1,129 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+
+from logging import getLogger
+from authlib.oauth2.rfc8628 import DeviceCredentialDict
+from authlib.oauth2.rfc8628 import DeviceCodeGrant as BaseDeviceCodeGrant
+from service_authlib.core.server.common.models.user import OAuth2UserModel
+from service_authlib.core.server.common.models.client import OAuth2ClientModel
+
+logger = getLogger(__name__)
+
+
+class DeviceCodeGrant(BaseDeviceCodeGrant):
+    """ 设备授权模式
+
+    doc: https://docs.authlib.org/en/latest/specs/rfc8628.html
+
+    1. oauth2_client表中必须存在对应的client_id
+    2. oauth2_client表中client_metadata字段字典值中grant_types列表值中必须包含urn:ietf:params:oauth:grant-type:device_code
+    3. device_code/user_code/轮询时间/用户确认结果都存放在TTL存储中,客户端在设备码有效期内缓存,用户确认前轮询不会访问数据库
+    4. 轮询过快时返回slow_down并将该设备码的轮询间隔增加5秒
+
+    请求1: /device_authorization
+    Content-Type: application/x-www-form-urlencoded
+
+    client_id:tv
+
+    响应1:
+    Content-Type: application/json
+
+    {
+        "device_code": "Gsi4D4ldB7yJGE4LXxpN6fqMfW7G3ysOsWn8CUTNvN",
+        "user_code": "WDJB-MJHT",
+        "verification_uri": "https://example.com/device",
+        "verification_uri_complete": "https://example.com/device?user_code=WDJB-MJHT",
+        "expires_in": 1800,
+        "interval": 5
+    }
+
+    请求2: /token
+    Content-Type: application/x-www-form-urlencoded
+
+    grant_type:urn:ietf:params:oauth:grant-type:device_code
+    client_id:tv
+    device_code:Gsi4D4ldB7yJGE4LXxpN6fqMfW7G3ysOsWn8CUTNvN
+
+    响应2: 用户确认前返回authorization_pending,轮询过快返回slow_down,确认后返回令牌
+    """
+    # 1. 支持只传递client_id获取token
+    # 2. 支持通过Basic Auth方式传递client_id和client_secret获取token
+    # 3. 支持通过Post  x-www-form-urlencoded编码方式传递client_id和client_secret获取token
+    TOKEN_ENDPOINT_AUTH_METHODS = ['client_secret_basic', 'client_secret_post', 'none']
+
+    def query_device_credential(self, device_code: t.Text) -> t.Optional[DeviceCredentialDict]:
+        """ 查询设备码凭证
+
+        @param device_code: 设备码
+        @return: t.Optional[DeviceCredentialDict]
+        """
+        data = self.server.ttl_store.get(f'device_code:{device_code}')
+        return DeviceCredentialDict(data) if data else None
+
+    def query_user_grant(self, user_code: t.Text) -> t.Optional[t.Tuple[OAuth2UserModel, bool]]:
+        """ 查询用户确认结果
+
+        未确认时按配置在内存中等待确认通知,确认后才会查询一次用户表
+
+        @param user_code: 用户码
+        @return: t.Optional[t.Tuple[OAuth2UserModel, bool]]
+        """
+        store = self.server.ttl_store
+        key = f'user_grant:{user_code}'
+        user_grant = store.get(key)
+        poll_wait = self.server.device_code_config['poll_wait']
+        # 订阅后再检查一次,避免错过查询与订阅之间发布的确认通知
+        if user_grant is None and poll_wait and store.wait(
+                f'device:{user_code}', poll_wait, check=lambda: store.get(key) is not None
+        ):
+            user_grant = store.get(key)
+        if user_grant is None:
+            return None
+        user_id, approved = user_grant
+        if not approved:
+            return None, False
+        logger.debug(f'query device code user with id={user_id}')
+        return self.server.repository.get_user(user_id), True
+
+    def authenticate_token_endpoint_client(self) -> OAuth2ClientModel:
+        """ 认证客户端并在设备码有效期内缓存,后续轮询不再查询客户端表
+
+        @return: OAuth2ClientModel
+        """
+        client = self.server.authenticate_device_client(self.request, self.TOKEN_ENDPOINT_AUTH_METHODS)
+        self.server.send_signal('after_authenticate_client', client=client, grant=self)
+        return client
+
+    def should_slow_down(self, credential: DeviceCredentialDict, now: float) -> bool:
+        """ 是否轮询过快
+
+        轮询过快时按RFC 8628 3.5节将该设备码的轮询间隔增加5秒
+
+        @param credential: 设备码凭证
+        @param now: 当前时间
+        @return: bool
+        """
+        key = f'device_poll:{credential["device_code"]}'
+        poll = self.server.ttl_store.get(key) or {}
+        interval = poll.get('interval', credential['interval'])
+        slow_down = 'last' in poll and now - poll['last'] < interval
+        if slow_down:
+            interval += 5
+        poll = {'last': now, 'interval': interval}
+        self.server.ttl_store.set(key, poll, ttl=max(credential['expires_at'] - now, 1))
+        return slow_down
+
+    def create_token_response(self) -> t.Tuple[int, t.Dict[t.Text, t.Any], t.List[t.Tuple[t.Text, t.Text]]]:
+        """ 签发令牌后删除设备码相关数据,设备码只能兑换一次
+
+        @return: t.Tuple[int, t.Dict[t.Text, t.Any], t.List[t.Tuple[t.Text, t.Text]]]
+        """
+        response = super(DeviceCodeGrant, self).create_token_response()
+        credential = self.request.credential
+        self.server.discard_device_credential(credential['device_code'], credential['user_code'])
+        return response
@@ -54,6 +54,6 @@ class PasswordGrant(ResourceOwnerPasswordCredentialsGrant):
         @param password: 密码
         @return: t.Union[OAuth2UserModel, None]
 
-        注意: 密码模式只是兼容老版本而存在,特殊场景需求请重写依赖注入dependencies中的Oauth2或OpenID的setup方式注入自己的逻辑
+        注意: 密码模式只是兼容老版本而存在,默认校验oauth2_user表password字段中的密码哈希,特殊场景需求请通过password_grant.authenticator配置自己的认证器
         """
-        raise NotImplementedError()
+        return self.server.password_authenticator.authenticate(username, password)
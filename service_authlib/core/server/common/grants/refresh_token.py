@@ -7,7 +7,7 @@ from __future__ import annotations
 import typing as t
 
 from logging import getLogger
-from service_sqlalchemy.core.shortcuts import safe_transaction
+from service_authlib.core.server.common.models.base import make_digest
 from service_authlib.core.server.common.models.user import OAuth2UserModel
 from service_authlib.core.server.common.models.token import OAuth2TokenModel
 from authlib.oauth2.rfc6749.grants import RefreshTokenGrant as BaseRefreshTokenGrant
@@ -53,15 +53,16 @@ class RefreshTokenGrant(BaseRefreshTokenGrant):
         @param refresh_token: 刷新令牌
         @return: t.Union[OAuth2TokenModel, None]
         """
-        with safe_transaction(self.server.service.ORM, commit=False) as session:
-            logger.debug(f'query oauth2 token with refresh_token={refresh_token}')
-            instance = session.query(
-                OAuth2TokenModel
-            ).filter(
-                OAuth2TokenModel.refresh_token == refresh_token
-            ).first()
+        negative_cache = self.server.negative_cache
+        if negative_cache is not None and negative_cache.contains('refresh_token', refresh_token):
+            logger.warning(f'wrong refresh_token')
+            return
+        logger.debug(f'query oauth2 token with refresh_token={refresh_token}')
+        instance = self.server.repository.get_token_by_refresh_token(refresh_token)
         if not instance:
             logger.warning(f'wrong refresh_token')
+            if negative_cache is not None:
+                negative_cache.add('refresh_token', refresh_token)
             return
         if instance.is_expired():
             logger.warning(f'refresh_token has been expired')
@@ -76,14 +77,8 @@ class RefreshTokenGrant(BaseRefreshTokenGrant):
         @param credential: 令牌模型对象
         @return: t.Union[OAuth2UserModel, None]
         """
-        with safe_transaction(self.server.service.ORM, commit=False) as session:
-            logger.debug(f'query oauth2 token user with id={credential.user_id}')
-            instance = session.query(
-                OAuth2UserModel
-            ).filter(
-                OAuth2UserModel.id == credential.user_id
-            ).first()
-        return instance
+        logger.debug(f'query oauth2 token user with id={credential.user_id}')
+        return self.server.repository.get_user(credential.user_id)
 
     def revoke_old_credential(self, credential: OAuth2TokenModel) -> None:
         """ 撤销老的令牌模型对象
@@ -91,7 +86,10 @@ class RefreshTokenGrant(BaseRefreshTokenGrant):
         @param credential: 令牌模型对象
         @return: None
         """
-        with safe_transaction(self.server.service.ORM, commit=True) as session:
-            logger.debug(f'revoke old token {credential.access_token}')
-            credential.revoked = True
-            session.add(credential)
+        logger.debug(f'revoke old token {credential.access_token}')
+        self.server.repository.revoke_token(credential.id)
+        self.server.invalidate_token(credential.access_token)
+        self.server.emit_audit(
+            'token_revoked', client_id=credential.client_id, user_id=credential.user_id,
+            grant_type=self.GRANT_TYPE, subject=make_digest(credential.access_token)
+        )
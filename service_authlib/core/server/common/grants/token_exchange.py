@@ -0,0 +1,125 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import typing as t
+
+from logging import getLogger
+from authlib.oauth2.rfc6749 import InvalidScopeError
+from authlib.oauth2.rfc6749 import InvalidGrantError
+from authlib.oauth2.rfc6749.util import scope_to_list
+from authlib.oauth2.rfc6749 import InvalidRequestError
+from authlib.oauth2.rfc6749.grants.base import BaseGrant
+from authlib.oauth2.rfc6749 import UnauthorizedClientError
+from authlib.oauth2.rfc6749.grants.base import TokenEndpointMixin
+from service_authlib.core.server.common.extend.cache import make_cache_key
+
+logger = getLogger(__name__)
+
+
+class TokenExchangeGrant(BaseGrant, TokenEndpointMixin):
+    """ 令牌交换模式
+
+    doc: https://datatracker.ietf.org/doc/html/rfc8693
+
+    1. oauth2_client表中必须存在对应的client_id和client_secret
+    2. oauth2_client表中client_metadata字段字典值中grant_types列表值中必须包含urn:ietf:params:oauth:grant-type:token-exchange
+    3. subject_token只支持本服务签发的访问令牌,交换后的scope不能超出subject_token的scope
+    4. 交换令牌的有效期不超过subject_token的剩余有效期
+    5. provider_options中配置了token_exchange才会注册此授权
+    6. 按(subject_token, client_id, audience, scope)缓存交换结果,剩余有效期大于leeway时直接复用
+
+    请求1: /token
+    Content-Type: application/x-www-form-urlencoded
+
+    grant_type:urn:ietf:params:oauth:grant-type:token-exchange
+    client_id:order
+    client_secret:order
+    subject_token:2HVieZKDujHsqh1SnxGsd3OeXSvyxd6UsgEd67FE23
+    subject_token_type:urn:ietf:params:oauth:token-type:access_token
+    audience:stock
+
+    响应1:
+    Content-Type: application/json
+
+    {
+        "token_type": "Bearer",
+        "access_token": "bKQ9HBy0ss5L7d7dV1MT0RXjXuGIz6RDsJ8aagVRVg",
+        "expires_in": 864000,
+        "issued_token_type": "urn:ietf:params:oauth:token-type:access_token"
+    }
+    """
+    GRANT_TYPE = 'urn:ietf:params:oauth:grant-type:token-exchange'
+    ACCESS_TOKEN_TYPE = 'urn:ietf:params:oauth:token-type:access_token'
+    # 1. 支持通过Basic Auth方式传递client_id和client_secret获取token
+    # 2. 支持通过Post  x-www-form-urlencoded编码方式传递client_id和client_secret获取token
+    TOKEN_ENDPOINT_AUTH_METHODS = ['client_secret_basic', 'client_secret_post']
+
+    def validate_token_request(self) -> None:
+        """ 校验令牌交换请求
+
+        @return: None
+        """
+        data = self.request.data
+        subject_token = data.get('subject_token')
+        if not subject_token:
+            raise InvalidRequestError('Missing "subject_token" in request.')
+        if data.get('subject_token_type') != self.ACCESS_TOKEN_TYPE:
+            raise InvalidRequestError('Unsupported "subject_token_type" in request.')
+        client = self.authenticate_token_endpoint_client()
+        if not client.check_grant_type(self.GRANT_TYPE):
+            raise UnauthorizedClientError()
+        credential = self.server.query_token(subject_token)
+        if not credential or credential.is_expired() or credential.is_revoked():
+            raise InvalidGrantError('Invalid "subject_token" in request.')
+        scope = self.request.scope or credential.get_scope()
+        if not set(scope_to_list(scope) or []) <= set(scope_to_list(credential.get_scope()) or []):
+            raise InvalidScopeError()
+        self.request.client = client
+        self.request.credential = credential
+        self.exchange_scope = scope
+
+    def create_token_response(self) -> t.Tuple[int, t.Dict[t.Text, t.Any], t.List[t.Tuple[t.Text, t.Text]]]:
+        """ 签发或复用交换令牌
+
+        @return: t.Tuple[int, t.Dict[t.Text, t.Any], t.List[t.Tuple[t.Text, t.Text]]]
+        """
+        now = time.time()
+        client = self.request.client
+        credential = self.request.credential
+        cache = self.server.exchange_cache
+        scope = self.exchange_scope
+        audience = self.request.data.get('audience') or self.request.data.get('resource')
+        key = make_cache_key(credential.access_token, client.client_id, audience, scope)
+        cached = cache.get(key, None)
+        if cached is not None:
+            logger.debug(f'reuse exchanged token for client_id={client.client_id}, audience={audience}')
+            token = dict(cached['token'], expires_in=int(cached['expires_at'] - now))
+            return 200, token, self.TOKEN_RESPONSE_HEADER
+        # 交换令牌不能比subject_token活得更久
+        remaining = int(credential.get_expires_at() - now)
+        if remaining <= 0:
+            raise InvalidGrantError('Invalid "subject_token" in request.')
+        self.request.user = self.server.repository.get_user(credential.user_id)
+        token = self.generate_token(user=self.request.user, scope=scope, include_refresh_token=False)
+        if token.get('expires_in', 0) > remaining:
+            token = self.generate_token(
+                user=self.request.user, scope=scope, expires_in=remaining, include_refresh_token=False
+            )
+        logger.debug(f'issue exchanged token for client_id={client.client_id}, audience={audience}')
+        self.save_token(token)
+        self.execute_hook('process_token', token=token)
+        token['issued_token_type'] = self.ACCESS_TOKEN_TYPE
+        expires_at = min(now + token['expires_in'], credential.get_expires_at())
+        ttl = expires_at - now - self.server.token_exchange_config['leeway']
+        if ttl > 0:
+            value = {
+                'token': token, 'expires_at': expires_at,
+                'user_id': credential.user_id, 'client_id': client.client_id,
+                'subject_client_id': credential.client_id
+            }
+            cache.set(key, value, ttl=ttl)
+        return 200, token, self.TOKEN_RESPONSE_HEADER
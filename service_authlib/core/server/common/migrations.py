@@ -0,0 +1,326 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import typing as t
+import sqlalchemy as sa
+
+from logging import getLogger
+
+from .models import OAuth2UserModel
+from .models import OAuth2AuditModel
+from .models import OAuth2TokenModel
+from .models import OAuth2EventModel
+from .models.base import make_digest
+from .models import OAuth2ClientModel
+from .models import OAuth2ConsentModel
+from .models import OAuth2AuthorizationCodeModel
+
+logger = getLogger(__name__)
+
+# 迁移版本表
+migration_table = sa.Table(
+    'oauth2_migration', sa.MetaData(),
+    sa.Column('version', sa.Integer, primary_key=True, autoincrement=False, comment='迁移版本'),
+    sa.Column('description', sa.String(255), nullable=False, comment='迁移说明'),
+    sa.Column('applied_at', sa.Integer, nullable=False, comment='执行时间'),
+    comment='OAuth2迁移版本'
+)
+
+
+class Migration(object):
+    """ 迁移基类
+
+    transactional为False时升级在非事务连接上执行,由迁移自行分批提交,迁移必须可以重复执行
+    """
+
+    version = 0
+    description = ''
+    transactional = True
+
+    def upgrade(self, connection: sa.engine.Connection) -> None:
+        """ 执行升级
+
+        @param connection: 数据库连接
+        @return: None
+        """
+        raise NotImplementedError()
+
+
+class AddDigestColumns(Migration):
+    """ 增加摘要/过期时间/密码哈希列 """
+
+    version = 1
+    description = 'add refresh_token_hash, expires_at, nonce_hash and password columns'
+
+    columns = [
+        (OAuth2TokenModel.__table__, 'refresh_token_hash'),
+        (OAuth2TokenModel.__table__, 'expires_at'),
+        (OAuth2AuthorizationCodeModel.__table__, 'nonce_hash'),
+        (OAuth2UserModel.__table__, 'password'),
+    ]
+
+    def upgrade(self, connection: sa.engine.Connection) -> None:
+        """ 执行升级
+
+        @param connection: 数据库连接
+        @return: None
+        """
+        inspector = sa.inspect(connection)
+        for table, name in self.columns:
+            exists = {c['name'] for c in inspector.get_columns(table.name)}
+            if name in exists:
+                continue
+            column = sa.schema.CreateColumn(table.c[name]).compile(dialect=connection.dialect)
+            connection.execute(sa.text(f'ALTER TABLE {table.name} ADD COLUMN {column}'))
+
+
+class BackfillDigestColumns(Migration):
+    """ 回填历史数据的摘要和过期时间 """
+
+    version = 2
+    description = 'backfill refresh_token_hash, expires_at and nonce_hash'
+
+    batch_size = 1000
+    # 每批独立提交,不在一个事务中长时间锁住整张表
+    transactional = False
+
+    def backfill(
+            self,
+            connection: sa.engine.Connection,
+            table: sa.Table,
+            column: t.Text,
+            source: t.Text
+    ) -> None:
+        """ 按主键分批回填摘要列
+
+        空字符串的摘要为None,排除空字符串并按主键递增翻页,每行只会被处理一次
+
+        @param connection: 数据库连接
+        @param table: 数据表
+        @param column: 摘要列名
+        @param source: 原始值列名
+        @return: None
+        """
+        select_stmt = sa.select(table.c.id, table.c[source]).where(
+            table.c.id > sa.bindparam('last_id'),
+            table.c[column].is_(None), table.c[source].isnot(None), table.c[source] != ''
+        ).order_by(table.c.id).limit(self.batch_size)
+        update_stmt = table.update().where(
+            table.c.id == sa.bindparam('_id')
+        ).values({column: sa.bindparam('_value')})
+        last_id = 0
+        while True:
+            with connection.begin():
+                rows = connection.execute(select_stmt, {'last_id': last_id}).fetchall()
+                if not rows:
+                    break
+                connection.execute(update_stmt, [{'_id': r[0], '_value': make_digest(r[1])} for r in rows])
+            last_id = rows[-1][0]
+
+    def backfill_expires_at(self, connection: sa.engine.Connection, table: sa.Table) -> None:
+        """ 按主键分批回填令牌过期时间,避免单条语句长时间锁表
+
+        @param connection: 数据库连接
+        @param table: 令牌表
+        @return: None
+        """
+        select_stmt = sa.select(table.c.id).where(
+            table.c.id > sa.bindparam('last_id'), table.c.expires_at.is_(None)
+        ).order_by(table.c.id).limit(self.batch_size)
+        last_id = 0
+        while True:
+            with connection.begin():
+                ids = connection.execute(select_stmt, {'last_id': last_id}).scalars().all()
+                if not ids:
+                    break
+                connection.execute(
+                    table.update().where(
+                        table.c.id >= ids[0], table.c.id <= ids[-1], table.c.expires_at.is_(None)
+                    ).values(expires_at=table.c.issued_at + table.c.expires_in)
+                )
+            last_id = ids[-1]
+
+    def upgrade(self, connection: sa.engine.Connection) -> None:
+        """ 执行升级
+
+        @param connection: 数据库连接
+        @return: None
+        """
+        token_table = OAuth2TokenModel.__table__
+        code_table = OAuth2AuthorizationCodeModel.__table__
+        self.backfill(connection, token_table, 'refresh_token_hash', 'refresh_token')
+        self.backfill(connection, code_table, 'nonce_hash', 'nonce')
+        self.backfill_expires_at(connection, token_table)
+
+
+class CreateIndexes(Migration):
+    """ 创建授权流程查询所需索引 """
+
+    version = 3
+    description = 'create indexes for grant query patterns'
+
+    def upgrade(self, connection: sa.engine.Connection) -> None:
+        """ 执行升级
+
+        @param connection: 数据库连接
+        @return: None
+        """
+        inspector = sa.inspect(connection)
+        for table in (OAuth2TokenModel.__table__, OAuth2AuthorizationCodeModel.__table__):
+            exists = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in exists:
+                    index.create(connection)
+
+
+class CreateEventTable(Migration):
+    """ 创建缓存失效事件表 """
+
+    version = 4
+    description = 'create oauth2_event table for cache invalidation'
+
+    def upgrade(self, connection: sa.engine.Connection) -> None:
+        """ 执行升级
+
+        @param connection: 数据库连接
+        @return: None
+        """
+        OAuth2EventModel.__table__.create(connection, checkfirst=True)
+
+
+class CreateConsentTable(Migration):
+    """ 创建授权同意记录表 """
+
+    version = 5
+    description = 'create oauth2_consent table for remembered consents'
+
+    def upgrade(self, connection: sa.engine.Connection) -> None:
+        """ 执行升级
+
+        @param connection: 数据库连接
+        @return: None
+        """
+        OAuth2ConsentModel.__table__.create(connection, checkfirst=True)
+
+
+class CreateAuditTable(Migration):
+    """ 创建审计记录表 """
+
+    version = 6
+    description = 'create oauth2_audit table for audit events'
+
+    def upgrade(self, connection: sa.engine.Connection) -> None:
+        """ 执行升级
+
+        @param connection: 数据库连接
+        @return: None
+        """
+        OAuth2AuditModel.__table__.create(connection, checkfirst=True)
+
+
+MIGRATIONS = [
+    AddDigestColumns(), BackfillDigestColumns(), CreateIndexes(), CreateEventTable(), CreateConsentTable(),
+    CreateAuditTable()
+]
+
+
+def get_bind(orm: t.Any) -> t.Optional[t.Union[sa.engine.Engine, sa.engine.Connection]]:
+    """ 从ORM对象中获取数据库连接
+
+    @param orm: 会话/引擎等ORM对象
+    @return: t.Optional[t.Union[sa.engine.Engine, sa.engine.Connection]]
+    """
+    if isinstance(orm, (sa.engine.Engine, sa.engine.Connection)):
+        return orm
+    get_bind_func = getattr(orm, 'get_bind', None)
+    if callable(get_bind_func):
+        return get_bind_func()
+    return getattr(orm, 'bind', None) or getattr(orm, 'engine', None)
+
+
+def current_version(connection: sa.engine.Connection) -> int:
+    """ 获取当前迁移版本
+
+    @param connection: 数据库连接
+    @return: int
+    """
+    migration_table.create(connection, checkfirst=True)
+    version = connection.execute(sa.select(sa.func.max(migration_table.c.version))).scalar()
+    return version or 0
+
+
+def upgrade(bind: t.Union[sa.engine.Engine, sa.engine.Connection], target: t.Optional[int] = None) -> int:
+    """ 按版本顺序执行未执行的迁移
+
+    通过BaseModel.metadata.create_all新建的库同样可以执行,已存在的列和索引会被跳过
+
+    @param bind: 数据库引擎或连接
+    @param target: 目标版本,默认最新版本
+    @return: int 执行后的版本
+    """
+    engine = bind.engine if isinstance(bind, sa.engine.Connection) else bind
+    with engine.begin() as connection:
+        version = current_version(connection)
+    for migration in MIGRATIONS:
+        if migration.version <= version or (target is not None and migration.version > target):
+            continue
+        logger.info(f'upgrade oauth2 schema to {migration.version}: {migration.description}')
+        if not migration.transactional:
+            with engine.connect() as connection:
+                migration.upgrade(connection)
+        with engine.begin() as connection:
+            if migration.transactional:
+                migration.upgrade(connection)
+            connection.execute(migration_table.insert().values(
+                version=migration.version, description=migration.description, applied_at=int(time.time())
+            ))
+        version = migration.version
+    return version
+
+
+def check_columns(bind: t.Union[sa.engine.Engine, sa.engine.Connection]) -> t.List[t.Tuple[t.Text, t.Text]]:
+    """ 检查授权流程依赖的摘要/过期时间列是否存在
+
+    仓库按摘要列查询刷新令牌和nonce,模型写入时也会写这些列,缺失时读写都会失败
+
+    @param bind: 数据库引擎或连接
+    @return: t.List[t.Tuple[t.Text, t.Text]] 缺失的(表名, 列名)列表
+    """
+    missing = []
+    inspector = sa.inspect(bind)
+    for table, name in AddDigestColumns.columns:
+        if not inspector.has_table(table.name):
+            continue
+        if name not in {c['name'] for c in inspector.get_columns(table.name)}:
+            missing.append((table.name, name))
+    return missing
+
+
+def check_indexes(bind: t.Union[sa.engine.Engine, sa.engine.Connection]) -> t.List[t.Tuple[t.Text, t.Text]]:
+    """ 检查授权流程依赖的索引是否存在
+
+    @param bind: 数据库引擎或连接
+    @return: t.List[t.Tuple[t.Text, t.Text]] 缺失的(表名, 索引列)列表
+    """
+    missing = []
+    inspector = sa.inspect(bind)
+    tables = (OAuth2TokenModel.__table__, OAuth2ClientModel.__table__, OAuth2AuthorizationCodeModel.__table__)
+    for table in tables:
+        if not inspector.has_table(table.name):
+            continue
+        exists = {tuple(i['column_names']) for i in inspector.get_indexes(table.name)}
+        exists |= {tuple(c['column_names']) for c in inspector.get_unique_constraints(table.name)}
+        for index in table.indexes:
+            columns = tuple(c.name for c in index.columns)
+            if columns in exists:
+                continue
+            missing.append((table.name, ', '.join(columns)))
+            logger.warning(
+                f'missing index on {table.name}({", ".join(columns)}), '
+                f'please run service_authlib.core.server.common.migrations.upgrade'
+            )
+    return missing
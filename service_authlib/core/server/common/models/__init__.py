@@ -5,6 +5,14 @@
 from __future__ import annotations
 
 from .user import OAuth2UserModel
+from .audit import OAuth2AuditModel
 from .token import OAuth2TokenModel
+from .event import OAuth2EventModel
 from .client import OAuth2ClientModel
+from .consent import OAuth2ConsentModel
 from .authorization_code import OAuth2AuthorizationCodeModel
+
+from .snapshot import UserSnapshot
+from .snapshot import TokenSnapshot
+from .snapshot import ClientSnapshot
+from .snapshot import AuthorizationCodeSnapshot
@@ -0,0 +1,32 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import sqlalchemy as sa
+
+from .base import BaseModel
+
+
+class OAuth2AuditModel(BaseModel):
+    """ OAuth2审计记录 """
+    __tablename__ = 'oauth2_audit'
+    __table_args__ = (
+        # 按时间清理或导出审计记录
+        sa.Index('ix_oauth2_audit_created_at', 'created_at'),
+        # 按客户端查询审计记录
+        sa.Index('ix_oauth2_audit_client_id_created_at', 'client_id', 'created_at'),
+        # 字典配置必须放最底部
+        {'comment': 'OAuth2审计记录'},
+    )
+    id = sa.Column(sa.BigInteger, primary_key=True, comment='唯一主键')
+    event = sa.Column(sa.String(32), nullable=False, comment='事件类型')
+    client_id = sa.Column(sa.String(48), nullable=True, comment='客户端 ID')
+    user_id = sa.Column(sa.String(64), nullable=True, comment='用户 ID')
+    grant_type = sa.Column(sa.String(128), nullable=True, comment='授权类型')
+    scope = sa.Column(sa.Text, nullable=True, comment='授权范围')
+    subject = sa.Column(sa.String(32), nullable=True, comment='令牌或授权码摘要')
+    detail = sa.Column(sa.Text, nullable=True, comment='其它信息')
+    created_at = sa.Column(sa.Integer, nullable=False, default=lambda: int(time.time()), comment='发生时间')
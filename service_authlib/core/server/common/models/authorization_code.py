@@ -11,15 +11,21 @@ from sqlalchemy.orm import relationship
 from authlib.integrations.sqla_oauth2 import OAuth2AuthorizationCodeMixin
 
 from .base import BaseModel
+from .base import digest_default
 
 
 class OAuth2AuthorizationCodeModel(BaseModel, OAuth2AuthorizationCodeMixin, su.Timestamp):
     """ OAuth2授权码 """
     __tablename__ = 'oauth2_authorization_code'
     __table_args__ = (
+        # 授权码兑换时按(client_id, code)查询
+        sa.Index('ix_oauth2_authorization_code_client_id_code', 'client_id', 'code'),
+        # OpenID防重放时通过定长摘要查询nonce
+        sa.Index('ix_oauth2_authorization_code_nonce_hash', 'nonce_hash'),
         # 字典配置必须放最底部
         {'comment': 'OAuth2授权码'},
     )
     id = sa.Column(sa.BigInteger, primary_key=True, comment='唯一主键')
     user_id = sa.Column(sa.BigInteger, sa.ForeignKey('oauth2_user.id', ondelete='CASCADE'), comment='用户 ID')
+    nonce_hash = sa.Column(sa.CHAR(32), default=digest_default('nonce'), comment='随机码摘要')
     user = relationship('OAuth2UserModel', backref='authorization_codes')
@@ -4,6 +4,52 @@
 
 from __future__ import annotations
 
+import time
+import typing as t
+
+from hashlib import blake2b
 from sqlalchemy.ext.declarative import declarative_base
 
 BaseModel = declarative_base()
+
+
+def make_digest(value: t.Optional[t.Text]) -> t.Optional[t.Text]:
+    """ 生成定长摘要
+
+    长令牌/随机码不直接建索引,统一索引32位十六进制摘要列
+
+    @param value: 原始值
+    @return: t.Optional[t.Text]
+    """
+    return blake2b(value.encode('utf-8'), digest_size=16).hexdigest() if value else None
+
+
+def digest_default(column: t.Text) -> t.Callable[[t.Any], t.Optional[t.Text]]:
+    """ 生成摘要列的默认值函数
+
+    @param column: 原始值列名
+    @return: t.Callable[[t.Any], t.Optional[t.Text]]
+    """
+
+    def default(context: t.Any) -> t.Optional[t.Text]:
+        """ 根据同一行的原始值计算摘要
+
+        @param context: 执行上下文
+        @return: t.Optional[t.Text]
+        """
+        return make_digest(context.get_current_parameters().get(column))
+
+    return default
+
+
+def expires_at_default(context: t.Any) -> t.Optional[int]:
+    """ 根据同一行的签发时间和有效期计算过期时间
+
+    @param context: 执行上下文
+    @return: t.Optional[int]
+    """
+    params = context.get_current_parameters()
+    expires_in = params.get('expires_in')
+    if expires_in is None:
+        return None
+    return (params.get('issued_at') or int(time.time())) + expires_in
@@ -10,6 +10,8 @@ import sqlalchemy_utils as su
 
 from sqlalchemy.orm import relationship
 from authlib.integrations.sqla_oauth2 import OAuth2ClientMixin
+from service_authlib.core.server.common.extend.hashers import make_password
+from service_authlib.core.server.common.extend.hashers import check_password
 
 from .base import BaseModel
 
@@ -41,3 +43,22 @@ class OAuth2ClientModel(BaseModel, OAuth2ClientMixin, su.Timestamp):
         """
         # 如果本地或数据库中没有指定获取token的方法依然允许尝试授权中其它获取token的方法
         return True if self.token_endpoint_auth_method is None else self.token_endpoint_auth_method == method
+
+    def set_client_secret(self, client_secret: t.Text, algorithm: t.Text = 'pbkdf2_sha256') -> None:
+        """ 以哈希形式设置客户端密钥
+
+        @param client_secret: 客户端密钥明文
+        @param algorithm: 哈希算法,可选pbkdf2_sha256,bcrypt,argon2
+        @return: None
+        """
+        self.client_secret = make_password(client_secret, algorithm=algorithm)
+
+    def check_client_secret(self, client_secret: t.Text) -> bool:
+        """ 校验客户端密钥
+
+        @param client_secret: 客户端密钥明文
+        @return: bool
+
+        注意: 无法识别哈希算法的密钥按明文比较,兼容历史数据
+        """
+        return check_password(client_secret, self.client_secret)
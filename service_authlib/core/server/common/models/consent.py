@@ -0,0 +1,27 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+import sqlalchemy_utils as su
+
+from .base import BaseModel
+
+
+class OAuth2ConsentModel(BaseModel, su.Timestamp):
+    """ OAuth2用户授权同意记录 """
+    __tablename__ = 'oauth2_consent'
+    __table_args__ = (
+        # 每个(用户, 客户端)只保留一条记录,按用户或客户端批量撤销
+        sa.UniqueConstraint('user_id', 'client_id', name='uq_oauth2_consent_user_id_client_id'),
+        sa.Index('ix_oauth2_consent_client_id', 'client_id'),
+        # 字典配置必须放最底部
+        {'comment': 'OAuth2用户授权同意记录'},
+    )
+    id = sa.Column(sa.BigInteger, primary_key=True, comment='唯一主键')
+    user_id = sa.Column(sa.BigInteger, sa.ForeignKey('oauth2_user.id', ondelete='CASCADE'), nullable=False, comment='用户 ID')
+    client_id = sa.Column(sa.String(48), nullable=False, comment='客户端 ID')
+    scope = sa.Column(sa.Text, nullable=False, default='', comment='已同意的授权范围')
+    expires_at = sa.Column(sa.Integer, nullable=False, comment='过期时间')
@@ -0,0 +1,26 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import time
+import sqlalchemy as sa
+
+from .base import BaseModel
+
+
+class OAuth2EventModel(BaseModel):
+    """ OAuth2缓存失效事件 """
+    __tablename__ = 'oauth2_event'
+    __table_args__ = (
+        # 清理过期事件
+        sa.Index('ix_oauth2_event_created_at', 'created_at'),
+        # 字典配置必须放最底部
+        {'comment': 'OAuth2缓存失效事件'},
+    )
+    id = sa.Column(sa.BigInteger, primary_key=True, comment='单调递增主键')
+    node = sa.Column(sa.String(32), nullable=False, comment='发布节点')
+    kind = sa.Column(sa.String(32), nullable=False, comment='事件类型')
+    key = sa.Column(sa.String(255), nullable=False, comment='失效键')
+    created_at = sa.Column(sa.Integer, nullable=False, default=lambda: int(time.time()), comment='创建时间')
@@ -0,0 +1,210 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import types
+import inspect
+import typing as t
+import sqlalchemy as sa
+
+from .user import OAuth2UserModel
+from .token import OAuth2TokenModel
+from .client import OAuth2ClientModel
+from .authorization_code import OAuth2AuthorizationCodeModel
+
+
+def restore_snapshot(cls: t.Type[Snapshot], fields: t.Dict[t.Text, t.Any]) -> Snapshot:
+    """ 反序列化时重建快照
+
+    @param cls: 快照类
+    @param fields: 字段字典
+    @return: Snapshot
+    """
+    return cls(**fields)
+
+
+class Snapshot(object):
+    """ 只读快照基类
+
+    读路径上代替会话关闭后的ORM对象,只保存__slots__中声明的列,没有实例状态和延迟加载,可以安全地放入缓存
+
+    1. 快照本身不实现业务方法,未声明的方法和只读属性委托给绑定的模型类,与ORM对象共用同一份实现
+    2. 仓库初始化时绑定自定义模型,自定义模型重写的方法对快照同样生效,方法中只能访问__slots__中的列
+    3. 同一进程中一个快照类只能绑定默认模型之外的一个自定义模型
+    """
+
+    __slots__ = ()
+
+    # 默认模型类
+    default_model = None
+    # 当前绑定的模型类
+    model = None
+    # 模型类中可委托的方法和属性缓存
+    delegates = {}
+
+    def __init__(self, **fields: t.Any) -> None:
+        """ 初始化实例
+
+        @param fields: 字段字典
+        """
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.get(name))
+
+    @classmethod
+    def bind(cls, model: t.Any) -> None:
+        """ 绑定模型类
+
+        @param model: 模型类
+        @return: None
+        """
+        if model is cls.model:
+            return
+        if cls.model is not None and cls.model is not cls.default_model:
+            raise RuntimeError(
+                f'{cls.__name__} is already bound to {cls.model.__name__}, can not bind {model.__name__}'
+            )
+        cls.model = model
+        cls.delegates = {}
+
+    @classmethod
+    def delegate(cls, name: t.Text) -> t.Any:
+        """ 查找模型类中可委托的方法或只读属性
+
+        @param name: 属性名
+        @return: t.Any
+        """
+        if name not in cls.delegates:
+            attr = inspect.getattr_static(cls.model, name, None)
+            cls.delegates[name] = attr if isinstance(attr, property) or inspect.isfunction(attr) else None
+        return cls.delegates[name]
+
+    @classmethod
+    def columns(cls, model: t.Any) -> t.List[sa.Column]:
+        """ 快照对应的数据表列,自定义模型中不存在的列在快照中为None
+
+        @param model: 模型类
+        @return: t.List[sa.Column]
+        """
+        return [model.__table__.c[name] for name in cls.__slots__ if name in model.__table__.c]
+
+    @classmethod
+    def from_row(cls, row: t.Any) -> Snapshot:
+        """ 从Core查询结果行创建快照
+
+        @param row: 结果行
+        @return: Snapshot
+        """
+        return cls(**row._mapping)
+
+    def as_dict(self) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字段字典
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __getattr__(self, name: t.Text) -> t.Any:
+        attr = None
+        if not name.startswith('__') and self.model is not None and name not in self.__slots__:
+            attr = self.delegate(name)
+        if attr is None:
+            raise AttributeError(f'{self.__class__.__name__} object has no attribute {name}')
+        return attr.fget(self) if isinstance(attr, property) else types.MethodType(attr, self)
+
+    def __setattr__(self, name: t.Text, value: t.Any) -> None:
+        raise AttributeError(f'{self.__class__.__name__} is read-only')
+
+    def __delattr__(self, name: t.Text) -> None:
+        raise AttributeError(f'{self.__class__.__name__} is read-only')
+
+    def __reduce__(self) -> t.Tuple[t.Callable, t.Tuple[t.Any, ...]]:
+        return restore_snapshot, (self.__class__, self.as_dict())
+
+    def __repr__(self) -> t.Text:
+        return f'<{self.__class__.__name__} id={self.id}>'
+
+
+class ClientSnapshot(Snapshot):
+    """ OAuth2客户端快照,client_metadata为只读映射,缓存共享的快照不会被调用方修改 """
+
+    __slots__ = (
+        'id', 'user_id', 'client_id', 'client_secret',
+        'client_id_issued_at', 'client_secret_expires_at', 'client_metadata'
+    )
+
+    default_model = OAuth2ClientModel
+
+    def __init__(self, **fields: t.Any) -> None:
+        """ 初始化实例
+
+        @param fields: 字段字典
+        """
+        metadata = types.MappingProxyType(dict(fields.get('client_metadata') or {}))
+        super(ClientSnapshot, self).__init__(**dict(fields, client_metadata=metadata))
+
+    @classmethod
+    def from_row(cls, row: t.Any) -> ClientSnapshot:
+        """ 从Core查询结果行创建快照,client_metadata只解析一次
+
+        @param row: 结果行
+        @return: ClientSnapshot
+        """
+        fields = dict(row._mapping)
+        fields['client_metadata'] = json.loads(fields['client_metadata']) if fields['client_metadata'] else {}
+        return cls(**fields)
+
+    def as_dict(self) -> t.Dict[t.Text, t.Any]:
+        """ 转换为字段字典,client_metadata转换为普通字典以便序列化
+
+        @return: t.Dict[t.Text, t.Any]
+        """
+        fields = super(ClientSnapshot, self).as_dict()
+        fields['client_metadata'] = dict(self.client_metadata)
+        return fields
+
+
+class AuthorizationCodeSnapshot(Snapshot):
+    """ OAuth2授权码快照 """
+
+    __slots__ = (
+        'id', 'user_id', 'code', 'client_id', 'redirect_uri', 'response_type',
+        'scope', 'nonce', 'auth_time', 'code_challenge', 'code_challenge_method'
+    )
+
+    default_model = OAuth2AuthorizationCodeModel
+
+
+class TokenSnapshot(Snapshot):
+    """ OAuth2令牌快照 """
+
+    __slots__ = (
+        'id', 'user_id', 'client_id', 'token_type', 'access_token',
+        'refresh_token', 'scope', 'revoked', 'issued_at', 'expires_in'
+    )
+
+    default_model = OAuth2TokenModel
+
+
+class UserSnapshot(Snapshot):
+    """ OAuth2用户快照,不包含密码哈希 """
+
+    __slots__ = ('id', 'name')
+
+    default_model = OAuth2UserModel
+
+    def get_user_id(self) -> t.Any:
+        """ 获取用户id
+
+        @return: t.Any
+        """
+        return self.id
+
+    def __repr__(self) -> t.Text:
+        return f'<{self.__class__.__name__} id={self.id} name={self.name}>'
+
+
+for snapshot_class in (ClientSnapshot, AuthorizationCodeSnapshot, TokenSnapshot, UserSnapshot):
+    snapshot_class.bind(snapshot_class.default_model)
@@ -13,17 +13,27 @@ from sqlalchemy.orm import relationship
 from authlib.integrations.sqla_oauth2 import OAuth2TokenMixin
 
 from .base import BaseModel
+from .base import digest_default
+from .base import expires_at_default
 
 
 class OAuth2TokenModel(BaseModel, OAuth2TokenMixin, su.Timestamp):
     """ OAuth2令牌 """
     __tablename__ = 'oauth2_token'
     __table_args__ = (
+        # 按用户/客户端批量撤销和查询
+        sa.Index('ix_oauth2_token_user_id_client_id', 'user_id', 'client_id'),
+        # 清理过期令牌
+        sa.Index('ix_oauth2_token_expires_at', 'expires_at'),
+        # 刷新令牌通过定长摘要查询
+        sa.Index('ix_oauth2_token_refresh_token_hash', 'refresh_token_hash'),
         # 字典配置必须放最底部
         {'comment': 'OAuth2令牌'},
     )
     id = sa.Column(sa.BigInteger, primary_key=True, comment='唯一主键')
     user_id = sa.Column(sa.BigInteger, sa.ForeignKey('oauth2_user.id', ondelete='CASCADE'), comment='用户 ID')
+    refresh_token_hash = sa.Column(sa.CHAR(32), default=digest_default('refresh_token'), comment='刷新令牌摘要')
+    expires_at = sa.Column(sa.Integer, default=expires_at_default, comment='过期时间')
     user = relationship('OAuth2UserModel', backref='tokens')
 
     def is_revoked(self) -> bool:
@@ -38,6 +48,4 @@ class OAuth2TokenModel(BaseModel, OAuth2TokenMixin, su.Timestamp):
 
         @return: bool
         """
-        expires_in = self.get_expires_in()
-        expires_at = self.get_expires_at()
-        return time.time() > expires_at + expires_in
+        return time.time() > self.get_expires_at()
@@ -4,9 +4,12 @@
 
 from __future__ import annotations
 
+import typing as t
 import sqlalchemy as sa
 import sqlalchemy_utils as su
 
+from service_authlib.core.server.common.extend.hashers import make_password
+
 from .base import BaseModel
 
 
@@ -19,3 +22,13 @@ class OAuth2UserModel(BaseModel, su.Timestamp):
     )
     id = sa.Column(sa.BigInteger, primary_key=True, comment='唯一主键')
     name = sa.Column(sa.String(64), nullable=False, unique=True, comment='用户名')
+    password = sa.Column(sa.String(255), nullable=True, comment='密码哈希')
+
+    def set_password(self, password: t.Text, algorithm: t.Text = 'pbkdf2_sha256') -> None:
+        """ 以哈希形式设置密码
+
+        @param password: 密码明文
+        @param algorithm: 哈希算法,可选pbkdf2_sha256,bcrypt,argon2
+        @return: None
+        """
+        self.password = make_password(password, algorithm=algorithm)
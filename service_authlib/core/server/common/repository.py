@@ -0,0 +1,286 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import typing as t
+import sqlalchemy as sa
+
+from service_sqlalchemy.core.shortcuts import safe_transaction
+
+from .models import OAuth2UserModel
+from .models import OAuth2TokenModel
+from .models.base import make_digest
+from .models.snapshot import Snapshot
+from .models import OAuth2ClientModel
+from .models.snapshot import UserSnapshot
+from .models.snapshot import TokenSnapshot
+from .models.snapshot import ClientSnapshot
+from .models import OAuth2AuthorizationCodeModel
+from .models.snapshot import AuthorizationCodeSnapshot
+
+
+class OAuth2Repository(object):
+    """ OAuth2数据仓库
+
+    集中授权流程中的热点查询,所有语句在初始化时构造一次并使用绑定参数,执行时复用SQLAlchemy的编译缓存
+
+    1. 读路径只查询快照需要的列并返回只读快照,不装配ORM对象,会话关闭后也不会触发延迟加载
+    2. 只需判断存在与否的查询使用Core语句返回标量
+    3. 写路径(撤销令牌,删除授权码)按主键执行单条Core语句
+    4. 快照绑定传入的模型类,模型方法中只能访问快照中的列
+    """
+
+    def __init__(
+            self,
+            server: t.Any,
+            token_model: t.Type[OAuth2TokenModel] = OAuth2TokenModel,
+            client_model: t.Type[OAuth2ClientModel] = OAuth2ClientModel,
+            user_model: t.Type[OAuth2UserModel] = OAuth2UserModel,
+            code_model: t.Type[OAuth2AuthorizationCodeModel] = OAuth2AuthorizationCodeModel
+    ) -> None:
+        """ 初始化实例
+
+        @param server: 授权服务器
+        @param token_model: 令牌模型
+        @param client_model: 客户端模型
+        @param user_model: 用户模型
+        @param code_model: 授权码模型
+        """
+        self.server = server
+        self.user_model = user_model
+        self.code_model = code_model
+        self.token_model = token_model
+        self.client_model = client_model
+        # 快照的方法委托给实际使用的模型类,自定义模型重写的方法对快照同样生效
+        UserSnapshot.bind(user_model)
+        TokenSnapshot.bind(token_model)
+        ClientSnapshot.bind(client_model)
+        AuthorizationCodeSnapshot.bind(code_model)
+        self.client_stmt = sa.select(*ClientSnapshot.columns(client_model)).where(
+            client_model.client_id == sa.bindparam('client_id')
+        ).limit(1)
+        self.code_stmt = sa.select(*AuthorizationCodeSnapshot.columns(code_model)).where(
+            code_model.code == sa.bindparam('code'),
+            code_model.client_id == sa.bindparam('client_id')
+        ).limit(1)
+        self.access_token_stmt = sa.select(*TokenSnapshot.columns(token_model)).where(
+            token_model.access_token == sa.bindparam('access_token')
+        ).limit(1)
+        self.refresh_token_stmt = sa.select(*TokenSnapshot.columns(token_model)).where(
+            token_model.refresh_token_hash == sa.bindparam('refresh_token_hash'),
+            token_model.refresh_token == sa.bindparam('refresh_token')
+        ).limit(1)
+        self.token_columns_stmt = sa.select(
+            token_model.access_token, token_model.issued_at, token_model.expires_in, token_model.revoked
+        ).where(token_model.access_token.in_(sa.bindparam('access_tokens', expanding=True)))
+        self.user_stmt = sa.select(*UserSnapshot.columns(user_model)).where(
+            user_model.id == sa.bindparam('user_id')
+        ).limit(1)
+        self.user_name_stmt = sa.select(*UserSnapshot.columns(user_model)).where(
+            user_model.name == sa.bindparam('name')
+        ).limit(1)
+        self.user_password_stmt = sa.select(*UserSnapshot.columns(user_model), user_model.password).where(
+            user_model.name == sa.bindparam('name')
+        ).limit(1)
+        self.nonce_stmt = sa.select(sa.literal(1)).select_from(code_model).where(
+            code_model.nonce_hash == sa.bindparam('nonce_hash'),
+            code_model.nonce == sa.bindparam('nonce')
+        ).limit(1)
+
+    @property
+    def orm(self) -> t.Any:
+        """ 当前服务的ORM会话
+
+        @return: t.Any
+        """
+        return self.server.service.ORM
+
+    def first(self, stmt: sa.sql.Select, snapshot: t.Type[Snapshot], **params: t.Any) -> t.Optional[Snapshot]:
+        """ 执行Core查询并将首行转换为快照
+
+        @param stmt: 查询语句
+        @param snapshot: 快照类
+        @param params: 绑定参数
+        @return: t.Optional[Snapshot]
+        """
+        with self.server.tracer.span('db.query', snapshot=snapshot.__name__), self.server.breaker.guard():
+            with safe_transaction(self.orm, commit=False) as session:
+                row = session.execute(stmt, params).first()
+        return None if row is None else snapshot.from_row(row)
+
+    def scalar(self, stmt: sa.sql.Select, **params: t.Any) -> t.Any:
+        """ 执行Core查询并返回首个标量
+
+        @param stmt: 查询语句
+        @param params: 绑定参数
+        @return: t.Any
+        """
+        with self.server.tracer.span('db.query'), self.server.breaker.guard():
+            with safe_transaction(self.orm, commit=False) as session:
+                return session.execute(stmt, params).scalar()
+
+    def get_client(self, client_id: t.Text) -> t.Optional[ClientSnapshot]:
+        """ 按client_id查询客户端
+
+        @param client_id: 客户端id
+        @return: t.Optional[ClientSnapshot]
+        """
+        return self.first(self.client_stmt, ClientSnapshot, client_id=client_id)
+
+    def list_clients(self, limit: int) -> t.List[ClientSnapshot]:
+        """ 按id顺序查询客户端
+
+        @param limit: 最多返回数
+        @return: t.List[ClientSnapshot]
+        """
+        stmt = sa.select(*ClientSnapshot.columns(self.client_model)).order_by(self.client_model.id).limit(limit)
+        with self.server.tracer.span('db.query', snapshot=ClientSnapshot.__name__), self.server.breaker.guard():
+            with safe_transaction(self.orm, commit=False) as session:
+                rows = session.execute(stmt).fetchall()
+        return [ClientSnapshot.from_row(row) for row in rows]
+
+    def get_authorization_code(self, code: t.Text, client_id: t.Text) -> t.Optional[AuthorizationCodeSnapshot]:
+        """ 按(code, client_id)查询授权码
+
+        @param code: 授权码
+        @param client_id: 客户端id
+        @return: t.Optional[AuthorizationCodeSnapshot]
+        """
+        return self.first(self.code_stmt, AuthorizationCodeSnapshot, code=code, client_id=client_id)
+
+    def get_token(self, access_token: t.Text) -> t.Optional[TokenSnapshot]:
+        """ 按access_token查询令牌
+
+        @param access_token: 访问令牌
+        @return: t.Optional[TokenSnapshot]
+        """
+        return self.first(self.access_token_stmt, TokenSnapshot, access_token=access_token)
+
+    def get_token_columns(
+            self,
+            access_tokens: t.Sequence[t.Text],
+            batch_size: int = 1000
+    ) -> t.Tuple[t.List[t.Optional[int]], t.List[t.Optional[int]], t.List[t.Optional[bool]]]:
+        """ 按列批量查询令牌的签发时间/有效秒数/是否撤销
+
+        每batch_size个令牌一条IN查询,结果按传入顺序排列,不存在的令牌各列为None
+
+        @param access_tokens: 访问令牌列表
+        @param batch_size: 每条查询的令牌数
+        @return: t.Tuple[t.List[t.Optional[int]], t.List[t.Optional[int]], t.List[t.Optional[bool]]]
+        """
+        rows = {}
+        with self.server.tracer.span('db.query', snapshot='token_columns'), self.server.breaker.guard():
+            with safe_transaction(self.orm, commit=False) as session:
+                for i in range(0, len(access_tokens), batch_size):
+                    params = {'access_tokens': list(access_tokens[i:i + batch_size])}
+                    for row in session.execute(self.token_columns_stmt, params):
+                        rows[row[0]] = row
+        issued_at, expires_in, revoked = [], [], []
+        for access_token in access_tokens:
+            row = rows.get(access_token)
+            issued_at.append(None if row is None else row[1])
+            expires_in.append(None if row is None else row[2])
+            revoked.append(None if row is None else row[3])
+        return issued_at, expires_in, revoked
+
+    def get_token_by_refresh_token(self, refresh_token: t.Text) -> t.Optional[TokenSnapshot]:
+        """ 按refresh_token查询令牌
+
+        @param refresh_token: 刷新令牌
+        @return: t.Optional[TokenSnapshot]
+        """
+        refresh_token_hash = make_digest(refresh_token)
+        return self.first(
+            self.refresh_token_stmt, TokenSnapshot, refresh_token_hash=refresh_token_hash, refresh_token=refresh_token
+        )
+
+    def get_user(self, user_id: t.Any) -> t.Optional[UserSnapshot]:
+        """ 按id查询用户
+
+        @param user_id: 用户id
+        @return: t.Optional[UserSnapshot]
+        """
+        return self.first(self.user_stmt, UserSnapshot, user_id=user_id)
+
+    def get_user_by_name(self, name: t.Text) -> t.Optional[UserSnapshot]:
+        """ 按用户名查询用户
+
+        @param name: 用户名
+        @return: t.Optional[UserSnapshot]
+        """
+        return self.first(self.user_name_stmt, UserSnapshot, name=name)
+
+    def get_user_password(self, name: t.Text) -> t.Optional[t.Tuple[UserSnapshot, t.Optional[t.Text]]]:
+        """ 按用户名查询用户及密码哈希
+
+        密码哈希只用于本次认证,不放入快照,快照可以安全地缓存
+
+        @param name: 用户名
+        @return: t.Optional[t.Tuple[UserSnapshot, t.Optional[t.Text]]]
+        """
+        with self.server.tracer.span('db.query', snapshot=UserSnapshot.__name__), self.server.breaker.guard():
+            with safe_transaction(self.orm, commit=False) as session:
+                row = session.execute(self.user_password_stmt, {'name': name}).first()
+        return None if row is None else (UserSnapshot.from_row(row), row._mapping['password'])
+
+    def exists_nonce(self, nonce: t.Text) -> bool:
+        """ 检查nonce是否已被授权码使用
+
+        @param nonce: 随机码
+        @return: bool
+        """
+        return self.scalar(self.nonce_stmt, nonce_hash=make_digest(nonce), nonce=nonce) is not None
+
+    def revoke_token(self, token_id: t.Any) -> bool:
+        """ 按主键撤销单个令牌
+
+        @param token_id: 令牌主键
+        @return: bool 是否撤销成功
+        """
+        stmt = sa.update(self.token_model).where(
+            self.token_model.id == token_id, self.token_model.revoked == sa.false()
+        ).values(revoked=True).execution_options(synchronize_session=False)
+        with self.server.breaker.guard(), safe_transaction(self.orm, commit=True) as session:
+            return session.execute(stmt).rowcount > 0
+
+    def delete_authorization_code(self, code_id: t.Any) -> bool:
+        """ 按主键删除单个授权码
+
+        @param code_id: 授权码主键
+        @return: bool 是否删除成功
+        """
+        stmt = sa.delete(self.code_model).where(
+            self.code_model.id == code_id
+        ).execution_options(synchronize_session=False)
+        with self.server.breaker.guard(), safe_transaction(self.orm, commit=True) as session:
+            return session.execute(stmt).rowcount > 0
+
+    def revoke(self, user_id: t.Optional[t.Any] = None, client_id: t.Optional[t.Text] = None) -> t.Tuple[int, int]:
+        """ 批量撤销令牌并删除未兑换的授权码
+
+        每类数据只执行一条批量语句,两条语句在同一个事务中提交
+
+        @param user_id: 用户id
+        @param client_id: 客户端id
+        @return: t.Tuple[int, int] 撤销的令牌数和删除的授权码数
+        """
+        token_where, code_where = [], []
+        if user_id is not None:
+            token_where.append(self.token_model.user_id == user_id)
+            code_where.append(self.code_model.user_id == user_id)
+        if client_id is not None:
+            token_where.append(self.token_model.client_id == client_id)
+            code_where.append(self.code_model.client_id == client_id)
+        token_stmt = sa.update(self.token_model).where(
+            self.token_model.revoked == sa.false(), *token_where
+        ).values(revoked=True).execution_options(synchronize_session=False)
+        code_stmt = sa.delete(self.code_model).where(
+            *code_where
+        ).execution_options(synchronize_session=False)
+        with self.server.breaker.guard(), safe_transaction(self.orm, commit=True) as session:
+            tokens = session.execute(token_stmt).rowcount
+            codes = session.execute(code_stmt).rowcount
+        return tokens, codes
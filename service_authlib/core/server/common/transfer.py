@@ -0,0 +1,190 @@
+#! -*- coding: utf-8 -*-
+#
+# author: forcemain@163.com
+
+from __future__ import annotations
+
+import json
+import typing as t
+import sqlalchemy as sa
+
+from datetime import datetime
+from logging import getLogger
+
+from .models import OAuth2TokenModel
+from .models import OAuth2ClientModel
+from .models import OAuth2AuthorizationCodeModel
+
+logger = getLogger(__name__)
+
+# 可导入导出的数据表
+TRANSFER_TABLES = {
+    'client': OAuth2ClientModel.__table__,
+    'token': OAuth2TokenModel.__table__,
+    'code': OAuth2AuthorizationCodeModel.__table__,
+}
+
+# 进度回调: (数据表名, 累计行数)
+ProgressCallback = t.Callable[[t.Text, int], None]
+
+
+def get_table(name: t.Text) -> sa.Table:
+    """ 根据名称获取数据表
+
+    @param name: client/token/code或数据表名
+    @return: sa.Table
+    """
+    if name in TRANSFER_TABLES:
+        return TRANSFER_TABLES[name]
+    for table in TRANSFER_TABLES.values():
+        if table.name == name:
+            return table
+    raise ValueError(f'unsupported transfer table {name}, must be one of {list(TRANSFER_TABLES)}')
+
+
+def encode_value(value: t.Any) -> t.Any:
+    """ 转换为可JSON序列化的值
+
+    @param value: 列值
+    @return: t.Any
+    """
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_rows(
+        bind: t.Union[sa.engine.Engine, sa.engine.Connection],
+        name: t.Text,
+        batch_size: int = 1000,
+        where: t.Optional[t.List[sa.sql.ClauseElement]] = None
+) -> t.Iterator[t.Tuple[t.Any, ...]]:
+    """ 使用服务端游标逐行读取数据表
+
+    结果按batch_size分批从数据库拉取,内存占用与表大小无关
+
+    @param bind: 数据库引擎或连接
+    @param name: 数据表名
+    @param batch_size: 每批拉取的行数
+    @param where: 过滤条件
+    @return: t.Iterator[t.Tuple[t.Any, ...]]
+    """
+    table = get_table(name)
+    stmt = sa.select(*table.columns).where(*(where or [])).order_by(table.c.id)
+    engine = bind.engine if isinstance(bind, sa.engine.Connection) else bind
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(stmt)
+        for row in result.yield_per(batch_size):
+            yield tuple(row)
+
+
+def export_lines(
+        bind: t.Union[sa.engine.Engine, sa.engine.Connection],
+        name: t.Text,
+        fp: t.TextIO,
+        batch_size: int = 1000,
+        where: t.Optional[t.List[sa.sql.ClauseElement]] = None,
+        progress: t.Optional[ProgressCallback] = None
+) -> int:
+    """ 流式导出数据表
+
+    首行为{"table": 表名, "columns": 列名列表},之后每行一个与列名顺序对应的JSON数组,不重复写入键名
+
+    @param bind: 数据库引擎或连接
+    @param name: 数据表名
+    @param fp: 文本输出流
+    @param batch_size: 每批拉取的行数
+    @param where: 过滤条件
+    @param progress: 进度回调,每导出batch_size行调用一次
+    @return: int 导出的行数
+    """
+    table = get_table(name)
+    header = {'table': table.name, 'columns': [c.name for c in table.columns]}
+    fp.write(json.dumps(header, separators=(',', ':')) + '\n')
+    count = 0
+    for row in stream_rows(bind, name, batch_size=batch_size, where=where):
+        fp.write(json.dumps([encode_value(v) for v in row], separators=(',', ':')) + '\n')
+        count += 1
+        if progress is not None and count % batch_size == 0:
+            progress(table.name, count)
+    if progress is not None:
+        progress(table.name, count)
+    logger.info(f'export {count} rows from {table.name}')
+    return count
+
+
+def sync_sequence(engine: sa.engine.Engine, table: sa.Table) -> None:
+    """ 按主键最大值推进PostgreSQL序列,显式写入id后序列不会自动推进
+
+    其它数据库(MySQL,SQLite)显式写入id时会自动推进自增值,无需处理
+
+    @param engine: 数据库引擎
+    @param table: 数据表
+    @return: None
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+    stmt = sa.text(
+        f'SELECT setval(pg_get_serial_sequence(:table, :column), max_id) '
+        f'FROM (SELECT max(id) AS max_id FROM {engine.dialect.identifier_preparer.format_table(table)}) t '
+        f'WHERE max_id IS NOT NULL'
+    )
+    with engine.begin() as connection:
+        connection.execute(stmt, {'table': table.fullname, 'column': 'id'})
+
+
+def import_lines(
+        bind: t.Union[sa.engine.Engine, sa.engine.Connection],
+        fp: t.TextIO,
+        batch_size: int = 1000,
+        progress: t.Optional[ProgressCallback] = None,
+        keep_ids: bool = False
+) -> int:
+    """ 批量导入export_lines导出的数据
+
+    每批在独立事务中执行一条批量插入,中途失败时已提交的批次保留,可根据进度回调从断点重新导入
+
+    1. 默认丢弃导出的id由目标库重新分配,导入的数据表之间不通过id关联
+    2. keep_ids为真时保留原id,导入完成后在PostgreSQL上按最大id推进序列
+
+    @param bind: 数据库引擎或连接
+    @param fp: 文本输入流
+    @param batch_size: 每批插入的行数
+    @param progress: 进度回调,每提交一批调用一次
+    @param keep_ids: 是否保留原id
+    @return: int 导入的行数
+    """
+    header = json.loads(fp.readline() or '{}')
+    table = get_table(header.get('table', ''))
+    columns = [table.c[name] for name in header['columns'] if name in table.c]
+    if len(columns) != len(header['columns']):
+        unknown = set(header['columns']) - {c.name for c in columns}
+        raise ValueError(f'unknown columns {sorted(unknown)} in {table.name}')
+    datetimes = {c.name for c in columns if isinstance(c.type, sa.DateTime)}
+    engine = bind.engine if isinstance(bind, sa.engine.Connection) else bind
+    count, batch = 0, []
+
+    def flush() -> None:
+        with engine.begin() as connection:
+            connection.execute(table.insert(), batch)
+        if progress is not None:
+            progress(table.name, count)
+
+    for line in fp:
+        if not line.strip():
+            continue
+        values = dict(zip(header['columns'], json.loads(line)))
+        if not keep_ids:
+            values.pop('id', None)
+        for name in datetimes:
+            if values[name] is not None:
+                values[name] = datetime.fromisoformat(values[name])
+        batch.append(values)
+        count += 1
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch:
+        flush()
+    if keep_ids and count:
+        sync_sequence(engine, table)
+    logger.info(f'import {count} rows into {table.name}')
+    return count
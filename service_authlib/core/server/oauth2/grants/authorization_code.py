@@ -9,6 +9,7 @@ import typing as t
 from logging import getLogger
 from authlib.oauth2 import OAuth2Request
 from service_sqlalchemy.core.shortcuts import safe_transaction
+from service_authlib.core.server.common.models.base import make_digest
 from service_authlib.core.server.common.models.user import OAuth2UserModel
 from service_authlib.core.server.common.models.client import OAuth2ClientModel
 from authlib.oauth2.rfc6749.grants import AuthorizationCodeGrant as BaseAuthorizationCodeGrant
@@ -58,6 +59,17 @@ class AuthorizationCodeGrant(BaseAuthorizationCodeGrant):
     # 2. 支持通过Post  x-www-form-urlencoded编码方式传递client_id和client_secret获取token
     TOKEN_ENDPOINT_AUTH_METHODS = ['client_secret_basic', 'client_secret_post']
 
+    def generate_authorization_code(self) -> t.Text:
+        """ 生成授权码
+
+        开启无状态授权码时授权码本身即为加密后的授权数据
+
+        @return: t.Text
+        """
+        if self.server.code_codec is None:
+            return super(AuthorizationCodeGrant, self).generate_authorization_code()
+        return self.server.code_codec.encode(self.request)
+
     def save_authorization_code(self, code: t.Text, request: OAuth2Request) -> OAuth2AuthorizationCodeModel:
         """ 创建授权码模型对象
 
@@ -65,7 +77,9 @@ class AuthorizationCodeGrant(BaseAuthorizationCodeGrant):
         @param request: oauth2请求对象
         @return: OAuth2AuthorizationCodeModel
         """
-        with safe_transaction(self.server.service.ORM, commit=True) as session:
+        if self.server.code_codec is not None:
+            return self.server.code_codec.decode(code)
+        with self.server.breaker.guard(), safe_transaction(self.server.service.ORM, commit=True) as session:
             client = request.client
             code_challenge = request.data.get('code_challenge')
             code_challenge_method = request.data.get('code_challenge_method')
@@ -90,14 +104,10 @@ class AuthorizationCodeGrant(BaseAuthorizationCodeGrant):
         @return: t.Union[OAuth2AuthorizationCodeModel, None]
         """
         client_id = client.client_id
-        with safe_transaction(self.server.service.ORM, commit=False) as session:
-            logger.debug(f'query oauth2 code with client_id={client_id}, code={code}')
-            instance = session.query(
-                OAuth2AuthorizationCodeModel
-            ).filter(
-                OAuth2AuthorizationCodeModel.code == code,
-                OAuth2AuthorizationCodeModel.client_id == client_id
-            ).first()
+        logger.debug(f'query oauth2 code with client_id={client_id}, code={code}')
+        if self.server.code_codec is not None:
+            return self.server.code_codec.claim(code, client_id)
+        instance = self.server.repository.get_authorization_code(code, client_id)
         if not instance:
             logger.warning(f'wrong client_id or code')
             return
@@ -112,9 +122,15 @@ class AuthorizationCodeGrant(BaseAuthorizationCodeGrant):
         @param authorization_code: 授权码模型对象
         @return: None
         """
-        with safe_transaction(self.server.service.ORM, commit=True) as session:
-            logger.debug(f'delete oauth2 code {authorization_code.code}')
-            session.delete(authorization_code)
+        self.server.emit_audit(
+            'code_redeemed', client_id=authorization_code.client_id, user_id=authorization_code.user_id,
+            grant_type=self.GRANT_TYPE, scope=authorization_code.scope, subject=make_digest(authorization_code.code)
+        )
+        # 无状态授权码兑换时已被标记为已使用
+        if self.server.code_codec is not None:
+            return
+        logger.debug(f'delete oauth2 code {authorization_code.code}')
+        self.server.repository.delete_authorization_code(authorization_code.id)
 
     def authenticate_user(self, authorization_code: OAuth2AuthorizationCodeModel) -> t.Union[OAuth2UserModel, None]:
         """ 授权码模型对象用户
@@ -122,11 +138,5 @@ class AuthorizationCodeGrant(BaseAuthorizationCodeGrant):
         @param authorization_code: 授权码模型对象
         @return: t.Union[OAuth2UserModel, None]
         """
-        with safe_transaction(self.server.service.ORM, commit=False) as session:
-            logger.debug(f'query oauth2 code user with id={authorization_code.user_id}')
-            user = session.query(
-                OAuth2UserModel
-            ).filter(
-                OAuth2UserModel.id == authorization_code.user_id
-            ).first()
-        return user
+        logger.debug(f'query oauth2 code user with id={authorization_code.user_id}')
+        return self.server.repository.get_user(authorization_code.user_id)
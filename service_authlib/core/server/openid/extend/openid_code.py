@@ -9,11 +9,9 @@ import typing as t
 from authlib.oidc.core import UserInfo
 from authlib.oauth2 import OAuth2Request
 from authlib.oauth2.rfc6749.grants import BaseGrant
-from service_sqlalchemy.core.shortcuts import safe_transaction
 from service_authlib.constants import DEFAULT_OPENID_JWT_CONFIG
 from authlib.oidc.core.grants import OpenIDCode as BaseOpenIDCode
 from service_authlib.core.server.common.models.user import OAuth2UserModel
-from service_authlib.core.server.common.models.authorization_code import OAuth2AuthorizationCodeModel
 
 
 class OpenIDCode(BaseOpenIDCode):
@@ -39,6 +37,16 @@ class OpenIDCode(BaseOpenIDCode):
         self.grant = grant
         super(OpenIDCode, self).__call__(grant)
 
+    def process_token(self, grant: BaseGrant, token: t.Dict[t.Text, t.Any]) -> t.Dict[t.Text, t.Any]:
+        """ 签发id_token
+
+        @param grant: 授权对象
+        @param token: 令牌字典
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with grant.server.tracer.span('id_token'):
+            return super(OpenIDCode, self).process_token(grant, token)
+
     def exists_nonce(self, nonce: t.Text, request: OAuth2Request) -> bool:
         """ 检查nonce是否存在
 
@@ -46,13 +54,7 @@ class OpenIDCode(BaseOpenIDCode):
         @param request: 请求对象
         @return: bool
         """
-        with safe_transaction(self.grant.server.service.ORM, commit=False) as session:
-            instance = session.query(
-                OAuth2AuthorizationCodeModel
-            ).filter(
-                OAuth2AuthorizationCodeModel.nonce == nonce
-            ).first()
-        return bool(instance)
+        return self.grant.server.exists_nonce(nonce)
 
     def get_jwt_config(self, grant: BaseGrant) -> t.Dict[t.Text, t.Any]:
         """ 获取默认的jwt配置
@@ -30,6 +30,17 @@ class HybridGrant(OpenIDHybridGrant):
     # 1. 支持只传递client_id获取token
     TOKEN_ENDPOINT_AUTH_METHODS = ['none']
 
+    def generate_authorization_code(self) -> t.Text:
+        """ 生成授权码
+
+        开启无状态授权码时授权码本身即为加密后的授权数据
+
+        @return: t.Text
+        """
+        if self.server.code_codec is None:
+            return super(HybridGrant, self).generate_authorization_code()
+        return self.server.code_codec.encode(self.request)
+
     def save_authorization_code(self, code: t.Text, request: OAuth2Request) -> OAuth2AuthorizationCodeModel:
         """ 创建授权码模型对象
 
@@ -37,7 +48,9 @@ class HybridGrant(OpenIDHybridGrant):
         @param request: oauth2请求对象
         @return: OAuth2AuthorizationCodeModel
         """
-        with safe_transaction(self.server.service.ORM, commit=True) as session:
+        if self.server.code_codec is not None:
+            return self.server.code_codec.decode(code)
+        with self.server.breaker.guard(), safe_transaction(self.server.service.ORM, commit=True) as session:
             client = request.client
             nonce = request.data.get('nonce')
             data = {
@@ -50,6 +63,20 @@ class HybridGrant(OpenIDHybridGrant):
             session.add(instance)
         return instance
 
+    def process_implicit_token(
+            self,
+            token: t.Dict[t.Text, t.Any],
+            code: t.Optional[t.Text] = None
+    ) -> t.Dict[t.Text, t.Any]:
+        """ 签发id_token
+
+        @param token: 令牌字典
+        @param code: 授权码
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self.server.tracer.span('id_token'):
+            return super(HybridGrant, self).process_implicit_token(token, code)
+
     def exists_nonce(self, nonce: t.Text, request: OAuth2Request) -> bool:
         """ 检查nonce是否存在
 
@@ -57,13 +84,7 @@ class HybridGrant(OpenIDHybridGrant):
         @param request: 请求对象
         @return: bool
         """
-        with safe_transaction(self.server.service.ORM, commit=False) as session:
-            instance = session.query(
-                OAuth2AuthorizationCodeModel
-            ).filter(
-                OAuth2AuthorizationCodeModel.nonce == nonce
-            ).first()
-        return bool(instance)
+        return self.server.exists_nonce(nonce)
 
     def get_jwt_config(self) -> t.Dict[t.Text, t.Any]:
         """ 获取默认的jwt配置
@@ -9,10 +9,8 @@ import typing as t
 from authlib.oidc.core import UserInfo
 from authlib.oauth2 import OAuth2Request
 from authlib.oidc.core.grants import OpenIDImplicitGrant
-from service_sqlalchemy.core.shortcuts import safe_transaction
 from service_authlib.constants import DEFAULT_OPENID_JWT_CONFIG
 from service_authlib.core.server.common.models.user import OAuth2UserModel
-from service_authlib.core.server.common.models.authorization_code import OAuth2AuthorizationCodeModel
 
 
 class ImplicitGrant(OpenIDImplicitGrant):
@@ -38,6 +36,20 @@ class ImplicitGrant(OpenIDImplicitGrant):
     # 1. 支持只传递client_id获取token
     TOKEN_ENDPOINT_AUTH_METHODS = ['none']
 
+    def process_implicit_token(
+            self,
+            token: t.Dict[t.Text, t.Any],
+            code: t.Optional[t.Text] = None
+    ) -> t.Dict[t.Text, t.Any]:
+        """ 签发id_token
+
+        @param token: 令牌字典
+        @param code: 授权码
+        @return: t.Dict[t.Text, t.Any]
+        """
+        with self.server.tracer.span('id_token'):
+            return super(ImplicitGrant, self).process_implicit_token(token, code)
+
     def exists_nonce(self, nonce: t.Text, request: OAuth2Request) -> bool:
         """ 检查nonce是否存在
 
@@ -45,13 +57,7 @@ class ImplicitGrant(OpenIDImplicitGrant):
         @param request: 请求对象
         @return: bool
         """
-        with safe_transaction(self.server.service.ORM, commit=False) as session:
-            instance = session.query(
-                OAuth2AuthorizationCodeModel
-            ).filter(
-                OAuth2AuthorizationCodeModel.nonce == nonce
-            ).first()
-        return bool(instance)
+        return self.server.exists_nonce(nonce)
 
     def get_jwt_config(self) -> t.Dict[t.Text, t.Any]:
         """ 获取默认的jwt配置